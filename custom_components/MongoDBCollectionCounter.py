@@ -1,9 +1,166 @@
+import hashlib
 import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import Any, Dict, Optional, Tuple
+
+import certifi
 from pymongo import MongoClient
 from langflow.custom import Component
 from langflow.io import SecretStrInput, StrInput, Output
 from langflow.schema import Data
 
+
+# --- Registro de MongoClient compartilhado pelos componentes Mongo (manter idêntico entre os arquivos) ---
+MONGO_MAX_POOL_SIZE = 50
+MONGO_MAX_IDLE_TIME_MS = 300_000
+MONGO_CLIENT_IDLE_TTL_SECONDS = 900
+MONGO_HEALTH_CHECK_INTERVAL_SECONDS = 30
+
+
+def _mongo_client_registry() -> Dict[str, Any]:
+    """Estado por processo que sobrevive às re-execuções do código do componente pelo Langflow."""
+    holder = sys.modules.setdefault("_langflow_shared_registries", types.ModuleType("_langflow_shared_registries"))
+    if not hasattr(holder, "mongo_clients"):
+        holder.mongo_clients = {
+            "lock": threading.Lock(),
+            "clients": {},
+            "metrics": {"hits": 0, "misses": 0, "evictions": 0, "health_check_failures": 0},
+        }
+    return holder.mongo_clients
+
+
+def _close_registry_entry(entry: Dict[str, Any]) -> None:
+    try:
+        entry["client"].close()
+    finally:
+        if entry.get("cert_path"):
+            try:
+                os.remove(entry["cert_path"])
+            except OSError:
+                pass
+
+
+def _evict_idle_clients(registry: Dict[str, Any], now: float, keep_key: str) -> None:
+    """Fecha clientes (PyMongo e Motor) ociosos além do TTL e os aposentados pelo health check. Chamar com o lock."""
+    for clients in (registry["clients"], registry.setdefault("motor_clients", {})):
+        for other_key, other in list(clients.items()):
+            if other_key != keep_key and now - other["last_used"] > MONGO_CLIENT_IDLE_TTL_SECONDS:
+                _close_registry_entry(clients.pop(other_key))
+                registry["metrics"]["evictions"] += 1
+    retired = registry.setdefault("retired", [])
+    for old in [r for r in retired if now - r["retired_at"] > MONGO_CLIENT_IDLE_TTL_SECONDS]:
+        retired.remove(old)
+        _close_registry_entry(old)
+
+
+def _mongo_client_options(tls: bool, client_cert: Optional[str]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Opções do pool e de TLS; o certificado mTLS vai para um arquivo temporário removido ao fechar o cliente."""
+    options: Dict[str, Any] = {"maxPoolSize": MONGO_MAX_POOL_SIZE, "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS}
+    cert_path = None
+    if tls:
+        options.update(tls=True, tlsCAFile=certifi.where())
+        if client_cert:
+            with tempfile.NamedTemporaryFile(delete=False) as tmp:
+                tmp.write(client_cert.encode("utf-8"))
+                cert_path = tmp.name
+            options["tlsCertificateKeyFile"] = cert_path
+    return options, cert_path
+
+
+def _mongo_client_key(uri: str, tls: bool, client_cert: Optional[str]) -> str:
+    cert_hash = hashlib.sha256(client_cert.encode("utf-8")).hexdigest() if client_cert else ""
+    return f"{uri}|tls={tls}|{cert_hash}"
+
+
+def get_mongo_client(uri: str, tls: bool = False, client_cert: Optional[str] = None) -> MongoClient:
+    """
+    Devolve um MongoClient compartilhado por URI e opções de TLS/mTLS.
+
+    Clientes ociosos há mais de MONGO_CLIENT_IDLE_TTL_SECONDS são fechados, e um ping
+    periódico substitui clientes que deixaram de responder. O cliente substituído sai do
+    registro na hora, mas só é fechado após o TTL, pois outras threads podem estar usando-o.
+    """
+    registry = _mongo_client_registry()
+    key = _mongo_client_key(uri, tls, client_cert)
+    now = time.monotonic()
+
+    with registry["lock"]:
+        _evict_idle_clients(registry, now, key)
+        entry = registry["clients"].get(key)
+        if entry is not None:
+            entry["last_used"] = now
+
+    # O ping fica fora do lock para não bloquear os demais componentes
+    if entry is not None and now - entry["last_health_check"] > MONGO_HEALTH_CHECK_INTERVAL_SECONDS:
+        try:
+            entry["client"].admin.command("ping")
+            entry["last_health_check"] = now
+        except Exception:
+            with registry["lock"]:
+                registry["metrics"]["health_check_failures"] += 1
+                if registry["clients"].get(key) is entry:
+                    # Novas chamadas recebem outro cliente; este é fechado depois, na limpeza por TTL
+                    entry["retired_at"] = now
+                    registry.setdefault("retired", []).append(registry["clients"].pop(key))
+
+    with registry["lock"]:
+        entry = registry["clients"].get(key)
+        if entry is not None:
+            registry["metrics"]["hits"] += 1
+            return entry["client"]
+
+        registry["metrics"]["misses"] += 1
+        options, cert_path = _mongo_client_options(tls, client_cert)
+        registry["clients"][key] = {
+            "client": MongoClient(uri, **options),
+            "cert_path": cert_path,
+            "last_used": now,
+            "last_health_check": now,
+        }
+        return registry["clients"][key]["client"]
+
+
+def mongo_client_metrics() -> Dict[str, Any]:
+    """Métricas do registro de clientes: hits, misses, evicções, falhas de health check e clientes abertos."""
+    registry = _mongo_client_registry()
+    with registry["lock"]:
+        return {
+            **registry["metrics"],
+            "open_clients": len(registry["clients"]),
+            "open_motor_clients": len(registry.get("motor_clients", {})),
+            "retired_clients": len(registry.get("retired", [])),
+        }
+
+
+# Coleções lógicas podem apontar para uma coleção física diferente (troca blue/green do overwrite)
+COLLECTION_ALIASES = "_collection_aliases"
+COLLECTION_ALIAS_TTL_SECONDS = 5
+
+
+def resolve_collection_name(
+    uri: str, db_name: str, name: str, tls: bool = False, client_cert: Optional[str] = None
+) -> str:
+    """Coleção física por trás de 'name'; sem alias cadastrado em _collection_aliases, é o próprio nome."""
+    aliases = _mongo_client_registry().setdefault("aliases", {})
+    key = f"{_mongo_client_key(uri, tls, client_cert)}|{db_name}|{name}"
+    cached = aliases.get(key)
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < COLLECTION_ALIAS_TTL_SECONDS:
+        return cached[1]
+    doc = get_mongo_client(uri, tls, client_cert)[db_name][COLLECTION_ALIASES].find_one({"_id": name}, {"target": 1})
+    target = (doc or {}).get("target") or name
+    aliases[key] = (now, target)
+    return target
+
+
+# --- fim do registro de MongoClient ---
+
+
 class MongoDBCollectionCounter(Component):
     display_name = "Contador de Documentos MongoDB"
     description = "Conta o número total de documentos em uma coleção MongoDB e mostra uma amostra."
@@ -37,9 +194,9 @@ class MongoDBCollectionCounter(Component):
     def count_documents(self) -> Data:
         try:
             # Conecta ao MongoDB
-            client = MongoClient(self.mongodb_uri)
+            client = get_mongo_client(self.mongodb_uri)
             db = client[self.db_name]
-            collection = db[self.collection_name]
+            collection = db[resolve_collection_name(self.mongodb_uri, self.db_name, self.collection_name)]
             
             # Conta total de documentos
             total_count = collection.count_documents({})
@@ -62,6 +219,7 @@ class MongoDBCollectionCounter(Component):
                 "total_documentos": total_count,
                 "contagem_por_classificacao": classificacao_counts,
                 "amostra_documentos": sample_docs,
+                "metricas_pool_conexoes": mongo_client_metrics(),
                 "mensagem": f"Total de {total_count} documentos encontrados na coleção {self.collection_name}"
             }
             
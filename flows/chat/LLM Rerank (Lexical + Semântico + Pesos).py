@@ -1,14 +1,364 @@
-from typing import List, Dict, Any
+import hashlib
+import logging
+import math
+import re
+import sqlite3
+import sys
+import threading
+import time
+import types
+import unicodedata
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
 from langflow.custom import Component
 from langflow.inputs import (
+    BoolInput,
+    DropdownInput,
     HandleInput,
     IntInput,
     FloatInput,
     MultilineInput,
+    StrInput,
 )
 from langflow.schema import Data
 from langflow.template import Output
 
+logger = logging.getLogger(__name__)
+
+
+def _shared_registry(name: str) -> Dict[str, Any]:
+    """Registro por processo que sobrevive às re-execuções do código do componente pelo Langflow."""
+    holder = sys.modules.setdefault("_langflow_shared_registries", types.ModuleType("_langflow_shared_registries"))
+    if not hasattr(holder, name):
+        setattr(holder, name, {})
+    return getattr(holder, name)
+
+
+# Instruções enviadas ao LLM em todo lote; entram na chave do cache de scores
+RERANK_PROMPT_INSTRUCTIONS = (
+    "Avalie de 0 a 10 o quanto cada texto abaixo responde à pergunta. "
+    'Responda apenas com um objeto JSON no formato {"c1": nota, "c2": nota, ...}, '
+    "usando o id entre colchetes de cada texto.\n"
+)
+
+
+class RerankScoreCache:
+    """Cache de scores do rerank: LRU em memória com TTL e camada opcional em SQLite."""
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: int = 3600, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._memory: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS rerank_scores (key TEXT PRIMARY KEY, score REAL, created_at REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, question: str, chunk_id: str, text: str, prompt_config: str = "") -> str:
+        """prompt_config descreve o que altera o texto enviado ao LLM (instruções, janelas de trecho, orçamentos)."""
+        question_norm = " ".join(str(question).lower().split())
+        question_hash = hashlib.sha256(question_norm.encode("utf-8")).hexdigest()
+        text_hash = hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+        prompt_hash = hashlib.sha256(prompt_config.encode("utf-8")).hexdigest()[:16]
+        return f"{model}|{prompt_hash}|{question_hash}|{chunk_id}|{text_hash}"
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and (time.time() - created_at) > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[float]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                score, created_at = entry
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    return score
+                del self._memory[key]
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT score, created_at FROM rerank_scores WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1]):
+                return None
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def set_many(self, entries: Dict[str, float]) -> None:
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            for key, score in entries.items():
+                self._remember(key, score, now)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO rerank_scores (key, score, created_at) VALUES (?, ?, ?)",
+                    [(key, score, now) for key, score in entries.items()],
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, score: float, created_at: float) -> None:
+        self._memory[key] = (score, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+_STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "por", "para", "com", "que", "qual", "quais", "se", "ao", "aos", "ou", "como", "foi", "sao", "ser", "sobre",
+}
+
+
+def tokenize_for_bm25(text: str) -> List[str]:
+    """Normaliza (minúsculas, sem acentos) e separa o texto em termos, descartando stopwords."""
+    normalized = unicodedata.normalize("NFKD", str(text or "").lower())
+    normalized = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return [tok for tok in re.findall(r"\w+", normalized) if len(tok) > 1 and tok not in _STOPWORDS]
+
+
+def bm25_scores(query_tokens: List[str], docs_tokens: List[List[str]], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """Calcula o BM25 de cada documento (já tokenizado) em relação aos termos da consulta."""
+    n_docs = len(docs_tokens)
+    if not n_docs or not query_tokens:
+        return [0.0] * n_docs
+    avg_len = (sum(len(doc) for doc in docs_tokens) / n_docs) or 1.0
+    terms = set(query_tokens)
+    doc_freq = {term: sum(1 for doc in docs_tokens if term in doc) for term in terms}
+    idf = {term: math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    scores = []
+    for doc in docs_tokens:
+        tf: Dict[str, int] = {}
+        for tok in doc:
+            if tok in terms:
+                tf[tok] = tf.get(tok, 0) + 1
+        norm = k1 * (1 - b + b * len(doc) / avg_len)
+        scores.append(sum(idf[t] * f * (k1 + 1) / (f + norm) for t, f in tf.items()))
+    return scores
+
+
+@lru_cache(maxsize=4)
+def _get_token_encoder(encoding_name: str = "cl100k_base"):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Conta tokens com tiktoken (encoder em cache); sem tiktoken, estima ~4 caracteres por token."""
+    if not text:
+        return 0
+    encoder = _get_token_encoder()
+    if encoder is None:
+        return max(1, len(text) // 4)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def _densest_windows(hits: np.ndarray, window: int, max_windows: int) -> List[Tuple[int, int]]:
+    """Escolhe até max_windows janelas sem sobreposição com mais termos da pergunta, centradas nos termos."""
+    window = min(window, len(hits))
+    csum = np.concatenate([[0], np.cumsum(hits)])
+    density = (csum[window:] - csum[:-window]).astype(float)
+    selected = []
+    for _ in range(max(1, max_windows)):
+        best = density.max()
+        if best <= 0:
+            break
+        # Entre as janelas empatadas e contíguas, usa a do meio para centralizar os termos
+        first = int(np.argmax(density))
+        last = first
+        while last + 1 < len(density) and density[last + 1] == best:
+            last += 1
+        start = (first + last) // 2
+        selected.append((start, start + window))
+        density[max(0, start - window + 1):start + window] = -1
+    return sorted(selected)
+
+
+def extract_snippet(text: str, query_terms: set, max_tokens: int, max_windows: int = 2) -> str:
+    """Recorta a(s) janela(s) do texto com maior densidade de termos da pergunta, dentro de max_tokens."""
+    if max_tokens <= 0 or not text:
+        return text
+    total_tokens = count_tokens(text)
+    if total_tokens <= max_tokens:
+        return text
+    words = text.split()
+    if not words:
+        return text
+    hits = np.array([1 if query_terms.intersection(tokenize_for_bm25(w)) else 0 for w in words])
+    budget_words = max(1, int(max_tokens * len(words) / total_tokens))
+
+    while True:
+        if hits.any():
+            # Orçamentos muito pequenos usam uma única janela para não gastar tokens com separadores
+            n_windows = max(1, max_windows) if budget_words >= 8 * max(1, max_windows) else 1
+            selected = _densest_windows(hits, max(1, budget_words // n_windows), n_windows)
+        else:
+            selected = [(0, budget_words)]
+        snippet = " ... ".join(" ".join(words[start:end]) for start, end in selected)
+        # A estimativa de tokens por palavra pode falhar; reduz as janelas até caber no orçamento
+        if budget_words <= 1 or count_tokens(snippet) <= max_tokens:
+            return snippet
+        budget_words = int(budget_words * 0.9)
+
+
+_MINHASH_PRIME = (1 << 61) - 1
+
+
+def minhash_signatures(texts: List[str], num_perm: int = 64, shingle_size: int = 3, seed: int = 42) -> np.ndarray:
+    """Assinaturas MinHash (n_textos x num_perm) sobre shingles de palavras; textos vazios ficam sem assinatura útil."""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2**31 - 1, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, 2**31 - 1, size=num_perm).astype(np.uint64)
+    signatures = np.full((len(texts), num_perm), _MINHASH_PRIME, dtype=np.uint64)
+    for row, text in enumerate(texts):
+        tokens = tokenize_for_bm25(text)
+        if not tokens:
+            continue
+        shingles = {" ".join(tokens[i:i + shingle_size]) for i in range(max(1, len(tokens) - shingle_size + 1))}
+        hashes = np.array([zlib.crc32(sh.encode("utf-8")) for sh in shingles], dtype=np.uint64)
+        signatures[row] = ((np.outer(hashes, a) + b) % _MINHASH_PRIME).min(axis=0)
+    return signatures
+
+
+def near_duplicate_groups(texts: List[str], threshold: float = 0.8, num_perm: int = 64, bands: int = 16) -> List[int]:
+    """Agrupa textos quase duplicados (Jaccard estimado >= threshold) e devolve, para cada um, o menor índice do seu grupo."""
+    signatures = minhash_signatures(texts, num_perm=num_perm)
+    rows = num_perm // bands
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    valid = [i for i, text in enumerate(texts) if tokenize_for_bm25(text)]
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = {}
+        for i in valid:
+            buckets.setdefault(signatures[i, band * rows:(band + 1) * rows].tobytes(), []).append(i)
+        for members in buckets.values():
+            for j in members[1:]:
+                root_i, root_j = find(members[0]), find(j)
+                if root_i == root_j:
+                    continue
+                if np.mean(signatures[members[0]] == signatures[j]) >= threshold:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+    return [find(i) for i in range(len(texts))]
+
+
+def normalize_scores(values: np.ndarray, present: np.ndarray, method: str = "minmax") -> np.ndarray:
+    """Normaliza para [0, 1] apenas as posições presentes; as ausentes ficam em 0."""
+    normalized = np.zeros(values.shape, dtype=float)
+    if not present.any():
+        return normalized
+    v = values[present]
+    if method == "zscore":
+        std = v.std()
+        z = (v - v.mean()) / std if std > 0 else np.zeros_like(v)
+        normalized[present] = 1.0 / (1.0 + np.exp(-z))
+    else:
+        span = v.max() - v.min()
+        normalized[present] = (v - v.min()) / span if span > 0 else 1.0
+    return normalized
+
+
+def rank_positions(values: np.ndarray, present: np.ndarray) -> np.ndarray:
+    """Posição (1 = melhor) de cada item presente na sua lista de origem; ausentes recebem 0."""
+    ranks = np.zeros(values.shape, dtype=float)
+    idx = np.flatnonzero(present)
+    order = idx[np.argsort(-values[idx], kind="stable")]
+    ranks[order] = np.arange(1, len(order) + 1)
+    return ranks
+
+
+def fuse_scores(
+    lexical: np.ndarray,
+    semantic: np.ndarray,
+    lexical_present: np.ndarray,
+    semantic_present: np.ndarray,
+    peso_lexical: float,
+    peso_semantic: float,
+    mode: str = "weighted",
+    normalization: str = "minmax",
+    rrf_k: int = 60,
+) -> np.ndarray:
+    """Combina os scores lexical e semântico em um score de fusão no intervalo [0, 1]."""
+    total_weight = peso_lexical + peso_semantic
+    if total_weight <= 0:
+        return np.zeros(lexical.shape, dtype=float)
+    if mode == "rrf":
+        fused = np.zeros(lexical.shape, dtype=float)
+        for values, present, weight in (
+            (lexical, lexical_present, peso_lexical),
+            (semantic, semantic_present, peso_semantic),
+        ):
+            ranks = rank_positions(values, present)
+            fused[present] += weight / (rrf_k + ranks[present])
+        return fused / (total_weight / (rrf_k + 1))
+    lexical_norm = normalize_scores(lexical, lexical_present, normalization)
+    semantic_norm = normalize_scores(semantic, semantic_present, normalization)
+    return (peso_lexical * lexical_norm + peso_semantic * semantic_norm) / total_weight
+
+
+class IncrementalScoreParser:
+    """Extrai pares {id: score} de uma resposta do LLM à medida que ela chega em pedaços."""
+
+    # O número só é aceito seguido de um terminador (aspas opcionais e então vírgula, chave, espaço ou fim)
+    _PAIR = re.compile(r'"?\b(c\d+)\b"?\s*[:=]\s*"?([-+]?\d+(?:[.,]\d*)?)(?="?(?:[\s,;}\]]|$))')
+
+    def __init__(self, valid_ids: List[str]):
+        self.valid_ids = set(valid_ids)
+        self.scores: Dict[str, float] = {}
+        self.raw = ""
+        self._pos = 0
+
+    def feed(self, piece: str) -> Dict[str, float]:
+        self.raw += piece
+        return self._consume(final=False)
+
+    def close(self) -> Dict[str, float]:
+        return self._consume(final=True)
+
+    def _consume(self, final: bool) -> Dict[str, float]:
+        new_scores: Dict[str, float] = {}
+        for match in self._PAIR.finditer(self.raw, self._pos):
+            # Um número no fim do buffer (ex.: "7" ou "7.") ainda pode continuar no próximo pedaço
+            if not final and self.raw[match.end():] in ("", '"'):
+                break
+            self._pos = match.end()
+            label = match.group(1)
+            if label in self.valid_ids and label not in self.scores:
+                score = min(10.0, max(0.0, float(match.group(2).replace(',', '.'))))
+                self.scores[label] = score
+                new_scores[label] = score
+        return new_scores
+
+
+def get_rerank_score_cache(max_entries: int, ttl_seconds: int, db_path: Optional[str]) -> RerankScoreCache:
+    caches = _shared_registry("rerank_score_caches")
+    key = f"{max_entries}|{ttl_seconds}|{db_path or ''}"
+    if key not in caches:
+        caches[key] = RerankScoreCache(max_entries=max_entries, ttl_seconds=ttl_seconds, db_path=db_path)
+    return caches[key]
+
+
 class LLMRerankComponent(Component):
     display_name = "LLM Rerank (Lexical + Semântico + Pesos)"
     icon = "Sort"
@@ -56,9 +406,111 @@ class LLMRerankComponent(Component):
             name="score_final_min",
             display_name="Score Final Mínimo",
             value="2.0",
-            info="Apenas chunks com rerank_score_final maior ou igual a este valor (de 0 a 5) serão retornados.",
+            info="Apenas chunks com rerank_score_final maior ou igual a este valor (de 0 a 10: média ponderada "
+                 "da fusão lexical/semântica e da nota do LLM, ambas de 0 a 10) serão retornados.",
+            required=False,
+        ),
+        IntInput(
+            name="batch_size",
+            display_name="Chunks por Lote",
+            value=0,
+            info="Quantidade de chunks avaliados por chamada ao LLM. 0 envia todos os chunks em um único prompt.",
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="max_concurrency",
+            display_name="Lotes Simultâneos",
+            value=4,
+            info="Número máximo de lotes avaliados em paralelo pelo LLM.",
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="cache_ttl_seconds",
+            display_name="TTL do Cache de Scores (s)",
+            value=3600,
+            info="Tempo de validade dos scores em cache por (pergunta, chunk, modelo). 0 desativa o cache.",
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="cache_max_entries",
+            display_name="Tamanho do Cache de Scores",
+            value=5000,
+            info="Número máximo de scores mantidos no cache em memória.",
+            advanced=True,
+            required=False,
+        ),
+        StrInput(
+            name="cache_db_path",
+            display_name="Arquivo SQLite do Cache",
+            value="",
+            info="Caminho de um arquivo SQLite para persistir os scores entre execuções. Vazio mantém apenas o cache em memória.",
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="prerank_top_n",
+            display_name="Pré-rank Local (Top N)",
+            value=0,
+            info="Aplica BM25 local sobre text/resumo e envia ao LLM apenas os N melhores chunks. 0 desativa o pré-rank.",
+            advanced=True,
             required=False,
         ),
+        DropdownInput(
+            name="fusion_mode",
+            display_name="Modo de Fusão",
+            options=["weighted", "rrf"],
+            value="weighted",
+            info="weighted: soma ponderada dos scores normalizados. rrf: Reciprocal Rank Fusion ponderada pelos pesos.",
+            advanced=True,
+        ),
+        DropdownInput(
+            name="score_normalization",
+            display_name="Normalização dos Scores",
+            options=["minmax", "zscore"],
+            value="minmax",
+            info="Normalização aplicada aos scores lexical e semântico no modo weighted.",
+            advanced=True,
+        ),
+        BoolInput(
+            name="fusion_only",
+            display_name="Somente Fusão (sem LLM)",
+            value=False,
+            info="Ordena apenas pelo score de fusão, sem chamar o LLM. Útil para requisições de baixa latência.",
+            advanced=True,
+        ),
+        IntInput(
+            name="snippet_max_tokens",
+            display_name="Tokens por Chunk no Prompt",
+            value=0,
+            info="Envia ao LLM apenas o trecho de cada chunk mais denso em termos da pergunta, limitado a este número de tokens. 0 envia o texto completo.",
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="prompt_max_tokens",
+            display_name="Tokens Totais de Chunks por Prompt",
+            value=0,
+            info="Orçamento total de tokens dos chunks em cada prompt, dividido igualmente entre eles. 0 não limita.",
+            advanced=True,
+            required=False,
+        ),
+        BoolInput(
+            name="collapse_near_duplicates",
+            display_name="Agrupar Quase-Duplicados",
+            value=False,
+            info="Detecta chunks quase idênticos (MinHash), avalia apenas um representante por grupo e replica o score aos demais.",
+            advanced=True,
+        ),
+        FloatInput(
+            name="near_duplicate_threshold",
+            display_name="Similaridade de Quase-Duplicados",
+            value=0.8,
+            info="Similaridade de Jaccard estimada (0-1) a partir da qual dois chunks são considerados quase duplicados.",
+            advanced=True,
+        ),
     ]
 
     outputs = [
@@ -100,6 +552,20 @@ class LLMRerankComponent(Component):
             return {"data": chunk}
         return dict(chunk) if not isinstance(chunk, dict) else chunk
 
+    def _response_text(self, response) -> str:
+        if hasattr(response, 'content'):
+            return str(response.content)
+        return str(response)
+
+    def _stream_llm(self, llm, prompt):
+        """Produz a resposta do LLM em pedaços, usando stream() quando o modelo oferece."""
+        stream = getattr(llm, 'stream', None)
+        if callable(stream):
+            for piece in stream(prompt):
+                yield self._response_text(piece)
+        else:
+            yield self._response_text(self._call_llm(llm, prompt))
+
     def _call_llm(self, llm, prompt):
         try:
             return llm(prompt)
@@ -138,8 +604,206 @@ class LLMRerankComponent(Component):
         except Exception:
             return 2.0
 
+    def _split_batches(self, items: List[Any], batch_size: int) -> List[List[Any]]:
+        if batch_size <= 0 or batch_size >= len(items):
+            return [items]
+        return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+    def _chunk_token_budget(self, batch_len: int) -> int:
+        per_chunk = int(getattr(self, 'snippet_max_tokens', 0) or 0)
+        total = int(getattr(self, 'prompt_max_tokens', 0) or 0)
+        if total > 0 and batch_len:
+            share = max(1, total // batch_len)
+            per_chunk = min(per_chunk, share) if per_chunk > 0 else share
+        return per_chunk
+
+    def _build_prompt(self, question: str, batch: List[Tuple[str, Dict[str, Any]]]) -> str:
+        prompt = f"Pergunta: {question}\n{RERANK_PROMPT_INSTRUCTIONS}"
+        budget = self._chunk_token_budget(len(batch))
+        query_terms = set(tokenize_for_bm25(question)) if budget > 0 else set()
+        for idx, (_, chunk) in enumerate(batch):
+            text = chunk.get('text', '') or chunk.get('page_content', '')
+            if budget > 0:
+                text = extract_snippet(text, query_terms, budget)
+            prompt += f"\n[c{idx+1}] {text}"
+        return prompt
+
+    def _score_batch(self, llm, question: str, batch: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, float]:
+        prompt = self._build_prompt(question, batch)
+        labels = {f"c{idx+1}": chunk_id for idx, (chunk_id, _) in enumerate(batch)}
+        parser = IncrementalScoreParser(list(labels))
+        scores: Dict[str, float] = {}
+        received = False
+        try:
+            for piece in self._stream_llm(llm, prompt):
+                received = True
+                # Cada score é registrado assim que chega, antes do fim da geração
+                for label, score in parser.feed(piece).items():
+                    scores[labels[label]] = score
+        except Exception as e:
+            if received:
+                # Resposta interrompida: mantém os scores já recebidos
+                logger.warning("Resposta do LLM interrompida após %d score(s): %s", len(scores), e)
+            else:
+                # Stream indisponível (modelo sem streaming ou erro de transporte): usa a chamada completa
+                for label, score in parser.feed(self._response_text(self._call_llm(llm, prompt))).items():
+                    scores[labels[label]] = score
+        for label, score in parser.close().items():
+            scores[labels[label]] = score
+        # Um lote por chamada: o prompt e a resposta completos ficam no nível debug
+        logger.debug("Prompt enviado ao LLM:\n%s", prompt)
+        logger.debug("Resposta bruta do LLM: %s", parser.raw)
+        return scores
+
+    def _score_with_llm(self, llm, question: str, items: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, float]:
+        """Avalia os chunks em lotes paralelos e junta os scores pelo id do chunk."""
+        if not items:
+            return {}
+        batch_size = int(getattr(self, 'batch_size', 0) or 0)
+        max_concurrency = max(1, int(getattr(self, 'max_concurrency', 4) or 1))
+        batches = self._split_batches(items, batch_size)
+
+        if len(batches) == 1:
+            return self._score_batch(llm, question, batches[0])
+
+        scores: Dict[str, float] = {}
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as executor:
+            futures = [executor.submit(self._score_batch, llm, question, batch) for batch in batches]
+            for future in futures:
+                try:
+                    scores.update(future.result())
+                except Exception as e:
+                    # Um lote com falha não descarta os scores dos demais
+                    logger.warning("Falha ao avaliar lote de chunks: %s", e)
+        return scores
+
+    def _llm_model_name(self, llm) -> str:
+        for attr in ("deployment_name", "model_name", "model"):
+            value = getattr(llm, attr, None)
+            if isinstance(value, str) and value:
+                return value
+        return type(llm).__name__
+
+    def _score_chunks(self, llm, question: str, items: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, float]:
+        """Consulta o cache de scores e envia ao LLM apenas os chunks ausentes."""
+        self._cache_hits = 0
+        self._cache_misses = len(items)
+        ttl = int(getattr(self, 'cache_ttl_seconds', 0) or 0)
+        if ttl <= 0:
+            return self._score_with_llm(llm, question, items)
+
+        cache = get_rerank_score_cache(
+            max_entries=max(1, int(getattr(self, 'cache_max_entries', 5000) or 1)),
+            ttl_seconds=ttl,
+            db_path=(getattr(self, 'cache_db_path', '') or '').strip() or None,
+        )
+        model = self._llm_model_name(llm)
+        # O trecho de cada chunk no prompt depende dos orçamentos e do tamanho do lote
+        prompt_config = "|".join([
+            RERANK_PROMPT_INSTRUCTIONS,
+            f"snippet_max_tokens={int(getattr(self, 'snippet_max_tokens', 0) or 0)}",
+            f"prompt_max_tokens={int(getattr(self, 'prompt_max_tokens', 0) or 0)}",
+            f"batch_size={int(getattr(self, 'batch_size', 0) or 0)}",
+        ])
+        keys = {
+            chunk_id: cache.make_key(
+                model, question, chunk_id, chunk.get('text', '') or chunk.get('page_content', ''), prompt_config
+            )
+            for chunk_id, chunk in items
+        }
+
+        scores: Dict[str, float] = {}
+        misses = []
+        for chunk_id, chunk in items:
+            cached = cache.get(keys[chunk_id])
+            if cached is None:
+                misses.append((chunk_id, chunk))
+            else:
+                scores[chunk_id] = cached
+        self._cache_hits = len(scores)
+        self._cache_misses = len(misses)
+
+        new_scores = self._score_with_llm(llm, question, misses)
+        cache.set_many({keys[chunk_id]: score for chunk_id, score in new_scores.items()})
+        scores.update(new_scores)
+        return scores
+
+    def _prerank(self, question: str, items: List[Tuple[str, Dict[str, Any]]], top_n: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """Pré-rank BM25 local: mantém apenas os top_n chunks mais aderentes aos termos da pergunta."""
+        if top_n <= 0 or len(items) <= top_n:
+            return items
+        docs_tokens = [
+            tokenize_for_bm25(f"{chunk.get('text', '') or chunk.get('page_content', '')} {chunk.get('resumo', '') or ''}")
+            for _, chunk in items
+        ]
+        scores = bm25_scores(tokenize_for_bm25(question), docs_tokens)
+        for (_, chunk), score in zip(items, scores):
+            chunk['prerank_score'] = score
+        ranked = sorted(range(len(items)), key=lambda i: scores[i], reverse=True)[:top_n]
+        return [items[i] for i in sorted(ranked)]
+
+    def _apply_fusion(self, chunks: List[Dict[str, Any]], peso_lexical: float, peso_semantic: float) -> None:
+        """Calcula o fusion_score de cada chunk a partir do score lexical e do similarity_score."""
+        def as_float(value) -> float:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return 0.0
+
+        lexical_present = np.array([c.get('source') in ('lexical', 'both') for c in chunks], dtype=bool)
+        semantic_present = np.array([c.get('source') in ('semantic', 'both') for c in chunks], dtype=bool)
+        lexical = np.array([as_float(c.get('score', 0)) for c in chunks], dtype=float)
+        semantic = np.array([as_float(c.get('similarity_score', 0)) for c in chunks], dtype=float)
+
+        fused = fuse_scores(
+            lexical,
+            semantic,
+            lexical_present,
+            semantic_present,
+            peso_lexical,
+            peso_semantic,
+            mode=getattr(self, 'fusion_mode', 'weighted') or 'weighted',
+            normalization=getattr(self, 'score_normalization', 'minmax') or 'minmax',
+        )
+        for chunk, value in zip(chunks, fused.tolist()):
+            chunk['fusion_score'] = value
+
+    def _collapse_near_duplicates(
+        self, items: List[Tuple[str, Dict[str, Any]]]
+    ) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, List[str]]]:
+        """Mantém um representante (maior fusion_score) por grupo de quase-duplicados e mapeia os demais membros."""
+        if len(items) < 2:
+            return items, {}
+        threshold = getattr(self, 'near_duplicate_threshold', None)
+        # 0 é um limiar válido; só a ausência do valor usa o padrão
+        threshold = 0.8 if threshold is None else float(threshold)
+        ordered = sorted(items, key=lambda item: item[1].get('fusion_score', 0.0), reverse=True)
+        texts = [chunk.get('text', '') or chunk.get('page_content', '') for _, chunk in ordered]
+        groups = near_duplicate_groups(texts, threshold=threshold)
+
+        members: Dict[str, List[str]] = {}
+        for (chunk_id, chunk), group in zip(ordered, groups):
+            rep_id = ordered[group][0]
+            if rep_id != chunk_id:
+                chunk['near_duplicate_of'] = rep_id
+                members.setdefault(rep_id, []).append(chunk_id)
+        representatives = [item for item in items if item[0] not in {m for ids in members.values() for m in ids}]
+        return representatives, members
+
+    def _diversify(self, reranked: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Coloca primeiro um chunk por grupo de quase-duplicados, mantendo a ordem por score."""
+        seen = set()
+        heads, duplicates = [], []
+        for chunk in reranked:
+            group = chunk.get('near_duplicate_of') or chunk.get('_id')
+            if group is not None and str(group) in seen:
+                duplicates.append(chunk)
+            else:
+                seen.add(str(group))
+                heads.append(chunk)
+        return heads + duplicates
+
     def rerank_chunks(self) -> Data:
-        import re
         question = self.question.text if hasattr(self.question, 'text') else str(self.question)
         pesos = self._parse_pesos(self.rerank_pesos)
         lex_chunks = self._extract_chunks(self.lexical_chunks)
@@ -151,7 +815,7 @@ class LLMRerankComponent(Component):
         peso_lexical = float(pesos.get('lexical', 0.5))
         peso_semantic = float(pesos.get('semantic', 0.5))
 
-        # Junta e remove duplicados por _id
+        # Junta e remove duplicados por _id, preservando os scores das duas origens
         all_chunks = {}
         for chunk in (lex_chunks or []):
             chunk = self._chunk_to_dict(chunk)
@@ -161,7 +825,12 @@ class LLMRerankComponent(Component):
         for chunk in (sem_chunks or []):
             chunk = self._chunk_to_dict(chunk)
             _id = str(chunk.get('_id', id(chunk)))
-            chunk['source'] = 'semantic'
+            existing = all_chunks.get(_id)
+            if existing is not None and existing.get('source') == 'lexical':
+                chunk = {**existing, **chunk, 'score': existing.get('score', 0)}
+                chunk['source'] = 'both'
+            else:
+                chunk['source'] = 'semantic'
             all_chunks[_id] = chunk
         chunks = list(all_chunks.values())
 
@@ -169,39 +838,67 @@ class LLMRerankComponent(Component):
             self.status = "Nenhum chunk de entrada válido"
             return Data(data={"reranked": []})
 
-        # Prompt único para batch, agora incluindo a pergunta
-        prompt = f"Pergunta: {question}\nAvalie de 0 a 10 o quanto cada texto abaixo responde à pergunta. Responda apenas com uma lista de números, na mesma ordem dos textos.\n"
-        for idx, chunk in enumerate(chunks):
-            text = chunk.get('text', '') or chunk.get('page_content', '')
-            prompt += f"\nTexto {idx+1}: {text}"
-
-        score_str = self._call_llm(llm, prompt)
-        print(f"Prompt enviado ao LLM:\n{prompt}")
-        print(f"Resposta bruta do LLM: {score_str}")
-
-        # Extrai lista de scores
-        scores = re.findall(r"[-+]?[0-9]*\.?[0-9]+", str(score_str))
-        scores = [float(s.replace(',', '.')) for s in scores][:len(chunks)]
-
-        # Atribui scores aos chunks e calcula score final com pesos
-        reranked = []
-        for chunk, score in zip(chunks, scores):
-            chunk['rerank_score_llm'] = score
-            # Score lexical e semântico (se existirem)
-            score_lexical = float(chunk.get('score', 0)) if chunk.get('source') == 'lexical' else 0.0
-            score_semantic = float(chunk.get('similarity_score', 0)) if chunk.get('source') == 'semantic' else 0.0
-            # Score final ponderado
-            chunk['rerank_score_final'] = (
-                peso_lexical * score_lexical + peso_semantic * score_semantic + score
-            ) / (1 + peso_lexical + peso_semantic)
-            reranked.append(chunk)
-
-        # Filtra apenas os chunks com score LLM > 0
-        reranked = [chunk for chunk in reranked if chunk.get('rerank_score_llm', 0) > 0]
+        self._apply_fusion(chunks, peso_lexical, peso_semantic)
+        fusion_only = bool(getattr(self, 'fusion_only', False))
+
+        candidates = list(all_chunks.items())
+        near_duplicates: Dict[str, List[str]] = {}
+        if bool(getattr(self, 'collapse_near_duplicates', False)):
+            candidates, near_duplicates = self._collapse_near_duplicates(candidates)
+        collapsed = sum(len(ids) for ids in near_duplicates.values())
+
+        prerank_top_n = int(getattr(self, 'prerank_top_n', 0) or 0)
+        before_prerank = len(candidates)
+        candidates = self._prerank(question, candidates, prerank_top_n)
+        dropped = before_prerank - len(candidates)
+
+        if fusion_only:
+            self._cache_hits = self._cache_misses = 0
+            reranked = []
+            for rep_id, _ in candidates:
+                for chunk_id in [rep_id] + near_duplicates.get(rep_id, []):
+                    chunk = all_chunks[chunk_id]
+                    # Score de fusão levado à escala 0-10 do LLM
+                    chunk['rerank_score_final'] = 10.0 * chunk['fusion_score']
+                    reranked.append(chunk)
+        else:
+            scores = self._score_chunks(llm, question, candidates)
+            # Replica o score do representante aos quase-duplicados
+            for rep_id, member_ids in near_duplicates.items():
+                if rep_id in scores:
+                    for member_id in member_ids:
+                        scores[member_id] = scores[rep_id]
+
+            # Atribui scores aos chunks e calcula score final com pesos
+            reranked = []
+            for _id, chunk in all_chunks.items():
+                if _id not in scores:
+                    continue
+                score = scores[_id]
+                chunk['rerank_score_llm'] = score
+                # Score final ponderado: fusão lexical/semântica (escala 0-10) + score do LLM
+                chunk['rerank_score_final'] = (
+                    (peso_lexical + peso_semantic) * 10.0 * chunk['fusion_score'] + score
+                ) / (1 + peso_lexical + peso_semantic)
+                reranked.append(chunk)
+
+            # Filtra apenas os chunks com score LLM > 0
+            reranked = [chunk for chunk in reranked if chunk.get('rerank_score_llm', 0) > 0]
         # Filtra pelo score final mínimo
         reranked = [chunk for chunk in reranked if chunk.get('rerank_score_final', 0) >= score_final_min]
 
         reranked.sort(key=lambda x: x['rerank_score_final'], reverse=True)
+        if near_duplicates:
+            reranked = self._diversify(reranked)
         reranked = reranked[:top_k]
-        self.status = f"Rerank finalizado. Top {len(reranked)} retornados (score final >= {score_final_min})."
+        summary = f"Pré-rank: {dropped} chunk(s) descartado(s). Quase-duplicados: {collapsed} chunk(s) agrupado(s)."
+        if fusion_only:
+            self.status = (
+                f"Fusão finalizada sem LLM. Top {len(reranked)} retornados (score final >= {score_final_min}). {summary}"
+            )
+            return Data(data={"reranked": reranked})
+        self.status = (
+            f"Rerank finalizado. Top {len(reranked)} retornados (score final >= {score_final_min}). "
+            f"Cache: {self._cache_hits} hit(s), {self._cache_misses} miss(es). {summary}"
+        )
         return Data(data={"reranked": reranked})
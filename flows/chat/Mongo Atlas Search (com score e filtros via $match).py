@@ -1,13 +1,34 @@
+import asyncio
+import copy
+import hashlib
 import json
+import os
 import re
-from typing import List, Union, Dict, Any
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import OrderedDict
+from typing import List, Union, Dict, Any, Optional, Tuple
 
+import bson
+import certifi
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
 from pymongo import MongoClient
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # Motor é opcional; sem ele a busca assíncrona roda o PyMongo em uma thread
+    AsyncIOMotorClient = None
 from langflow.custom import Component
 from langflow.inputs import (
     SecretStrInput,
     StrInput,
     IntInput,
+    BoolInput,
+    DropdownInput,
     MultilineInput,
     HandleInput,
     DataInput,
@@ -16,6 +37,369 @@ from langflow.schema import Data, Message
 from langflow.template import Output
 
 
+# --- Registro de MongoClient compartilhado pelos componentes Mongo (manter idêntico entre os arquivos) ---
+MONGO_MAX_POOL_SIZE = 50
+MONGO_MAX_IDLE_TIME_MS = 300_000
+MONGO_CLIENT_IDLE_TTL_SECONDS = 900
+MONGO_HEALTH_CHECK_INTERVAL_SECONDS = 30
+
+
+def _mongo_client_registry() -> Dict[str, Any]:
+    """Estado por processo que sobrevive às re-execuções do código do componente pelo Langflow."""
+    holder = sys.modules.setdefault("_langflow_shared_registries", types.ModuleType("_langflow_shared_registries"))
+    if not hasattr(holder, "mongo_clients"):
+        holder.mongo_clients = {
+            "lock": threading.Lock(),
+            "clients": {},
+            "metrics": {"hits": 0, "misses": 0, "evictions": 0, "health_check_failures": 0},
+        }
+    return holder.mongo_clients
+
+
+def _close_registry_entry(entry: Dict[str, Any]) -> None:
+    try:
+        entry["client"].close()
+    finally:
+        if entry.get("cert_path"):
+            try:
+                os.remove(entry["cert_path"])
+            except OSError:
+                pass
+
+
+def _evict_idle_clients(registry: Dict[str, Any], now: float, keep_key: str) -> None:
+    """Fecha clientes (PyMongo e Motor) ociosos além do TTL e os aposentados pelo health check. Chamar com o lock."""
+    for clients in (registry["clients"], registry.setdefault("motor_clients", {})):
+        for other_key, other in list(clients.items()):
+            if other_key != keep_key and now - other["last_used"] > MONGO_CLIENT_IDLE_TTL_SECONDS:
+                _close_registry_entry(clients.pop(other_key))
+                registry["metrics"]["evictions"] += 1
+    retired = registry.setdefault("retired", [])
+    for old in [r for r in retired if now - r["retired_at"] > MONGO_CLIENT_IDLE_TTL_SECONDS]:
+        retired.remove(old)
+        _close_registry_entry(old)
+
+
+def _mongo_client_options(tls: bool, client_cert: Optional[str]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Opções do pool e de TLS; o certificado mTLS vai para um arquivo temporário removido ao fechar o cliente."""
+    options: Dict[str, Any] = {"maxPoolSize": MONGO_MAX_POOL_SIZE, "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS}
+    cert_path = None
+    if tls:
+        options.update(tls=True, tlsCAFile=certifi.where())
+        if client_cert:
+            with tempfile.NamedTemporaryFile(delete=False) as tmp:
+                tmp.write(client_cert.encode("utf-8"))
+                cert_path = tmp.name
+            options["tlsCertificateKeyFile"] = cert_path
+    return options, cert_path
+
+
+def _mongo_client_key(uri: str, tls: bool, client_cert: Optional[str]) -> str:
+    cert_hash = hashlib.sha256(client_cert.encode("utf-8")).hexdigest() if client_cert else ""
+    return f"{uri}|tls={tls}|{cert_hash}"
+
+
+def get_mongo_client(uri: str, tls: bool = False, client_cert: Optional[str] = None) -> MongoClient:
+    """
+    Devolve um MongoClient compartilhado por URI e opções de TLS/mTLS.
+
+    Clientes ociosos há mais de MONGO_CLIENT_IDLE_TTL_SECONDS são fechados, e um ping
+    periódico substitui clientes que deixaram de responder. O cliente substituído sai do
+    registro na hora, mas só é fechado após o TTL, pois outras threads podem estar usando-o.
+    """
+    registry = _mongo_client_registry()
+    key = _mongo_client_key(uri, tls, client_cert)
+    now = time.monotonic()
+
+    with registry["lock"]:
+        _evict_idle_clients(registry, now, key)
+        entry = registry["clients"].get(key)
+        if entry is not None:
+            entry["last_used"] = now
+
+    # O ping fica fora do lock para não bloquear os demais componentes
+    if entry is not None and now - entry["last_health_check"] > MONGO_HEALTH_CHECK_INTERVAL_SECONDS:
+        try:
+            entry["client"].admin.command("ping")
+            entry["last_health_check"] = now
+        except Exception:
+            with registry["lock"]:
+                registry["metrics"]["health_check_failures"] += 1
+                if registry["clients"].get(key) is entry:
+                    # Novas chamadas recebem outro cliente; este é fechado depois, na limpeza por TTL
+                    entry["retired_at"] = now
+                    registry.setdefault("retired", []).append(registry["clients"].pop(key))
+
+    with registry["lock"]:
+        entry = registry["clients"].get(key)
+        if entry is not None:
+            registry["metrics"]["hits"] += 1
+            return entry["client"]
+
+        registry["metrics"]["misses"] += 1
+        options, cert_path = _mongo_client_options(tls, client_cert)
+        registry["clients"][key] = {
+            "client": MongoClient(uri, **options),
+            "cert_path": cert_path,
+            "last_used": now,
+            "last_health_check": now,
+        }
+        return registry["clients"][key]["client"]
+
+
+def mongo_client_metrics() -> Dict[str, Any]:
+    """Métricas do registro de clientes: hits, misses, evicções, falhas de health check e clientes abertos."""
+    registry = _mongo_client_registry()
+    with registry["lock"]:
+        return {
+            **registry["metrics"],
+            "open_clients": len(registry["clients"]),
+            "open_motor_clients": len(registry.get("motor_clients", {})),
+            "retired_clients": len(registry.get("retired", [])),
+        }
+
+
+# Coleções lógicas podem apontar para uma coleção física diferente (troca blue/green do overwrite)
+COLLECTION_ALIASES = "_collection_aliases"
+COLLECTION_ALIAS_TTL_SECONDS = 5
+
+
+def resolve_collection_name(
+    uri: str, db_name: str, name: str, tls: bool = False, client_cert: Optional[str] = None
+) -> str:
+    """Coleção física por trás de 'name'; sem alias cadastrado em _collection_aliases, é o próprio nome."""
+    aliases = _mongo_client_registry().setdefault("aliases", {})
+    key = f"{_mongo_client_key(uri, tls, client_cert)}|{db_name}|{name}"
+    cached = aliases.get(key)
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < COLLECTION_ALIAS_TTL_SECONDS:
+        return cached[1]
+    doc = get_mongo_client(uri, tls, client_cert)[db_name][COLLECTION_ALIASES].find_one({"_id": name}, {"target": 1})
+    target = (doc or {}).get("target") or name
+    aliases[key] = (now, target)
+    return target
+
+
+# --- fim do registro de MongoClient ---
+
+
+def _shared_registry(name: str) -> Dict[str, Any]:
+    """Registro por processo que sobrevive às re-execuções do código do componente pelo Langflow."""
+    holder = sys.modules.setdefault("_langflow_shared_registries", types.ModuleType("_langflow_shared_registries"))
+    if not hasattr(holder, name):
+        setattr(holder, name, {})
+    return getattr(holder, name)
+
+
+def get_motor_client(uri: str, tls: bool = False, client_cert: Optional[str] = None):
+    """Shared Motor client per URI/TLS options and event loop (Motor clients are bound to the loop that created them).
+
+    Lives in the same registry as the PyMongo clients, so it takes part in idle eviction and the metrics; the
+    client of a closed loop is closed (and its temporary certificate removed) instead of being abandoned.
+    """
+    registry = _mongo_client_registry()
+    loop = asyncio.get_running_loop()
+    key = f"{_mongo_client_key(uri, tls, client_cert)}|loop={id(loop)}"
+    now = time.monotonic()
+    with registry["lock"]:
+        _evict_idle_clients(registry, now, key)
+        motor_clients = registry["motor_clients"]
+        for other_key, other in list(motor_clients.items()):
+            # A closed loop never runs again (and a loop id can be reused): close the client bound to it
+            if other["loop"].is_closed() or (other_key == key and other["loop"] is not loop):
+                _close_registry_entry(motor_clients.pop(other_key))
+                registry["metrics"]["evictions"] += 1
+        entry = motor_clients.get(key)
+        if entry is not None:
+            entry["last_used"] = now
+            registry["metrics"]["hits"] += 1
+            return entry["client"]
+
+        registry["metrics"]["misses"] += 1
+        options, cert_path = _mongo_client_options(tls, client_cert)
+        motor_clients[key] = {
+            "client": AsyncIOMotorClient(uri, io_loop=loop, **options),
+            "cert_path": cert_path,
+            "loop": loop,
+            "last_used": now,
+            "last_health_check": now,
+        }
+        return motor_clients[key]["client"]
+
+
+# --- Profiling de agregações (manter idêntico entre os arquivos) ---
+def explain_aggregate(collection, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Runs the pipeline under explain with executionStats verbosity and returns a JSON-safe document."""
+    explain = collection.database.command(
+        {"explain": {"aggregate": collection.name, "pipeline": pipeline, "cursor": {}}, "verbosity": "executionStats"}
+    )
+    return json.loads(json_util.dumps(explain))
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-stage documents returned and server time, plus documents examined versus returned.
+
+    Sharded explains are flattened. Documents examined comes from totalDocsExamined when the plan
+    reads the collection; for $search/$vectorSearch plans it is what mongot handed to mongod.
+    """
+    raw_stages = list(explain.get("stages") or [])
+    for shard in (explain.get("shards") or {}).values():
+        raw_stages.extend(shard.get("stages") or [])
+
+    stages = []
+    for stage in raw_stages:
+        name = next((key for key in stage if key.startswith("$")), "?")
+        stages.append({
+            "stage": name,
+            "n_returned": stage.get("nReturned"),
+            "execution_time_ms": stage.get("executionTimeMillisEstimate"),
+        })
+
+    def find_all(node: Any, key: str) -> List[Any]:
+        if isinstance(node, dict):
+            found = [node[key]] if key in node else []
+            return found + [v for child in node.values() for v in find_all(child, key)]
+        if isinstance(node, list):
+            return [v for child in node for v in find_all(child, key)]
+        return []
+
+    docs_examined = sum(v for v in find_all(explain, "totalDocsExamined") if isinstance(v, int))
+    if not docs_examined and stages and isinstance(stages[0]["n_returned"], int):
+        docs_examined = stages[0]["n_returned"]
+    stage_times = [s["execution_time_ms"] for s in stages if isinstance(s["execution_time_ms"], (int, float))]
+    return {
+        "stages": stages,
+        "docs_examined": docs_examined,
+        "keys_examined": sum(v for v in find_all(explain, "totalKeysExamined") if isinstance(v, int)),
+        "n_returned": stages[-1]["n_returned"] if stages else None,
+        # executionTimeMillisEstimate é cumulativo ao longo da pipeline
+        "server_time_ms": max(stage_times) if stage_times else None,
+    }
+# --- fim do profiling de agregações ---
+
+
+# Atlas Search field types that accept equals/in/range filter operators, per Python value type
+_FILTERABLE_TYPES = {
+    str: {"token"},
+    bool: {"boolean"},
+    int: {"number"},
+    float: {"number"},
+}
+_SEARCH_OPTION_KEYS = {
+    "index", "highlight", "count", "returnStoredSource", "scoreDetails", "sort",
+    "searchAfter", "searchBefore", "concurrent", "tracking",
+}
+_RANGE_OPERATORS = {"$gt": "gt", "$gte": "gte", "$lt": "lt", "$lte": "lte"}
+INDEX_MAPPING_TTL_SECONDS = 600
+# Escrito pela ingestão do MongoVectorStoreComponent a cada lote gravado e a cada troca blue/green
+INGEST_WATERMARK_COLLECTION = "_ingest_watermarks"
+CACHE_INVALIDATION_OPTIONS = ["nenhuma", "watermark", "change_stream"]
+PAGE_DIRECTIONS = ["next", "previous"]
+PAGINATION_TOKEN_FIELD = "_pagination_token"
+# Um watermark lido é reaproveitado por este tempo; ingestões feitas neste processo o descartam na hora
+WATERMARK_CACHE_SECONDS = 2.0
+
+
+class SearchResultCache:
+    """LRU cache of aggregation results, invalidated per collection by an ingestion watermark or change stream.
+
+    The watermark read is reused for WATERMARK_CACHE_SECONDS, so a lookup usually costs no round trip;
+    ingestions in this process (bump_ingest_watermark) drop it immediately, and ingestions elsewhere are
+    seen within that window. The TTL only bounds staleness when invalidation is disabled (or for writers
+    that bypass both signals).
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._listeners: Dict[str, threading.Thread] = {}
+        self._watermarks: Dict[str, Tuple[float, int, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(collection_key: str, index_name: str, pipeline: List[Dict[str, Any]], variant: str = "") -> str:
+        """variant separates results that depend on more than the pipeline (e.g. the streaming budget)."""
+        # Sem sort_keys: a ordem das chaves importa em estágios como $sort
+        canonical = json.dumps(pipeline, default=str, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(f"{collection_key}|{index_name}|{variant}|{canonical}".encode("utf-8")).hexdigest()
+
+    def current_watermark(self, collection_key: str, collection, logical_name: str) -> Any:
+        """Ingestion version of the collection plus its latest atualizado_em (for writers that do not bump the version)."""
+        local_version = _shared_registry("ingest_watermarks").get(f"{collection.database.name}|{logical_name}", 0)
+        with self._lock:
+            cached = self._watermarks.get(collection_key)
+            if cached and cached[1] == local_version and time.monotonic() - cached[0] < WATERMARK_CACHE_SECONDS:
+                return cached[2]
+        marker = collection.database[INGEST_WATERMARK_COLLECTION].find_one({"_id": logical_name}, {"version": 1})
+        latest = collection.find_one({}, {"atualizado_em": 1}, sort=[("atualizado_em", -1)])
+        watermark = [(marker or {}).get("version", 0), latest.get("atualizado_em") if latest else None]
+        with self._lock:
+            self._watermarks[collection_key] = (time.monotonic(), local_version, watermark)
+        return watermark
+
+    def ensure_listener(self, collection_key: str, collection) -> None:
+        """Starts (once) a change-stream thread that invalidates the collection's entries on every change."""
+        with self._lock:
+            listener = self._listeners.get(collection_key)
+            if listener is not None and listener.is_alive():
+                return
+            # Changes made while no listener was running were not observed
+            self._generations[collection_key] = self._generations.get(collection_key, 0) + 1
+
+            def watch() -> None:
+                try:
+                    with collection.watch() as stream:
+                        for _ in stream:
+                            self.invalidate(collection_key)
+                except Exception:
+                    # Sem o listener não há garantia de frescor: descarta o que estiver em cache
+                    self.invalidate(collection_key)
+
+            listener = threading.Thread(target=watch, name=f"search-cache-watch-{collection_key[:8]}", daemon=True)
+            self._listeners[collection_key] = listener
+            listener.start()
+
+    def invalidate(self, collection_key: str) -> None:
+        with self._lock:
+            self._generations[collection_key] = self._generations.get(collection_key, 0) + 1
+
+    def get(self, key: str, collection_key: str, ttl_seconds: int, watermark: Any = None) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if (
+                time.monotonic() - entry["created_at"] > ttl_seconds
+                or entry["generation"] != self._generations.get(collection_key, 0)
+                or entry["watermark"] != watermark
+            ):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(entry["results"])
+
+    def set(self, key: str, collection_key: str, results: List[Dict[str, Any]], watermark: Any = None) -> None:
+        with self._lock:
+            self._entries[key] = {
+                "results": copy.deepcopy(results),
+                "created_at": time.monotonic(),
+                "generation": self._generations.get(collection_key, 0),
+                "watermark": watermark,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def get_search_result_cache(max_entries: int) -> SearchResultCache:
+    registry = _shared_registry("atlas_search_result_cache")
+    if "cache" not in registry:
+        registry["cache"] = SearchResultCache(max_entries=max_entries)
+    registry["cache"].max_entries = max_entries
+    return registry["cache"]
+
+
 class MongoAtlasSearchWithFilters(Component):
     display_name = "Mongo Atlas Search Avançado (com search_instruction, setor e status)"
     icon = "MongoDB"
@@ -78,6 +462,127 @@ class MongoAtlasSearchWithFilters(Component):
             info="Limite de resultados. Usado se não especificado em search_instruction.",
             required=False,
         ),
+        MultilineInput(
+            name="filter_field_types",
+            display_name="Tipos dos Campos Filtráveis no Índice",
+            value="",
+            info='Objeto JSON campo -> tipo Atlas (ex.: {"setores": "token", "status": "token"}). '
+                 'Vazio lê o mapeamento do índice automaticamente. Filtros em campos indexados vão para compound.filter; '
+                 'os demais continuam como $match após o $search.',
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="result_cache_ttl_seconds",
+            display_name="TTL do Cache de Resultados (s)",
+            value=300,
+            info="Reaproveita resultados de pipelines idênticas por este tempo. 0 desativa o cache.",
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="result_cache_max_entries",
+            display_name="Tamanho do Cache de Resultados",
+            value=256,
+            info="Número máximo de pipelines com resultados em cache (LRU).",
+            advanced=True,
+            required=False,
+        ),
+        DropdownInput(
+            name="result_cache_invalidation",
+            display_name="Invalidação do Cache",
+            options=CACHE_INVALIDATION_OPTIONS,
+            value="watermark",
+            info="watermark: compara a versão de ingestão (_ingest_watermarks) e o maior atualizado_em da coleção "
+                 "(requer índice em atualizado_em), relidos no máximo a cada 2s; ingestões feitas neste processo "
+                 "invalidam na hora. change_stream: invalida a cada alteração na coleção, sem consultar o watermark "
+                 "(requer replica set). nenhuma: fallback apenas por TTL, pode servir resultados anteriores "
+                 "a uma ingestão até o TTL expirar.",
+            advanced=True,
+        ),
+        BoolInput(
+            name="enable_pagination",
+            display_name="Paginação por Token",
+            value=False,
+            info="Pagina com searchSequenceToken/searchAfter do Atlas: cada página tem o tamanho do limit e a saída traz "
+                 "'page' com next_cursor/previous_cursor. Um sort_stage é movido para o sort do $search "
+                 "(os campos precisam estar mapeados como ordenáveis no índice).",
+            advanced=True,
+        ),
+        StrInput(
+            name="page_cursor",
+            display_name="Cursor de Página",
+            value="",
+            info="Token retornado em page.next_cursor/previous_cursor de uma execução anterior. "
+                 "search_instruction pode sobrescrever com 'page_cursor'.",
+            advanced=True,
+            required=False,
+        ),
+        DropdownInput(
+            name="page_direction",
+            display_name="Direção da Página",
+            options=PAGE_DIRECTIONS,
+            value="next",
+            info="next usa searchAfter; previous usa searchBefore. search_instruction pode sobrescrever com 'page_direction'.",
+            advanced=True,
+        ),
+        BoolInput(
+            name="enable_profiling",
+            display_name="Modo de Profiling",
+            value=False,
+            info="Preenche a saída de debug com tempos no cliente, explain (executionStats) da pipeline, tempos por estágio "
+                 "e documentos examinados x retornados. O explain executa a pipeline mais uma vez.",
+            advanced=True,
+        ),
+        BoolInput(
+            name="use_async_driver",
+            display_name="Usar Driver Assíncrono (Motor)",
+            value=True,
+            info="Executa a agregação com Motor no event loop do Langflow, permitindo que buscas independentes rodem em paralelo. "
+                 "Sem Motor instalado, a agregação roda em uma thread.",
+            advanced=True,
+        ),
+        BoolInput(
+            name="streaming_cursor",
+            display_name="Leitura em Streaming do Cursor",
+            value=False,
+            info="Itera o cursor em lotes de cursor_batch_size, convertendo cada documento ao chegar, e interrompe a leitura "
+                 "ao atingir o orçamento de bytes ou tokens. Útil quando projection_stage traz text, embedding ou transcrições.",
+            advanced=True,
+        ),
+        IntInput(
+            name="cursor_batch_size",
+            display_name="Tamanho do Lote do Cursor",
+            value=100,
+            info="batchSize enviado ao servidor no modo streaming. 0 usa o padrão do driver.",
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="max_result_bytes",
+            display_name="Orçamento de Bytes dos Resultados",
+            value=0,
+            info="No modo streaming, para de ler o cursor quando o total em BSON dos documentos passaria deste valor. 0 desativa.",
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="max_result_tokens",
+            display_name="Orçamento de Tokens dos Resultados",
+            value=0,
+            info="No modo streaming, para de ler o cursor quando o total estimado de tokens dos campos de texto passaria deste valor "
+                 "(~4 caracteres por token). 0 desativa.",
+            advanced=True,
+            required=False,
+        ),
+        IntInput(
+            name="query_timeout_seconds",
+            display_name="Tempo Limite da Busca (s)",
+            value=30,
+            info="Tempo máximo da agregação (também enviado ao servidor como maxTimeMS). 0 desativa o limite.",
+            advanced=True,
+            required=False,
+        ),
     ]
 
     outputs = [
@@ -86,6 +591,11 @@ class MongoAtlasSearchWithFilters(Component):
             display_name="Search Results",
             method="search_documents",
         ),
+        Output(
+            name="profile",
+            display_name="Search Profile (Debug)",
+            method="profile_search",
+        ),
     ]
 
     def _parse_user_sector(self) -> List[str]:
@@ -133,27 +643,163 @@ class MongoAtlasSearchWithFilters(Component):
             self.status = f"Conteúdo da search_instruction (Data.data) não é dict nem string JSON. Tipo: {type(instruction_payload)}"
             return {}
 
-    def _build_search_pipeline(self, instruction: Dict[str, Any], user_allowed_sectors: List[str], doc_status_filter: str) -> List[Dict[str, Any]]:
-        """Builds the MongoDB aggregation pipeline with search_instruction, sector, and status filters."""
+    def _collect_field_types(self, fields: Dict[str, Any], prefix: str = "") -> Dict[str, set]:
+        """Flattens an Atlas Search mapping into {dotted.path: {types}}."""
+        field_types: Dict[str, set] = {}
+        for name, spec in (fields or {}).items():
+            path = f"{prefix}{name}"
+            for definition in (spec if isinstance(spec, list) else [spec]):
+                if not isinstance(definition, dict):
+                    continue
+                field_types.setdefault(path, set()).add(definition.get("type"))
+                if definition.get("fields"):
+                    for sub_path, sub_types in self._collect_field_types(definition["fields"], f"{path}.").items():
+                        field_types.setdefault(sub_path, set()).update(sub_types)
+        return field_types
+
+    def _index_field_types(self, collection) -> Dict[str, set]:
+        """Returns the indexed field types, from the filter_field_types input or the (cached) index definition."""
+        raw_override = (getattr(self, "filter_field_types", "") or "").strip()
+        if raw_override:
+            try:
+                override = json.loads(raw_override)
+                return {
+                    field: set(types_ if isinstance(types_, list) else [types_])
+                    for field, types_ in override.items()
+                }
+            except (json.JSONDecodeError, AttributeError):
+                self.status += " Alerta: filter_field_types inválido, lendo o mapeamento do índice."
+
+        cache = _shared_registry("atlas_search_index_mappings")
+        cache_key = hashlib.sha256(
+            f"{self.mongodb_uri}|{self.db_name}|{collection.name}|{self.index_name}".encode("utf-8")
+        ).hexdigest()
+        cached = cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < INDEX_MAPPING_TTL_SECONDS:
+            return cached[1]
+
+        field_types: Dict[str, set] = {}
+        try:
+            for index in collection.list_search_indexes(self.index_name):
+                definition = index.get("latestDefinition") or index.get("definition") or {}
+                field_types = self._collect_field_types(definition.get("mappings", {}).get("fields", {}))
+        except Exception:
+            # Sem acesso à definição do índice: todos os filtros seguem como $match
+            field_types = {}
+        cache[cache_key] = (time.monotonic(), field_types)
+        return field_types
+
+    def _is_filterable(self, field: str, value: Any, field_types: Dict[str, set]) -> bool:
+        values = value if isinstance(value, list) else [value]
+        if not values or field not in field_types:
+            return False
+        return all(
+            type(v) in _FILTERABLE_TYPES and _FILTERABLE_TYPES[type(v)] & field_types[field]
+            for v in values
+        )
+
+    def _compile_field_filter(self, field: str, condition: Any, field_types: Dict[str, set]) -> Optional[Dict[str, Any]]:
+        """Translates one $match field condition into an Atlas Search operator, or None if not indexable."""
+        if field.startswith("$"):
+            return None
+        if not isinstance(condition, dict):
+            if self._is_filterable(field, condition, field_types) and not isinstance(condition, list):
+                return {"equals": {"path": field, "value": condition}}
+            return None
+        if set(condition) == {"$eq"} and self._is_filterable(field, condition["$eq"], field_types):
+            return {"equals": {"path": field, "value": condition["$eq"]}}
+        if set(condition) == {"$in"} and isinstance(condition["$in"], list) and self._is_filterable(field, condition["$in"], field_types):
+            return {"in": {"path": field, "value": condition["$in"]}}
+        if condition and set(condition) <= set(_RANGE_OPERATORS):
+            bounds = list(condition.values())
+            if all(isinstance(b, (int, float)) and not isinstance(b, bool) for b in bounds) and "number" in field_types.get(field, set()):
+                return {"range": {"path": field, **{_RANGE_OPERATORS[op]: v for op, v in condition.items()}}}
+        return None
+
+    def _split_match_filter(self, match_filter: Dict[str, Any], field_types: Dict[str, set]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Splits a $match document into Atlas Search filter clauses and the remaining $match conditions."""
+        clauses: List[Dict[str, Any]] = []
+        remaining: Dict[str, Any] = {}
+        for field, condition in match_filter.items():
+            clause = self._compile_field_filter(field, condition, field_types)
+            if clause is None:
+                remaining[field] = condition
+            else:
+                clauses.append(clause)
+        return clauses, remaining
+
+    def _merge_search_filters(self, search_clause: Dict[str, Any], filters: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Adds filter clauses to the search clause's compound.filter, wrapping single operators in a compound."""
+        if not filters:
+            return dict(search_clause)
+        options = {k: v for k, v in search_clause.items() if k in _SEARCH_OPTION_KEYS}
+        operators = {k: v for k, v in search_clause.items() if k not in _SEARCH_OPTION_KEYS}
+        if set(operators) == {"compound"} and isinstance(operators["compound"], dict):
+            compound = dict(operators["compound"])
+            compound["filter"] = list(compound.get("filter", [])) + filters
+        else:
+            compound = {"filter": filters}
+            if operators:
+                compound["must"] = [{name: body} for name, body in operators.items()]
+        return {**options, "compound": compound}
+
+    def _build_search_pipeline(
+        self,
+        instruction: Dict[str, Any],
+        user_allowed_sectors: List[str],
+        doc_status_filter: str,
+        field_types: Optional[Dict[str, set]] = None,
+        page_request: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Builds the MongoDB aggregation pipeline with search_instruction, sector, and status filters.
+
+        Governance and filter_stages conditions on fields indexed as filterable (see field_types) are
+        compiled into the $search compound.filter; the rest are applied as $match after $search.
+        With page_request, ordering happens inside $search and each result carries its searchSequenceToken.
+        """
         pipeline: List[Dict[str, Any]] = []
+        field_types = field_types or {}
         
         if "search_clause" not in instruction or not isinstance(instruction["search_clause"], dict):
             self.status = "Erro: 'search_clause' não fornecida ou inválida."
             raise ValueError("A 'search_clause' é obrigatória na search_instruction.")
 
+        match_filters: List[Dict[str, Any]] = []
+        if user_allowed_sectors:
+            match_filters.append({"setores": {"$in": user_allowed_sectors}})
+        if doc_status_filter:
+            match_filters.append({"status": doc_status_filter})
+        if "filter_stages" in instruction and isinstance(instruction["filter_stages"], list):
+            match_filters.extend(f for f in instruction["filter_stages"] if isinstance(f, dict) and f)
+
+        search_filters: List[Dict[str, Any]] = []
+        post_search_matches: List[Dict[str, Any]] = []
+        for match_filter in match_filters:
+            clauses, remaining = self._split_match_filter(match_filter, field_types)
+            search_filters.extend(clauses)
+            if remaining:
+                post_search_matches.append(remaining)
+
         search_stage = {
             "$search": {
                 "index": self.index_name,
-                **instruction["search_clause"]
+                **self._merge_search_filters(instruction["search_clause"], search_filters)
             }
         }
+        sort_stage_val = instruction.get("sort_stage")
+        if page_request is not None:
+            # searchAfter/searchBefore só são consistentes com a ordem do próprio $search
+            if isinstance(sort_stage_val, dict) and sort_stage_val:
+                search_stage["$search"]["sort"] = sort_stage_val
+            if page_request["cursor"]:
+                token_key = "searchBefore" if page_request["direction"] == "previous" else "searchAfter"
+                search_stage["$search"][token_key] = page_request["cursor"]
         pipeline.append(search_stage)
 
-        pipeline.append({
-            "$set": {
-                "search_score": {"$meta": "searchScore"}
-            }
-        })
+        score_fields: Dict[str, Any] = {"search_score": {"$meta": "searchScore"}}
+        if page_request is not None:
+            score_fields[PAGINATION_TOKEN_FIELD] = {"$meta": "searchSequenceToken"}
+        pipeline.append({"$set": score_fields})
 
         min_score_val = instruction.get("min_score", self.min_score_fallback)
         min_score = 0.0
@@ -167,23 +813,16 @@ class MongoAtlasSearchWithFilters(Component):
         
         if min_score > 0:
             pipeline.append({"$match": {"search_score": {"$gte": min_score}}})
-        
-        if user_allowed_sectors:
-            pipeline.append({"$match": {"setores": {"$in": user_allowed_sectors}}})
-
-        if doc_status_filter:
-            pipeline.append({"$match": {"status": doc_status_filter}})
 
-        if "filter_stages" in instruction and isinstance(instruction["filter_stages"], list):
-            for match_filter in instruction["filter_stages"]:
-                if isinstance(match_filter, dict) and match_filter: 
-                    pipeline.append({"$match": match_filter})
+        # Apenas filtros em campos não indexados ficam para depois do $search
+        for match_filter in post_search_matches:
+            pipeline.append({"$match": match_filter})
         
-        sort_stage_val = instruction.get("sort_stage")
-        if isinstance(sort_stage_val, dict) and sort_stage_val:
-            pipeline.append({"$sort": sort_stage_val})
-        else: 
-            pipeline.append({"$sort": {"search_score": -1}})
+        if page_request is None:
+            if isinstance(sort_stage_val, dict) and sort_stage_val:
+                pipeline.append({"$sort": sort_stage_val})
+            else: 
+                pipeline.append({"$sort": {"search_score": -1}})
 
         limit_val = instruction.get("limit", self.limit_fallback)
         limit = 0
@@ -196,7 +835,12 @@ class MongoAtlasSearchWithFilters(Component):
                 self.status += f" Alerta: limit inválido, usando fallback {self.limit_fallback} se positivo."
                 if self.limit_fallback > 0: limit = self.limit_fallback
         
-        if limit > 0 :
+        if page_request is not None:
+            # Um documento a mais indica se existe outra página
+            page_request["page_size"] = limit if limit > 0 else self.limit_fallback
+            if page_request["page_size"] > 0:
+                pipeline.append({"$limit": page_request["page_size"] + 1})
+        elif limit > 0 :
             pipeline.append({"$limit": limit})
 
         projection = instruction.get("projection_stage", {
@@ -205,11 +849,18 @@ class MongoAtlasSearchWithFilters(Component):
             "participantes_internos": 1, "participantes_externos": 1, "id_reuniao": 1
         })
         if isinstance(projection, dict) and projection:
+            is_exclusion = all(v in (0, False) for k, v in projection.items() if k != "_id")
+            if page_request is not None and not is_exclusion:
+                projection = {**projection, PAGINATION_TOKEN_FIELD: 1}
             pipeline.append({"$project": projection})
 
         return pipeline
 
-    def search_documents(self) -> Data:
+    def _prepare_search(self) -> Union[Data, Dict[str, Any]]:
+        """Parses the inputs, builds the pipeline and checks the result cache.
+
+        Returns a final Data (error or cache hit) or the context needed to run the aggregation.
+        """
         parsed_instruction = self._parse_search_instruction_from_data()
         if not parsed_instruction: 
             return Data(data={"results": [], "error": self.status or "Invalid search_instruction Data object."})
@@ -217,8 +868,16 @@ class MongoAtlasSearchWithFilters(Component):
         user_sectors = self._parse_user_sector()
         doc_status_to_filter = self.doc_status.strip() if self.doc_status else ""
 
+        # Resolve o alias a cada busca para acompanhar a troca blue/green do overwrite
+        collection_name = resolve_collection_name(self.mongodb_uri, self.db_name, self.collection_name)
+        collection = get_mongo_client(self.mongodb_uri)[self.db_name][collection_name]
+        field_types = self._index_field_types(collection)
+        page_request = self._page_request(parsed_instruction)
+
         try:
-            pipeline = self._build_search_pipeline(parsed_instruction, user_sectors, doc_status_to_filter)
+            pipeline = self._build_search_pipeline(
+                parsed_instruction, user_sectors, doc_status_to_filter, field_types, page_request
+            )
         except ValueError as e: 
              self.status = str(e)
              return Data(data={"results": [], "error": str(e)})
@@ -226,23 +885,252 @@ class MongoAtlasSearchWithFilters(Component):
         if not pipeline: 
             self.status = "Pipeline de busca não pôde ser construída."
             return Data(data={"results": [], "error": self.status})
-        
-        collection = MongoClient(self.mongodb_uri)[self.db_name][self.collection_name]
 
+        cache_ttl = int(getattr(self, "result_cache_ttl_seconds", 0) or 0)
+        cache = cache_key = watermark = None
+        collection_key = hashlib.sha256(
+            f"{self.mongodb_uri}|{self.db_name}|{collection_name}".encode("utf-8")
+        ).hexdigest()
+        if cache_ttl > 0:
+            cache = get_search_result_cache(max(1, int(getattr(self, "result_cache_max_entries", 256) or 1)))
+            budget = ""
+            if getattr(self, "streaming_cursor", False):
+                stream_state = self._new_stream_state()
+                budget = f"bytes={stream_state['max_bytes']}|tokens={stream_state['max_tokens']}"
+            cache_key = cache.make_key(collection_key, self.index_name, pipeline, budget)
+            invalidation = getattr(self, "result_cache_invalidation", "watermark") or "watermark"
+            try:
+                if invalidation == "watermark":
+                    watermark = cache.current_watermark(collection_key, collection, self.collection_name)
+                elif invalidation == "change_stream":
+                    cache.ensure_listener(collection_key, collection)
+            except Exception as e:
+                self.status = f"Cache de resultados desativado nesta execução: {e}"
+                cache = None
+            if cache is not None:
+                cached_results = cache.get(cache_key, collection_key, cache_ttl, watermark)
+                if cached_results is not None:
+                    output = {"results": cached_results, "pipeline_used": pipeline, "from_cache": True}
+                    if page_request is not None:
+                        output["results"], output["page"] = self._paginate(cached_results, page_request)
+                    self.status = f"Encontrados {len(output['results'])} resultado(s) (cache)."
+                    return Data(data=output)
+
+        return {
+            "collection": collection,
+            "pipeline": pipeline,
+            "cache": cache,
+            "cache_key": cache_key,
+            "collection_key": collection_key,
+            "watermark": watermark,
+            "page_request": page_request,
+            "collection_name": collection_name,
+        }
+
+    def _page_request(self, instruction: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Returns the pagination request (cursor and direction) or None when pagination is disabled."""
+        if not getattr(self, "enable_pagination", False):
+            return None
+        cursor = instruction.get("page_cursor", getattr(self, "page_cursor", "")) or ""
+        direction = instruction.get("page_direction", getattr(self, "page_direction", "next")) or "next"
+        if direction not in PAGE_DIRECTIONS:
+            self.status = f"Alerta: page_direction inválida '{direction}', usando 'next'."
+            direction = "next"
+        return {"cursor": str(cursor).strip(), "direction": direction, "page_size": 0}
+
+    def _paginate(
+        self, results: List[Dict[str, Any]], page_request: Dict[str, Any], truncated: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Trims the look-ahead document, restores display order and extracts the page cursors."""
+        page_size = page_request["page_size"]
+        has_more = truncated or (page_size > 0 and len(results) > page_size)
+        page = results[:page_size] if page_size > 0 else list(results)
+        going_back = page_request["direction"] == "previous"
+        if going_back:
+            # searchBefore devolve os documentos em ordem inversa
+            page.reverse()
+        tokens = [doc.pop(PAGINATION_TOKEN_FIELD, None) for doc in page]
+        first, last = (tokens[0], tokens[-1]) if tokens else (None, None)
+        return page, {
+            "cursor": page_request["cursor"] or None,
+            "direction": page_request["direction"],
+            "page_size": page_size,
+            "has_more": has_more,
+            # Ao voltar, sempre existe a página de onde se veio; ao avançar, a anterior existe se havia cursor
+            "next_cursor": last if has_more or going_back else None,
+            "previous_cursor": first if (has_more and going_back) or (page_request["cursor"] and not going_back) else None,
+        }
+
+    def _aggregate_options(self) -> Dict[str, Any]:
+        timeout = int(getattr(self, "query_timeout_seconds", 0) or 0)
+        return {"maxTimeMS": timeout * 1000} if timeout > 0 else {}
+
+    def _convert_result(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        doc["_id"] = str(doc["_id"])
+        if "score" in doc and doc["score"] is not None:
+            try:
+                doc["score"] = float(doc["score"])
+            except (ValueError, TypeError):
+                doc["score"] = 0.0 
+        else:
+            doc["score"] = 0.0
+        return doc
+
+    def _estimate_tokens(self, value: Any) -> int:
+        """Rough token estimate (~4 characters per token) over the string values of a document."""
+        if isinstance(value, str):
+            return (len(value) + 3) // 4
+        if isinstance(value, dict):
+            return sum(self._estimate_tokens(v) for v in value.values())
+        if isinstance(value, list):
+            return sum(self._estimate_tokens(v) for v in value)
+        return 0
+
+    def _new_stream_state(self) -> Dict[str, Any]:
+        return {
+            "results": [],
+            "bytes": 0,
+            "tokens": 0,
+            "max_bytes": max(0, int(getattr(self, "max_result_bytes", 0) or 0)),
+            "max_tokens": max(0, int(getattr(self, "max_result_tokens", 0) or 0)),
+            "truncated": False,
+        }
+
+    @staticmethod
+    def _raw_collection(collection):
+        """Same collection returning RawBSONDocument, so each result's size is known without re-encoding it."""
+        return collection.with_options(codec_options=collection.codec_options.with_options(document_class=RawBSONDocument))
+
+    def _accept_streamed(self, state: Dict[str, Any], raw: RawBSONDocument) -> bool:
+        """Decodes a streamed raw document and adds it to state; returns False once a budget would be exceeded."""
+        doc_bytes = len(raw.raw)
+        if state["max_bytes"] and state["bytes"] + doc_bytes > state["max_bytes"]:
+            state["truncated"] = True
+            return False
+        doc = bson.decode(raw.raw, codec_options=state["codec_options"])
+        doc_tokens = self._estimate_tokens(doc) if state["max_tokens"] else 0
+        if state["max_tokens"] and state["tokens"] + doc_tokens > state["max_tokens"]:
+            state["truncated"] = True
+            return False
+        state["bytes"] += doc_bytes
+        state["tokens"] += doc_tokens
+        state["results"].append(self._convert_result(doc))
+        return True
+
+    def _stream_sync(self, collection, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+        state = self._new_stream_state()
+        state["codec_options"] = collection.codec_options
+        batch_size = int(getattr(self, "cursor_batch_size", 0) or 0)
+        options = {**self._aggregate_options(), **({"batchSize": batch_size} if batch_size > 0 else {})}
+        with self._raw_collection(collection).aggregate(pipeline, **options) as cursor:
+            for doc in cursor:
+                if not self._accept_streamed(state, doc):
+                    break
+        return state
+
+    async def _stream_async(self, collection, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+        state = self._new_stream_state()
+        state["codec_options"] = collection.codec_options
+        batch_size = int(getattr(self, "cursor_batch_size", 0) or 0)
+        options = {**self._aggregate_options(), **({"batchSize": batch_size} if batch_size > 0 else {})}
+        cursor = self._raw_collection(collection).aggregate(pipeline, **options)
         try:
-            results = list(collection.aggregate(pipeline))
-            for doc in results:
-                doc["_id"] = str(doc["_id"])
-                if "score" in doc and doc["score"] is not None:
-                    try:
-                        doc["score"] = float(doc["score"])
-                    except (ValueError, TypeError):
-                        doc["score"] = 0.0 
+            async for doc in cursor:
+                if not self._accept_streamed(state, doc):
+                    break
+        finally:
+            await cursor.close()
+        return state
+
+    def _finish_search(self, context: Dict[str, Any], results: List[Dict[str, Any]], stream: Optional[Dict[str, Any]] = None) -> Data:
+        if stream is None:
+            results = [self._convert_result(doc) for doc in results]
+
+        output = {"results": results, "pipeline_used": context["pipeline"], "from_cache": False}
+        truncated = bool(stream and stream["truncated"])
+        # Resultados truncados dependem do orçamento, não só da pipeline; não entram no cache
+        if context["cache"] is not None and not truncated:
+            context["cache"].set(context["cache_key"], context["collection_key"], results, context["watermark"])
+        if context.get("page_request") is not None:
+            output["results"], output["page"] = self._paginate(results, context["page_request"], truncated)
+
+        self.status = f"Encontrados {len(output['results'])} resultado(s)."
+        if stream is not None:
+            output["bytes_transferred"] = stream["bytes"]
+            output["truncated"] = truncated
+            self.status += f" {stream['bytes'] / 1024:.1f} KB lidos do cursor."
+            if truncated:
+                self.status += " Leitura interrompida pelo orçamento de bytes/tokens."
+        return Data(data=output)
+
+    async def search_documents(self) -> Data:
+        profiling = bool(getattr(self, "enable_profiling", False))
+        started = time.perf_counter()
+        context = await asyncio.to_thread(self._prepare_search)
+        prepare_ms = (time.perf_counter() - started) * 1000
+        if isinstance(context, Data):
+            self._search_profile = {"prepare_ms": round(prepare_ms, 2), "from_cache": bool(context.data.get("from_cache"))}
+            return context
+
+        pipeline = context["pipeline"]
+        timeout = int(getattr(self, "query_timeout_seconds", 0) or 0) or None
+        streaming = bool(getattr(self, "streaming_cursor", False))
+        use_motor = getattr(self, "use_async_driver", True) and AsyncIOMotorClient is not None
+        try:
+            if use_motor:
+                collection = get_motor_client(self.mongodb_uri)[self.db_name][context["collection_name"]]
+                if streaming:
+                    fetch = self._stream_async(collection, pipeline)
                 else:
-                    doc["score"] = 0.0
-            
-            self.status = f"Encontrados {len(results)} resultado(s)."
-            return Data(data={"results": results, "pipeline_used": pipeline})
+                    fetch = collection.aggregate(pipeline, **self._aggregate_options()).to_list(length=None)
+            elif streaming:
+                fetch = asyncio.to_thread(self._stream_sync, context["collection"], pipeline)
+            else:
+                fetch = asyncio.to_thread(
+                    lambda: list(context["collection"].aggregate(pipeline, **self._aggregate_options()))
+                )
+            fetch_started = time.perf_counter()
+            fetched = await asyncio.wait_for(fetch, timeout=timeout)
+            round_trip_ms = (time.perf_counter() - fetch_started) * 1000
+            if streaming:
+                result = self._finish_search(context, fetched["results"], stream=fetched)
+            else:
+                result = self._finish_search(context, fetched)
+        except asyncio.TimeoutError:
+            self.status = f"Erro na busca: tempo limite de {timeout}s excedido."
+            self._search_profile = {"prepare_ms": round(prepare_ms, 2), "pipeline": pipeline, "error": self.status}
+            return Data(data={"results": [], "error": self.status, "pipeline_attempted": pipeline})
         except Exception as e:
             self.status = f"Erro na busca: {str(e)}"
-            return Data(data={"results": [], "error": str(e), "pipeline_attempted": pipeline})
\ No newline at end of file
+            self._search_profile = {"prepare_ms": round(prepare_ms, 2), "pipeline": pipeline, "error": str(e)}
+            return Data(data={"results": [], "error": str(e), "pipeline_attempted": pipeline})
+
+        self._search_profile = {
+            "pipeline": pipeline,
+            "driver": "motor" if use_motor else "pymongo",
+            "streaming": streaming,
+            "from_cache": False,
+            "prepare_ms": round(prepare_ms, 2),
+            "client_round_trip_ms": round(round_trip_ms, 2),
+            "results_returned": len(result.data["results"]),
+        }
+        if profiling:
+            # O explain usa a conexão síncrona; erros aqui não afetam o resultado da busca
+            try:
+                explain_started = time.perf_counter()
+                explain = await asyncio.to_thread(explain_aggregate, context["collection"], pipeline)
+                self._search_profile["explain_ms"] = round((time.perf_counter() - explain_started) * 1000, 2)
+                self._search_profile["explain_summary"] = summarize_explain(explain)
+                self._search_profile["explain"] = explain
+            except Exception as e:
+                self._search_profile["explain_error"] = str(e)
+        return result
+
+    async def profile_search(self) -> Data:
+        """Debug output with timings and the explain of the last search (runs the search if it has not run yet)."""
+        if getattr(self, "_search_profile", None) is None:
+            await self.search_documents()
+        profile = dict(self._search_profile or {})
+        if not getattr(self, "enable_profiling", False):
+            profile["note"] = "Ative 'Modo de Profiling' para incluir o explain da pipeline."
+        return Data(data=profile)
@@ -1,12 +1,38 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import sys
 import tempfile
+import threading
 import time
-from typing import Any, Dict, List, Optional
+import types
+import unicodedata
+import uuid
+from array import array
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
 
 import certifi
+import numpy as np
+from bson import json_util
+from bson.binary import VECTOR_SUBTYPE, Binary, BinaryVectorDtype
 from bson.objectid import ObjectId
 from pymongo import MongoClient
-from pymongo.operations import SearchIndexModel
+from pymongo.errors import OperationFailure
+from pymongo.operations import ReplaceOne, SearchIndexModel
 from langchain_community.vectorstores import MongoDBAtlasVectorSearch
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # Motor é opcional; sem ele a busca assíncrona roda o PyMongo em uma thread
+    AsyncIOMotorClient = None
 
 from langflow.base.vectorstores.model import LCVectorStoreComponent, check_cached_vector_store
 from langflow.helpers.data import docs_to_data
@@ -15,10 +41,992 @@ from langflow.io import (
     DropdownInput,
     HandleInput,
     IntInput,
+    MultilineInput,
+    Output,
     SecretStrInput,
     StrInput,
 )
 from langflow.schema import Data
+from langflow.schema.dataframe import DataFrame
+
+
+# --- Registro de MongoClient compartilhado pelos componentes Mongo (manter idêntico entre os arquivos) ---
+MONGO_MAX_POOL_SIZE = 50
+MONGO_MAX_IDLE_TIME_MS = 300_000
+MONGO_CLIENT_IDLE_TTL_SECONDS = 900
+MONGO_HEALTH_CHECK_INTERVAL_SECONDS = 30
+
+
+def _mongo_client_registry() -> Dict[str, Any]:
+    """Estado por processo que sobrevive às re-execuções do código do componente pelo Langflow."""
+    holder = sys.modules.setdefault("_langflow_shared_registries", types.ModuleType("_langflow_shared_registries"))
+    if not hasattr(holder, "mongo_clients"):
+        holder.mongo_clients = {
+            "lock": threading.Lock(),
+            "clients": {},
+            "metrics": {"hits": 0, "misses": 0, "evictions": 0, "health_check_failures": 0},
+        }
+    return holder.mongo_clients
+
+
+def _close_registry_entry(entry: Dict[str, Any]) -> None:
+    try:
+        entry["client"].close()
+    finally:
+        if entry.get("cert_path"):
+            try:
+                os.remove(entry["cert_path"])
+            except OSError:
+                pass
+
+
+def _evict_idle_clients(registry: Dict[str, Any], now: float, keep_key: str) -> None:
+    """Fecha clientes (PyMongo e Motor) ociosos além do TTL e os aposentados pelo health check. Chamar com o lock."""
+    for clients in (registry["clients"], registry.setdefault("motor_clients", {})):
+        for other_key, other in list(clients.items()):
+            if other_key != keep_key and now - other["last_used"] > MONGO_CLIENT_IDLE_TTL_SECONDS:
+                _close_registry_entry(clients.pop(other_key))
+                registry["metrics"]["evictions"] += 1
+    retired = registry.setdefault("retired", [])
+    for old in [r for r in retired if now - r["retired_at"] > MONGO_CLIENT_IDLE_TTL_SECONDS]:
+        retired.remove(old)
+        _close_registry_entry(old)
+
+
+def _mongo_client_options(tls: bool, client_cert: Optional[str]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Opções do pool e de TLS; o certificado mTLS vai para um arquivo temporário removido ao fechar o cliente."""
+    options: Dict[str, Any] = {"maxPoolSize": MONGO_MAX_POOL_SIZE, "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS}
+    cert_path = None
+    if tls:
+        options.update(tls=True, tlsCAFile=certifi.where())
+        if client_cert:
+            with tempfile.NamedTemporaryFile(delete=False) as tmp:
+                tmp.write(client_cert.encode("utf-8"))
+                cert_path = tmp.name
+            options["tlsCertificateKeyFile"] = cert_path
+    return options, cert_path
+
+
+def _mongo_client_key(uri: str, tls: bool, client_cert: Optional[str]) -> str:
+    cert_hash = hashlib.sha256(client_cert.encode("utf-8")).hexdigest() if client_cert else ""
+    return f"{uri}|tls={tls}|{cert_hash}"
+
+
+def get_mongo_client(uri: str, tls: bool = False, client_cert: Optional[str] = None) -> MongoClient:
+    """
+    Devolve um MongoClient compartilhado por URI e opções de TLS/mTLS.
+
+    Clientes ociosos há mais de MONGO_CLIENT_IDLE_TTL_SECONDS são fechados, e um ping
+    periódico substitui clientes que deixaram de responder. O cliente substituído sai do
+    registro na hora, mas só é fechado após o TTL, pois outras threads podem estar usando-o.
+    """
+    registry = _mongo_client_registry()
+    key = _mongo_client_key(uri, tls, client_cert)
+    now = time.monotonic()
+
+    with registry["lock"]:
+        _evict_idle_clients(registry, now, key)
+        entry = registry["clients"].get(key)
+        if entry is not None:
+            entry["last_used"] = now
+
+    # O ping fica fora do lock para não bloquear os demais componentes
+    if entry is not None and now - entry["last_health_check"] > MONGO_HEALTH_CHECK_INTERVAL_SECONDS:
+        try:
+            entry["client"].admin.command("ping")
+            entry["last_health_check"] = now
+        except Exception:
+            with registry["lock"]:
+                registry["metrics"]["health_check_failures"] += 1
+                if registry["clients"].get(key) is entry:
+                    # Novas chamadas recebem outro cliente; este é fechado depois, na limpeza por TTL
+                    entry["retired_at"] = now
+                    registry.setdefault("retired", []).append(registry["clients"].pop(key))
+
+    with registry["lock"]:
+        entry = registry["clients"].get(key)
+        if entry is not None:
+            registry["metrics"]["hits"] += 1
+            return entry["client"]
+
+        registry["metrics"]["misses"] += 1
+        options, cert_path = _mongo_client_options(tls, client_cert)
+        registry["clients"][key] = {
+            "client": MongoClient(uri, **options),
+            "cert_path": cert_path,
+            "last_used": now,
+            "last_health_check": now,
+        }
+        return registry["clients"][key]["client"]
+
+
+def mongo_client_metrics() -> Dict[str, Any]:
+    """Métricas do registro de clientes: hits, misses, evicções, falhas de health check e clientes abertos."""
+    registry = _mongo_client_registry()
+    with registry["lock"]:
+        return {
+            **registry["metrics"],
+            "open_clients": len(registry["clients"]),
+            "open_motor_clients": len(registry.get("motor_clients", {})),
+            "retired_clients": len(registry.get("retired", [])),
+        }
+
+
+# Coleções lógicas podem apontar para uma coleção física diferente (troca blue/green do overwrite)
+COLLECTION_ALIASES = "_collection_aliases"
+COLLECTION_ALIAS_TTL_SECONDS = 5
+
+
+def resolve_collection_name(
+    uri: str, db_name: str, name: str, tls: bool = False, client_cert: Optional[str] = None
+) -> str:
+    """Coleção física por trás de 'name'; sem alias cadastrado em _collection_aliases, é o próprio nome."""
+    aliases = _mongo_client_registry().setdefault("aliases", {})
+    key = f"{_mongo_client_key(uri, tls, client_cert)}|{db_name}|{name}"
+    cached = aliases.get(key)
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < COLLECTION_ALIAS_TTL_SECONDS:
+        return cached[1]
+    doc = get_mongo_client(uri, tls, client_cert)[db_name][COLLECTION_ALIASES].find_one({"_id": name}, {"target": 1})
+    target = (doc or {}).get("target") or name
+    aliases[key] = (now, target)
+    return target
+
+
+# --- fim do registro de MongoClient ---
+
+
+def _shared_registry(name: str) -> Dict[str, Any]:
+    """Registro por processo que sobrevive às re-execuções do código do componente pelo Langflow."""
+    holder = sys.modules.setdefault("_langflow_shared_registries", types.ModuleType("_langflow_shared_registries"))
+    if not hasattr(holder, name):
+        setattr(holder, name, {})
+    return getattr(holder, name)
+
+
+def get_motor_client(uri: str, tls: bool = False, client_cert: Optional[str] = None):
+    """Cliente Motor compartilhado por URI/TLS e por event loop (clientes Motor ficam presos ao loop que os criou).
+
+    Fica no mesmo registro dos clientes PyMongo: entra na evicção por ociosidade e nas métricas, e o cliente
+    de um loop encerrado é fechado (removendo o certificado temporário) em vez de abandonado.
+    """
+    registry = _mongo_client_registry()
+    loop = asyncio.get_running_loop()
+    key = f"{_mongo_client_key(uri, tls, client_cert)}|loop={id(loop)}"
+    now = time.monotonic()
+    with registry["lock"]:
+        _evict_idle_clients(registry, now, key)
+        motor_clients = registry["motor_clients"]
+        for other_key, other in list(motor_clients.items()):
+            # Um loop encerrado não volta a rodar (e um id de loop pode ser reaproveitado): fecha o cliente preso a ele
+            if other["loop"].is_closed() or (other_key == key and other["loop"] is not loop):
+                _close_registry_entry(motor_clients.pop(other_key))
+                registry["metrics"]["evictions"] += 1
+        entry = motor_clients.get(key)
+        if entry is not None:
+            entry["last_used"] = now
+            registry["metrics"]["hits"] += 1
+            return entry["client"]
+
+        registry["metrics"]["misses"] += 1
+        options, cert_path = _mongo_client_options(tls, client_cert)
+        motor_clients[key] = {
+            "client": AsyncIOMotorClient(uri, io_loop=loop, **options),
+            "cert_path": cert_path,
+            "loop": loop,
+            "last_used": now,
+            "last_health_check": now,
+        }
+        return motor_clients[key]["client"]
+
+
+# Espera máxima pelo cálculo de outro pedido da mesma consulta; depois disso o pedido calcula sozinho
+QUERY_EMBEDDING_WAIT_SECONDS = 30
+
+
+class QueryEmbeddingCache:
+    """Cache de embeddings de consultas: LRU em memória e camada opcional em SQLite com vetores float32 empacotados.
+
+    Pedidos simultâneos da mesma chave (ex.: os dois ramos vetoriais de um turno do chat) compartilham uma
+    única chamada ao modelo de embedding, esperando por ela no máximo QUERY_EMBEDDING_WAIT_SECONDS.
+    """
+
+    def __init__(self, max_entries: int = 1000, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._async_inflight: Dict[Any, asyncio.Future] = {}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, vector BLOB, created_at REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model_key: str, text: str) -> str:
+        # Normaliza unicode e espaços; maiúsculas/minúsculas são mantidas porque alteram o embedding
+        text_norm = " ".join(unicodedata.normalize("NFKC", str(text)).split())
+        return f"{model_key}|{hashlib.sha256(text_norm.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            packed = self._memory.get(key)
+            if packed is None and self._db is not None:
+                row = self._db.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    packed = bytes(row[0])
+                    self._remember(key, packed)
+            if packed is None:
+                return None
+            self._memory.move_to_end(key)
+        return array("f", packed).tolist()
+
+    def set(self, key: str, vector: List[float]) -> None:
+        packed = array("f", vector).tobytes()
+        with self._lock:
+            self._remember(key, packed)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                    (key, packed, time.time()),
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, packed: bytes) -> None:
+        self._memory[key] = packed
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_or_compute(self, key: str, compute: Callable[[], List[float]]) -> Tuple[List[float], str]:
+        """Retorna (vetor, origem), com origem em 'hit', 'shared' ou 'miss'."""
+        vector = self.get(key)
+        if vector is not None:
+            return vector, "hit"
+        with self._lock:
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight[key] = threading.Event()
+        # Se o dono travar (ex.: modelo sem timeout), calcula localmente após a espera
+        if not owner and event.wait(QUERY_EMBEDDING_WAIT_SECONDS):
+            vector = self.get(key)
+            if vector is not None:
+                return vector, "shared"
+        try:
+            vector = compute()
+            self.set(key, vector)
+            return vector, "miss"
+        finally:
+            if owner:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[List[float]]]) -> Tuple[List[float], str]:
+        vector = self.get(key)
+        if vector is not None:
+            return vector, "hit"
+        loop = asyncio.get_running_loop()
+        inflight_key = (id(loop), key)
+        with self._lock:
+            future = self._async_inflight.get(inflight_key)
+            owner = future is None
+            if owner:
+                future = self._async_inflight[inflight_key] = loop.create_future()
+        if not owner:
+            # O dono publica None se falhar ou for cancelado; nesse caso (ou se demorar demais) esta chamada calcula sozinha
+            try:
+                shared = await asyncio.wait_for(asyncio.shield(future), QUERY_EMBEDDING_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                shared = None
+            if shared is not None:
+                return list(shared), "shared"
+        try:
+            vector = await compute()
+            self.set(key, vector)
+            if owner:
+                future.set_result(vector)
+            return vector, "miss"
+        finally:
+            if owner:
+                with self._lock:
+                    self._async_inflight.pop(inflight_key, None)
+                if not future.done():
+                    future.set_result(None)
+
+
+def get_query_embedding_cache(max_entries: int, db_path: Optional[str]) -> QueryEmbeddingCache:
+    caches = _shared_registry("query_embedding_caches")
+    key = f"{max_entries}|{db_path or ''}"
+    if key not in caches:
+        caches[key] = QueryEmbeddingCache(max_entries=max_entries, db_path=db_path)
+    return caches[key]
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Envolve o handle de embedding: consultas passam pelo cache, documentos vão direto ao modelo."""
+
+    def __init__(self, embedding: Embeddings, cache: QueryEmbeddingCache, model_key: str):
+        self.embedding = embedding
+        self.cache = cache
+        self.model_key = model_key
+        self.stats = {"hit": 0, "shared": 0, "miss": 0}
+
+    def embed_query(self, text: str) -> List[float]:
+        vector, origin = self.cache.get_or_compute(
+            self.cache.make_key(self.model_key, text), lambda: self.embedding.embed_query(text)
+        )
+        self.stats[origin] += 1
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector, origin = await self.cache.aget_or_compute(
+            self.cache.make_key(self.model_key, text), lambda: self.embedding.aembed_query(text)
+        )
+        self.stats[origin] += 1
+        return vector
+
+    def _cached_queries(self, texts: List[str]) -> Tuple[List[str], List[Optional[List[float]]], List[int]]:
+        keys = [self.cache.make_key(self.model_key, text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self.stats["hit"] += len(texts) - len(missing)
+        self.stats["miss"] += len(missing)
+        return keys, vectors, missing
+
+    def _store_queries(self, keys: List[str], vectors: List[Any], missing: List[int], computed: List[List[float]]) -> List[List[float]]:
+        for i, vector in zip(missing, computed):
+            self.cache.set(keys[i], vector)
+            vectors[i] = vector
+        return vectors
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Várias consultas de uma vez: as que faltam no cache vão ao modelo numa única chamada em lote."""
+        keys, vectors, missing = self._cached_queries(texts)
+        computed = self.embedding.embed_documents([texts[i] for i in missing]) if missing else []
+        return self._store_queries(keys, vectors, missing, computed)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._cached_queries(texts)
+        computed = await self.embedding.aembed_documents([texts[i] for i in missing]) if missing else []
+        return self._store_queries(keys, vectors, missing, computed)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embedding.aembed_documents(texts)
+
+
+# --- Redução de dimensionalidade (truncamento Matryoshka ou projeção PCA) ---
+class DimensionReduction:
+    """Projeção aplicada igualmente na ingestão e na consulta.
+
+    'matryoshka' mantém as primeiras dimensões (modelos treinados para isso, ex.: text-embedding-3-*);
+    'pca' projeta nos componentes principais ajustados sobre uma amostra dos embeddings da coleção.
+    """
+
+    def __init__(self, method: str, dimensions: int, mean: Optional[np.ndarray] = None, components: Optional[np.ndarray] = None):
+        self.method = method
+        self.dimensions = dimensions
+        self.mean = mean
+        self.components = components
+        digest = hashlib.sha256(components.tobytes()).hexdigest()[:12] if components is not None else ""
+        self.signature = f"{method}:{dimensions}:{digest}"
+
+    def apply(self, vectors: Any, normalize: bool = True) -> np.ndarray:
+        """Reduz uma matriz (n x D) de embeddings; com normalize, as linhas voltam a ter norma 1."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if self.method == "pca":
+            if vectors.shape[1] != self.components.shape[1]:
+                raise ValueError(
+                    f"A projeção PCA espera embeddings com {self.components.shape[1]} dimensões, recebeu {vectors.shape[1]}."
+                )
+            reduced = (vectors - self.mean) @ self.components.T
+        else:
+            if vectors.shape[1] < self.dimensions:
+                raise ValueError(f"Embeddings com {vectors.shape[1]} dimensões não podem ser truncados para {self.dimensions}.")
+            reduced = vectors[:, :self.dimensions]
+        if normalize:
+            norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+            reduced = reduced / np.where(norms == 0, 1, norms)
+        return reduced.astype(np.float32)
+
+    def save(self, path: str, explained_variance: Optional[np.ndarray] = None) -> None:
+        np.savez(
+            path,
+            method=self.method,
+            dimensions=self.dimensions,
+            mean=self.mean if self.mean is not None else np.zeros(0, np.float32),
+            components=self.components if self.components is not None else np.zeros((0, 0), np.float32),
+            explained_variance=explained_variance if explained_variance is not None else np.zeros(0, np.float32),
+        )
+
+
+def fit_pca_reduction(vectors: Any, dimensions: int) -> Tuple[DimensionReduction, np.ndarray]:
+    """Ajusta a PCA sobre uma amostra (n x D); retorna a projeção e a variância explicada acumulada por dimensão."""
+    sample = np.asarray(vectors, dtype=np.float32)
+    if dimensions > min(sample.shape):
+        raise ValueError(f"A amostra ({sample.shape[0]} x {sample.shape[1]}) não permite {dimensions} componentes.")
+    mean = sample.mean(axis=0)
+    _, singular_values, vt = np.linalg.svd(sample - mean, full_matrices=False)
+    variance = singular_values ** 2
+    cumulative = np.cumsum(variance) / variance.sum()
+    return DimensionReduction("pca", dimensions, mean, vt[:dimensions].astype(np.float32)), cumulative.astype(np.float32)
+
+
+def load_dimension_reduction(path: str) -> DimensionReduction:
+    """Lê um arquivo .npz de scripts/fit_dimension_reduction.py, reaproveitando a leitura enquanto ele não muda."""
+    cache = _shared_registry("dimension_reductions")
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if key not in cache:
+        with np.load(path) as data:
+            method = str(data["method"])
+            cache[key] = DimensionReduction(
+                method,
+                int(data["dimensions"]),
+                data["mean"].astype(np.float32) if method == "pca" else None,
+                data["components"].astype(np.float32) if method == "pca" else None,
+            )
+    return cache[key]
+
+
+class ReducedEmbeddings(Embeddings):
+    """Envolve o handle de embedding aplicando a mesma redução a documentos e consultas."""
+
+    def __init__(self, embedding: Embeddings, reduction: DimensionReduction, normalize: bool = True):
+        self.embedding = embedding
+        self.reduction = reduction
+        self.normalize = normalize
+
+    def _reduce(self, vectors: List[List[float]]) -> List[List[float]]:
+        if not len(vectors):
+            return []
+        return self.reduction.apply(vectors, self.normalize).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._reduce([self.embedding.embed_query(text)])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self._reduce([await self.embedding.aembed_query(text)])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._reduce(self.embedding.embed_documents(texts))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._reduce(await self.embedding.aembed_documents(texts))
+
+
+# Ingestão em lotes: _id derivado do conteúdo permite retomar sem reprocessar o que já foi gravado
+INGEST_CHECKPOINT_COLLECTION = "_ingest_checkpoints"
+# Versão por coleção lógica, lida pelo cache de resultados do Mongo Atlas Search (ver WATERMARK_CACHE_SECONDS lá)
+INGEST_WATERMARK_COLLECTION = "_ingest_watermarks"
+
+
+def bump_ingest_watermark(db, collection_name: str) -> None:
+    db[INGEST_WATERMARK_COLLECTION].update_one(
+        {"_id": collection_name}, {"$inc": {"version": 1}, "$set": {"updated_at": time.time()}}, upsert=True
+    )
+    # Sinal no processo: o cache do Atlas Search descarta na hora o watermark que guardou para esta coleção
+    local = _shared_registry("ingest_watermarks")
+    local[f"{db.name}|{collection_name}"] = local.get(f"{db.name}|{collection_name}", 0) + 1
+
+
+# Intervalo mínimo entre varreduras de coleções substituídas feitas pelo build (cobre timers perdidos num restart)
+RETIRED_COLLECTION_SWEEP_SECONDS = 60
+
+
+def drop_retired_collections(db, logical_name: str) -> List[str]:
+    """Remove as coleções substituídas pelas trocas blue/green de 'logical_name' cuja carência já passou."""
+    alias = db[COLLECTION_ALIASES].find_one({"_id": logical_name}, {"target": 1, "retired": 1}) or {}
+    now = time.time()
+    expired = [
+        entry["name"]
+        for entry in alias.get("retired", [])
+        if now >= entry["drop_after"] and entry["name"] != alias.get("target")
+    ]
+    for name in expired:
+        db.drop_collection(name)
+    if expired:
+        db[COLLECTION_ALIASES].update_one({"_id": logical_name}, {"$pull": {"retired": {"name": {"$in": expired}}}})
+    return expired
+
+
+def _schedule_retired_drop(
+    uri: str, db_name: str, logical_name: str, delay: float, tls: bool = False, client_cert: Optional[str] = None
+) -> None:
+    """Agenda em segundo plano o drop das coleções substituídas, sem segurar a execução do componente."""
+    registry = _shared_registry("retired_collections")
+
+    def run() -> None:
+        try:
+            drop_retired_collections(get_mongo_client(uri, tls, client_cert)[db_name], logical_name)
+        except Exception as e:
+            registry.setdefault("errors", {})[f"{db_name}|{logical_name}"] = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {e}"
+
+    timer = threading.Timer(delay, run)
+    timer.name = f"retired-collections-drop:{logical_name}"
+    timer.daemon = True
+    timer.start()
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def content_document_id(text: str, metadata: Dict[str, Any]) -> str:
+    """Id determinístico do documento a partir do texto e dos metadados."""
+    payload = json.dumps({"text": text, "metadata": metadata}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RateLimiter:
+    """Espaça chamadas para no máximo rate_per_minute por minuto (0 = sem limite), entre threads."""
+
+    def __init__(self, rate_per_minute: int = 0):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Embeddings podem ser gravados como array BSON de doubles ou como BSON binary vector (subtipo 9)
+VECTOR_STORAGE_BY_QUANTIZATION = {None: "float32", "": "float32", "scalar": "int8", "binary": "packed_bit"}
+
+
+def encode_vector(vector: List[float], storage: str) -> Binary:
+    """Empacota o embedding como binary vector float32, int8 (escala por vetor) ou packed bit (sinal de cada dimensão)."""
+    values = np.asarray(vector, dtype=np.float32)
+    if storage == "int8":
+        # A escala por vetor preserva o cosseno, única métrica aceita para int8 neste componente
+        peak = float(np.abs(values).max()) or 1.0
+        return Binary.from_vector(np.round(values / peak * 127).astype(np.int8).tolist(), BinaryVectorDtype.INT8)
+    if storage == "packed_bit":
+        return Binary.from_vector(
+            np.packbits(values > 0).tolist(), BinaryVectorDtype.PACKED_BIT, padding=(-len(values)) % 8
+        )
+    return Binary.from_vector(values.tolist(), BinaryVectorDtype.FLOAT32)
+
+
+def decode_vector(value: Any) -> Any:
+    """Converte um binary vector de volta em lista de floats (bits viram -1/1); outros valores passam inalterados."""
+    if not isinstance(value, Binary) or value.subtype != VECTOR_SUBTYPE:
+        return value
+    vector = value.as_vector()
+    if vector.dtype == BinaryVectorDtype.PACKED_BIT:
+        bits = np.unpackbits(np.asarray(vector.data, dtype=np.uint8))
+        return (bits[:len(bits) - vector.padding].astype(np.float32) * 2 - 1).tolist()
+    return [float(x) for x in vector.data]
+
+
+def mmr_select(query_vector: Any, candidates: Any, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """Índices dos candidatos escolhidos por Maximal Marginal Relevance, na ordem de seleção.
+
+    Usa similaridade de cosseno. A matriz candidato x candidato é calculada uma única vez; a cada passo
+    só é atualizado o vetor com a maior similaridade de cada candidato aos já selecionados.
+    """
+    vectors = np.asarray(candidates, dtype=np.float32)
+    if k <= 0 or not len(vectors):
+        return []
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1)
+    relevance = vectors @ query
+    pairwise = vectors @ vectors.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    max_similarity = pairwise[first].copy()
+    available = np.ones(len(vectors), dtype=bool)
+    available[first] = False
+    for _ in range(min(k, len(vectors)) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        available[chosen] = False
+        np.maximum(max_similarity, pairwise[chosen], out=max_similarity)
+    return selected
+
+
+MAX_QUERY_VARIANTS = 8
+
+
+def merge_search_results(result_lists: List[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """Une os resultados de várias consultas por _id, mantendo o maior score, e devolve os 'limit' melhores."""
+    best: Dict[Any, Dict[str, Any]] = {}
+    for results in result_lists:
+        for res in results:
+            doc_id = res.get("_id", id(res))
+            current = best.get(doc_id)
+            if current is None or (res.get("score") or 0) > (current.get("score") or 0):
+                best[doc_id] = res
+    return sorted(best.values(), key=lambda res: res.get("score") or 0, reverse=True)[:limit]
+
+
+# --- Índice vetorial local em memory-map (desenvolvimento offline e setores quentes) ---
+LOCAL_INDEX_SCAN_ROWS = 65_536
+# Índices substituídos por uma nova exportação são fechados após este tempo (buscas em andamento ainda os usam)
+LOCAL_INDEX_CLOSE_GRACE_SECONDS = 60
+# Cada exportação vai para um subdiretório v-*; este arquivo aponta a versão atual
+LOCAL_INDEX_POINTER_FILE = "CURRENT"
+
+
+def local_index_version_dir(path: str) -> str:
+    """Diretório da versão atual do índice em 'path' (o próprio 'path' no layout antigo, sem versões)."""
+    pointer = os.path.join(path, LOCAL_INDEX_POINTER_FILE)
+    if os.path.exists(pointer):
+        with open(pointer, encoding="utf-8") as f:
+            return os.path.join(path, f.read().strip())
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        return path
+    raise FileNotFoundError(f"Índice vetorial local não encontrado em '{path}'.")
+
+
+def _remove_retired_local_index_versions(path: str) -> None:
+    """Apaga as versões substituídas há mais de LOCAL_INDEX_CLOSE_GRACE_SECONDS (o mtime marca a substituição).
+
+    Uma versão ainda aberta em outro processo (no Windows, arquivos mapeados não podem ser apagados) fica para
+    a próxima limpeza.
+    """
+    current = os.path.basename(local_index_version_dir(path))
+    now = time.time()
+    for name in os.listdir(path):
+        version_dir = os.path.join(path, name)
+        if (
+            name.startswith("v-")
+            and name != current
+            and os.path.isdir(version_dir)
+            and now - os.path.getmtime(version_dir) > LOCAL_INDEX_CLOSE_GRACE_SECONDS
+        ):
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+
+def _vector_scores(similarity: str, dots: np.ndarray, sq_norms: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Mesma normalização de score do $vectorSearch (Lucene) para cada métrica."""
+    if similarity == "euclidean":
+        sq_dist = np.maximum(sq_norms - 2 * dots + float(query @ query), 0.0)
+        return 1.0 / (1.0 + sq_dist)
+    # cosine usa vetores normalizados na exportação; dotProduct assume embeddings normalizados, como o Atlas
+    return (1.0 + dots) / 2.0
+
+
+class LocalVectorIndex:
+    """Matriz de embeddings float32 (ou int8 com escala por linha) em memory-map, com metadados em arquivos ao lado.
+
+    Arquivos da versão (ver local_index_version_dir): manifest.json, vectors.f32|vectors.i8, scales.f32 (int8),
+    sq_norms.f32, metadata.jsonl + metadata.idx (offsets) e sectors.json (setor -> linhas).
+    Mantém metadata.jsonl aberto: feche com close() ou use como context manager.
+    """
+
+    def __init__(self, path: str):
+        self.path = path = local_index_version_dir(path)
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        count, dim = self.manifest["count"], self.manifest["dimensions"]
+        self.similarity = self.manifest.get("similarity", "cosine")
+        self.quantization = self.manifest.get("quantization", "float32")
+        vector_file = "vectors.i8" if self.quantization == "int8" else "vectors.f32"
+        dtype = np.int8 if self.quantization == "int8" else np.float32
+        self.vectors = np.memmap(os.path.join(path, vector_file), dtype=dtype, mode="r", shape=(count, dim)) if count else np.zeros((0, dim), dtype)
+        self.scales = np.fromfile(os.path.join(path, "scales.f32"), dtype=np.float32) if self.quantization == "int8" else None
+        self.sq_norms = np.fromfile(os.path.join(path, "sq_norms.f32"), dtype=np.float32)
+        self.offsets = np.fromfile(os.path.join(path, "metadata.idx"), dtype=np.int64)
+        with open(os.path.join(path, "sectors.json"), encoding="utf-8") as f:
+            self.sector_rows = {sector: np.asarray(rows, dtype=np.int64) for sector, rows in json.load(f).items()}
+        self._metadata_lock = threading.Lock()
+        self._metadata_file = open(os.path.join(path, "metadata.jsonl"), "rb")
+
+    def close(self) -> None:
+        with self._metadata_lock:
+            self._metadata_file.close()
+
+    def __enter__(self) -> "LocalVectorIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def covers(self, setores: Optional[List[str]]) -> bool:
+        exported = self.manifest.get("setores")
+        return exported is None or (bool(setores) and set(setores) <= set(exported))
+
+    def _dots(self, rows: Optional[np.ndarray], query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Produtos internos com a consulta, em blocos para limitar a memória; retorna (linhas, dots)."""
+        if rows is None:
+            rows = np.arange(self.vectors.shape[0])
+        dots = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), LOCAL_INDEX_SCAN_ROWS):
+            block_rows = rows[start:start + LOCAL_INDEX_SCAN_ROWS]
+            # Linhas contíguas viram uma fatia do memory-map (leitura sequencial, sem cópia por fancy indexing)
+            contiguous = block_rows[-1] - block_rows[0] + 1 == len(block_rows)
+            block = self.vectors[block_rows[0]:block_rows[-1] + 1] if contiguous else self.vectors[block_rows]
+            block_dots = np.asarray(block, dtype=np.float32) @ query
+            if self.scales is not None:
+                block_dots *= self.scales[block_rows]
+            dots[start:start + len(block_rows)] = block_dots
+        return rows, dots
+
+    def search(self, query_vector: List[float], k: int, setores: Optional[List[str]] = None) -> List[Tuple[Dict[str, Any], float]]:
+        rows, scores = self.search_rows(query_vector, k, setores)
+        return [(self.metadata(int(row)), float(score)) for row, score in zip(rows, scores)]
+
+    def search_rows(self, query_vector: List[float], k: int, setores: Optional[List[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Linhas dos k mais similares e seus scores, em ordem decrescente."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        if self.similarity == "cosine":
+            norm = float(np.linalg.norm(query))
+            query = query / norm if norm else query
+        rows = None
+        if setores:
+            selected = [self.sector_rows[s] for s in setores if s in self.sector_rows]
+            if not selected:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            rows = np.unique(np.concatenate(selected))
+        rows, dots = self._dots(rows, query)
+        if not len(rows) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = _vector_scores(self.similarity, dots, self.sq_norms[rows], query)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top], scores[top]
+
+    def row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Embeddings das linhas em float32 (int8 já reescalado)."""
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][:, None]
+        return vectors
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        with self._metadata_lock:
+            self._metadata_file.seek(int(self.offsets[row]))
+            return json_util.loads(self._metadata_file.readline())
+
+
+def load_local_vector_index(path: str) -> LocalVectorIndex:
+    """Índice local compartilhado no processo, em cache pela versão atual (recarrega após nova exportação).
+
+    O índice substituído é fechado só depois de LOCAL_INDEX_CLOSE_GRACE_SECONDS, pois buscas em andamento
+    ainda podem ler seus metadados; depois disso os diretórios das versões substituídas são apagados.
+    """
+    registry = _shared_registry("local_vector_indexes")
+    version_dir = local_index_version_dir(path)
+    # No layout antigo o diretório não muda entre exportações: o mtime do manifest diferencia as versões
+    version = (version_dir, os.path.getmtime(os.path.join(version_dir, "manifest.json")))
+    now = time.time()
+    with registry.setdefault("lock", threading.Lock()):
+        retired = registry.setdefault("retired", [])
+        expired = [r for r in retired if now - r[0] > LOCAL_INDEX_CLOSE_GRACE_SECONDS]
+        for old in expired:
+            retired.remove(old)
+            old[1].close()
+        indexes = registry.setdefault("indexes", {})
+        entry = indexes.get(path)
+        if entry is None or entry[0] != version:
+            if entry is not None:
+                retired.append((now, entry[1]))
+            entry = (version, LocalVectorIndex(version_dir))
+            indexes[path] = entry
+    if expired and version_dir != path:
+        _remove_retired_local_index_versions(path)
+    return entry[1]
+
+
+def _refresh_local_index(path: str, export: Callable[[], Dict[str, Any]]) -> None:
+    """Exporta o índice local em segundo plano; no máximo uma exportação por diretório."""
+    registry = _shared_registry("local_vector_indexes")
+    refreshing = registry.setdefault("refreshing", set())
+    with registry.setdefault("lock", threading.Lock()):
+        if path in refreshing:
+            return
+        refreshing.add(path)
+
+    def run() -> None:
+        try:
+            export()
+        except Exception as e:
+            registry.setdefault("errors", {})[path] = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {e}"
+        finally:
+            with registry["lock"]:
+                refreshing.discard(path)
+
+    threading.Thread(target=run, name=f"local-index-export:{os.path.basename(path)}", daemon=True).start()
+
+
+def export_local_vector_index(
+    collection,
+    path: str,
+    embedding_key: str = "embedding",
+    text_key: str = "text",
+    similarity: str = "cosine",
+    quantization: str = "float32",
+    mongo_filter: Optional[Dict[str, Any]] = None,
+    setores: Optional[List[str]] = None,
+    batch_size: int = 1000,
+) -> Dict[str, Any]:
+    """Exporta os embeddings da coleção para um LocalVectorIndex em 'path', lendo em lotes.
+
+    Cada exportação grava uma nova versão (path/v-*) e só no final troca o ponteiro path/CURRENT com os.replace,
+    para leitores nunca verem um índice parcial. Nenhum diretório em uso é renomeado ou apagado (no Windows,
+    arquivos em memory-map não podem ser movidos); as versões substituídas são apagadas depois da carência.
+    """
+    os.makedirs(path, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=path)
+    vector_file = "vectors.i8" if quantization == "int8" else "vectors.f32"
+    count, dimensions = 0, None
+    sector_rows: Dict[str, List[int]] = {}
+    query = dict(mongo_filter or {})
+    if setores:
+        query["setores"] = {"$in": setores}
+    with open(os.path.join(tmp_dir, vector_file), "wb") as vectors_out, \
+            open(os.path.join(tmp_dir, "scales.f32"), "wb") as scales_out, \
+            open(os.path.join(tmp_dir, "sq_norms.f32"), "wb") as norms_out, \
+            open(os.path.join(tmp_dir, "metadata.jsonl"), "wb") as meta_out, \
+            open(os.path.join(tmp_dir, "metadata.idx"), "wb") as index_out:
+        cursor = collection.find({**query, embedding_key: {"$exists": True}}, batch_size=batch_size)
+        for batch in _batched(cursor, batch_size):
+            matrix = np.asarray([decode_vector(doc.pop(embedding_key)) for doc in batch], dtype=np.float32)
+            if dimensions is None:
+                dimensions = matrix.shape[1]
+            if similarity == "cosine":
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix = matrix / np.where(norms == 0, 1.0, norms)
+            np.einsum("ij,ij->i", matrix, matrix).astype(np.float32).tofile(norms_out)
+            if quantization == "int8":
+                scales = np.abs(matrix).max(axis=1) / 127.0
+                scales[scales == 0] = 1.0
+                np.round(matrix / scales[:, None]).astype(np.int8).tofile(vectors_out)
+                scales.astype(np.float32).tofile(scales_out)
+            else:
+                matrix.astype(np.float32).tofile(vectors_out)
+            offsets = []
+            for doc in batch:
+                offsets.append(meta_out.tell())
+                doc_setores = doc.get("setores") or []
+                for sector in (doc_setores if isinstance(doc_setores, list) else [doc_setores]):
+                    sector_rows.setdefault(str(sector), []).append(count)
+                meta_out.write(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS).encode("utf-8") + b"\n")
+                count += 1
+            np.asarray(offsets, dtype=np.int64).tofile(index_out)
+
+    manifest = {
+        "count": count,
+        "dimensions": dimensions or 0,
+        "similarity": similarity,
+        "quantization": quantization,
+        "embedding_key": embedding_key,
+        "text_key": text_key,
+        "setores": setores or None,
+        "source": f"{collection.database.name}.{collection.name}",
+        "exported_at": time.time(),
+    }
+    with open(os.path.join(tmp_dir, "sectors.json"), "w", encoding="utf-8") as f:
+        json.dump(sector_rows, f)
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    # Os arquivos da nova versão já estão fechados, então o rename funciona também no Windows
+    version = f"v-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.rename(tmp_dir, os.path.join(path, version))
+    pointer = os.path.join(path, LOCAL_INDEX_POINTER_FILE)
+    previous = local_index_version_dir(path) if os.path.exists(pointer) else None
+    pointer_tmp = os.path.join(path, f".{LOCAL_INDEX_POINTER_FILE}-{uuid.uuid4().hex[:8]}")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_tmp, pointer)
+    if previous and os.path.isdir(previous):
+        # Marca o momento da substituição: a carência da limpeza conta a partir daqui
+        os.utime(previous)
+    _remove_retired_local_index_versions(path)
+    return manifest
+# --- fim do índice vetorial local ---
+
+
+# Estado dos índices vetoriais por (cluster, database, coleção, índice); consultas em regime estável não consultam o Atlas
+INDEX_POLL_INITIAL_SECONDS = 1.0
+INDEX_POLL_MAX_SECONDS = 30.0
+# Limite do Atlas para numCandidates (e portanto para o limit) do $vectorSearch
+MAX_NUM_CANDIDATES = 10_000
+
+
+def _search_index_key(uri: str, db_name: str, collection_name: str, index_name: str) -> str:
+    return hashlib.sha256(f"{uri}|{db_name}|{collection_name}|{index_name}".encode("utf-8")).hexdigest()
+
+
+def forget_search_index(key: str) -> None:
+    """Descarta o estado em cache (ex.: o índice foi removido ou a consulta falhou)."""
+    registry = _shared_registry("search_indexes")
+    with registry.setdefault("lock", threading.Lock()):
+        registry.pop(key, None)
+
+
+# --- Profiling de agregações (manter idêntico entre os arquivos) ---
+def explain_aggregate(collection, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Runs the pipeline under explain with executionStats verbosity and returns a JSON-safe document."""
+    explain = collection.database.command(
+        {"explain": {"aggregate": collection.name, "pipeline": pipeline, "cursor": {}}, "verbosity": "executionStats"}
+    )
+    return json.loads(json_util.dumps(explain))
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-stage documents returned and server time, plus documents examined versus returned.
+
+    Sharded explains are flattened. Documents examined comes from totalDocsExamined when the plan
+    reads the collection; for $search/$vectorSearch plans it is what mongot handed to mongod.
+    """
+    raw_stages = list(explain.get("stages") or [])
+    for shard in (explain.get("shards") or {}).values():
+        raw_stages.extend(shard.get("stages") or [])
+
+    stages = []
+    for stage in raw_stages:
+        name = next((key for key in stage if key.startswith("$")), "?")
+        stages.append({
+            "stage": name,
+            "n_returned": stage.get("nReturned"),
+            "execution_time_ms": stage.get("executionTimeMillisEstimate"),
+        })
+
+    def find_all(node: Any, key: str) -> List[Any]:
+        if isinstance(node, dict):
+            found = [node[key]] if key in node else []
+            return found + [v for child in node.values() for v in find_all(child, key)]
+        if isinstance(node, list):
+            return [v for child in node for v in find_all(child, key)]
+        return []
+
+    docs_examined = sum(v for v in find_all(explain, "totalDocsExamined") if isinstance(v, int))
+    if not docs_examined and stages and isinstance(stages[0]["n_returned"], int):
+        docs_examined = stages[0]["n_returned"]
+    stage_times = [s["execution_time_ms"] for s in stages if isinstance(s["execution_time_ms"], (int, float))]
+    return {
+        "stages": stages,
+        "docs_examined": docs_examined,
+        "keys_examined": sum(v for v in find_all(explain, "totalKeysExamined") if isinstance(v, int)),
+        "n_returned": stages[-1]["n_returned"] if stages else None,
+        # executionTimeMillisEstimate é cumulativo ao longo da pipeline
+        "server_time_ms": max(stage_times) if stage_times else None,
+    }
+# --- fim do profiling de agregações ---
 
 
 class MongoVectorStoreComponent(LCVectorStoreComponent):
@@ -28,7 +1036,9 @@ class MongoVectorStoreComponent(LCVectorStoreComponent):
     icon = "MongoDB"
     INSERT_MODES = ["append", "overwrite"]
     SIMILARITY_OPTIONS = ["cosine", "euclidean", "dotProduct"]
+    SEARCH_ENGINES = ["atlas", "local", "hibrido"]
     QUANTIZATION_OPTIONS = ["scalar", "binary"]
+    DIMENSION_REDUCTION_OPTIONS = ["nenhuma", "matryoshka", "pca"]
 
     inputs = [
         SecretStrInput(
@@ -95,6 +1105,23 @@ class MongoVectorStoreComponent(LCVectorStoreComponent):
             advanced=True,
             required=True,
         ),
+        DropdownInput(
+            name="dimension_reduction",
+            display_name="Redução de Dimensionalidade",
+            options=DIMENSION_REDUCTION_OPTIONS,
+            value="nenhuma",
+            advanced=True,
+            info="Reduz os embeddings para 'Number of Dimensions' na ingestão e na consulta. matryoshka trunca "
+                 "(apenas modelos treinados para isso); pca usa o arquivo de projeção. Exige reingestão (overwrite) "
+                 "e a escolha da dimensão pode ser feita com scripts/fit_dimension_reduction.py.",
+        ),
+        StrInput(
+            name="projection_path",
+            display_name="Arquivo de Projeção PCA",
+            value="",
+            advanced=True,
+            info="Arquivo .npz gerado por scripts/fit_dimension_reduction.py (usado com redução 'pca').",
+        ),
         DropdownInput(
             name="similarity",
             display_name="Similarity",
@@ -109,51 +1136,411 @@ class MongoVectorStoreComponent(LCVectorStoreComponent):
             value=None,
             advanced=True,
         ),
+        BoolInput(
+            name="store_binary_vectors",
+            display_name="Gravar Embeddings como Binary Vector",
+            value=False,
+            advanced=True,
+            info="Grava os embeddings como BSON binary vector em vez de array de doubles: float32 sem quantização, "
+                 "int8 com 'scalar' (requer similaridade cosine) ou packed bit com 'binary' (requer euclidean). "
+                 "Coleções existentes podem ser convertidas com scripts/migrate_binary_vectors.py.",
+        ),
+        BoolInput(
+            name="use_async_driver",
+            display_name="Usar Driver Assíncrono (Motor)",
+            value=True,
+            advanced=True,
+            info="Executa o embedding da consulta e o $vectorSearch de forma assíncrona (Motor), permitindo que buscas "
+                 "independentes rodem em paralelo. Sem Motor instalado, a busca síncrona roda em uma thread.",
+        ),
+        IntInput(
+            name="query_timeout_seconds",
+            display_name="Tempo Limite da Busca (s)",
+            value=30,
+            advanced=True,
+            info="Tempo máximo da busca vetorial. 0 desativa o limite.",
+        ),
+        DropdownInput(
+            name="search_engine",
+            display_name="Motor de Busca",
+            options=SEARCH_ENGINES,
+            value=SEARCH_ENGINES[0],
+            advanced=True,
+            info="atlas: $vectorSearch no cluster. local: índice exportado em local_index_path, sem acesso ao Atlas. "
+                 "hibrido: consultas restritas aos setores quentes usam o índice local; quando ausente ou vencido, ele é "
+                 "exportado do Atlas em segundo plano (enquanto isso, o índice vencido atende ou a consulta vai ao Atlas); "
+                 "as demais vão ao Atlas.",
+        ),
+        StrInput(
+            name="local_index_path",
+            display_name="Diretório do Índice Local",
+            value="",
+            advanced=True,
+            required=False,
+            info="Diretório gerado por scripts/export_vector_index.py (ou pelo modo hibrido).",
+        ),
+        MultilineInput(
+            name="hot_sectors",
+            display_name="Setores Quentes",
+            value="",
+            advanced=True,
+            required=False,
+            info="Setores servidos pelo índice local no modo hibrido (ex: ['Risco']).",
+        ),
+        IntInput(
+            name="local_index_max_age_seconds",
+            display_name="Validade do Índice Local (s)",
+            value=3600,
+            advanced=True,
+            info="No modo hibrido, o índice dos setores quentes é exportado de novo do Atlas (em segundo plano) após este tempo. 0 nunca expira.",
+        ),
+        IntInput(
+            name="num_candidates_multiplier",
+            display_name="Multiplicador de numCandidates",
+            value=10,
+            advanced=True,
+            info="numCandidates do $vectorSearch = resultados x multiplicador (máx. 10000). Valores maiores aumentam o recall e a latência.",
+        ),
+        IntInput(
+            name="post_filter_budget_ms",
+            display_name="Orçamento do Pós-filtro (ms)",
+            value=1500,
+            advanced=True,
+            info="Se o índice não aceita o filtro de setores como pré-filtro, a busca é repetida com mais candidatos "
+                 "até achar os resultados pedidos ou esgotar este tempo.",
+        ),
+        MultilineInput(
+            name="query_variants",
+            display_name="Variações da Consulta",
+            advanced=True,
+            required=False,
+            info="Reformulações da pergunta (lista JSON ou uma por linha), ex.: as geradas pelo classificador. "
+                 f"Cada variação é buscada em paralelo junto com a consulta principal (máx. {MAX_QUERY_VARIANTS}) "
+                 "e os resultados são unidos por _id, mantendo o maior score.",
+        ),
+        BoolInput(
+            name="use_mmr",
+            display_name="Diversificar Resultados (MMR)",
+            value=False,
+            advanced=True,
+            info="Busca um conjunto maior de candidatos e seleciona por Maximal Marginal Relevance, "
+                 "evitando devolver vários chunks quase iguais (ex.: trechos vizinhos da mesma reunião).",
+        ),
+        IntInput(
+            name="mmr_fetch_multiplier",
+            display_name="Multiplicador de Candidatos do MMR",
+            value=4,
+            advanced=True,
+            info="Candidatos avaliados pelo MMR = resultados x multiplicador.",
+        ),
+        StrInput(
+            name="mmr_lambda",
+            display_name="Lambda do MMR",
+            value="0.5",
+            advanced=True,
+            info="Peso da relevância frente à diversidade (0.0-1.0). 1.0 equivale à busca sem MMR.",
+        ),
+        IntInput(
+            name="ingest_batch_size",
+            display_name="Tamanho do Lote de Ingestão",
+            value=64,
+            advanced=True,
+            info="Documentos por lote: cada lote gera uma chamada de embedding e um bulk_write.",
+        ),
+        IntInput(
+            name="ingest_max_concurrency",
+            display_name="Lotes de Ingestão em Paralelo",
+            value=4,
+            advanced=True,
+            info="Quantos lotes são embedados e gravados ao mesmo tempo.",
+        ),
+        IntInput(
+            name="ingest_rate_limit_per_minute",
+            display_name="Limite de Chamadas de Embedding por Minuto",
+            value=0,
+            advanced=True,
+            info="Máximo de chamadas de embedding por minuto durante a ingestão. 0 não limita.",
+        ),
+        IntInput(
+            name="swap_index_timeout_seconds",
+            display_name="Espera pelos Índices da Nova Coleção (s)",
+            value=600,
+            advanced=True,
+            info="No overwrite (blue/green), quanto esperar os índices da coleção sombra ficarem consultáveis antes de trocar. "
+                 "Se esgotar, as leituras seguem na coleção atual e a próxima execução retoma a espera.",
+        ),
+        IntInput(
+            name="swap_drop_grace_seconds",
+            display_name="Carência Antes de Remover a Coleção Antiga (s)",
+            value=15,
+            advanced=True,
+            info="Tempo mínimo entre a troca do alias e o drop da coleção substituída (nunca menor que o cache de "
+                 f"aliases, {COLLECTION_ALIAS_TTL_SECONDS}s). O drop roda em segundo plano, sem esperar na execução, "
+                 "e também remove a coleção com o nome original: leitores devem resolver o alias (resolve_collection_name).",
+        ),
+        IntInput(
+            name="embedding_cache_max_entries",
+            display_name="Tamanho do Cache de Embeddings",
+            value=1000,
+            advanced=True,
+            info="Embeddings de consultas mantidos em memória (LRU), por modelo/deployment, dimensões e texto normalizado. "
+                 "0 desativa o cache.",
+        ),
+        StrInput(
+            name="embedding_cache_db_path",
+            display_name="Arquivo do Cache de Embeddings",
+            value="",
+            advanced=True,
+            required=False,
+            info="Caminho de um arquivo SQLite para persistir os embeddings (float32) entre reinicializações. Vazio mantém só em memória.",
+        ),
+        IntInput(
+            name="index_ready_timeout_seconds",
+            display_name="Espera pelo Índice (s)",
+            value=20,
+            advanced=True,
+            info="Quanto tempo aguardar (com backoff) um índice vetorial recém-criado ficar consultável. "
+                 "0 não bloqueia: enquanto o índice estiver em construção a busca retorna vazio com esse status.",
+        ),
+        BoolInput(
+            name="enable_profiling",
+            display_name="Modo de Profiling",
+            value=False,
+            advanced=True,
+            info="Preenche a saída de debug com tempos de embedding e de consulta, explain (executionStats) do $vectorSearch, "
+                 "tempos por estágio e documentos examinados x retornados. O explain executa a busca mais uma vez.",
+        ),
+    ]
+
+    outputs = [
+        *LCVectorStoreComponent.outputs,
+        Output(display_name="Perfil da Busca (Debug)", name="profile", method="profile_search"),
     ]
 
     @check_cached_vector_store
     def build_vector_store(self) -> MongoDBAtlasVectorSearch:
-        # Configura cliente MongoDB, com mTLS se habilitado
-        client_cert_path = None
-        if self.enable_mtls and self.mongodb_atlas_client_cert:
-            pem = self.mongodb_atlas_client_cert.strip().replace(" ", "\n")
-            with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                tmp.write(pem.encode("utf-8"))
-                client_cert_path = tmp.name
-
-        client = (
-            MongoClient(
-                self.mongodb_atlas_cluster_uri,
-                tls=True,
-                tlsCertificateKeyFile=client_cert_path,
-                tlsCAFile=certifi.where(),
-            )
-            if self.enable_mtls
-            else MongoClient(self.mongodb_atlas_cluster_uri)
-        )
-        collection = client[self.db_name][self.collection_name]
-
-        # Prepara documentos
-        docs: List[Any] = []
-        for item in (self._prepare_ingest_data() or []):
-            docs.append(item.to_lc_document() if isinstance(item, Data) else item)
-
-        if docs:
-            if self.insert_mode == "overwrite":
-                collection.delete_many({})
-            return MongoDBAtlasVectorSearch.from_documents(
-                documents=docs,
-                embedding=self.embedding,
-                collection=collection,
-                index_name=self.index_name,
-            )
+        # Cliente MongoDB compartilhado, com mTLS se habilitado
+        client = get_mongo_client(self.mongodb_atlas_cluster_uri, **self._client_options())
+        ingest_data = self._prepare_ingest_data() or []
+        self._sweep_retired_collections()
+        if ingest_data and self.insert_mode == "overwrite":
+            return self._overwrite_blue_green(client, ingest_data)
+
+        vector_store = self._vector_store_for(client[self.db_name][self._physical_collection_name()])
+        if ingest_data:
+            self._ingest_documents(vector_store, ingest_data)
+        return vector_store
 
+    def _vector_store_for(self, collection) -> MongoDBAtlasVectorSearch:
         return MongoDBAtlasVectorSearch(
-            embedding=self.embedding,
+            embedding=self._query_embeddings(),
             collection=collection,
             index_name=self.index_name,
         )
 
+    def _physical_collection_name(self) -> str:
+        return resolve_collection_name(
+            self.mongodb_atlas_cluster_uri, self.db_name, self.collection_name, **self._client_options()
+        )
+
+    def _sweep_retired_collections(self) -> None:
+        """Retoma em segundo plano drops pendentes de trocas anteriores (o timer da troca não sobrevive a um restart)."""
+        sweeps = _shared_registry("retired_collections").setdefault("sweeps", {})
+        options = self._client_options()
+        key = f"{_mongo_client_key(self.mongodb_atlas_cluster_uri, **options)}|{self.db_name}|{self.collection_name}"
+        now = time.monotonic()
+        if key in sweeps and now - sweeps[key] < RETIRED_COLLECTION_SWEEP_SECONDS:
+            return
+        sweeps[key] = now
+        _schedule_retired_drop(self.mongodb_atlas_cluster_uri, self.db_name, self.collection_name, 0, **options)
+
+    def _overwrite_blue_green(self, client: MongoClient, ingest_data: Iterable[Any]) -> MongoDBAtlasVectorSearch:
+        """Overwrite sem janela de corpus vazio: ingere numa coleção sombra, cria nela os índices de busca,
+        espera ficarem consultáveis e troca o alias.
+
+        A coleção substituída (inclusive a que tem o nome lógico original, na primeira troca) fica registrada no
+        alias e é removida em segundo plano passada a carência, para que leitores com o alias em cache não
+        encontrem a coleção ausente. Todo leitor deve resolver o nome com resolve_collection_name.
+
+        Uma execução interrompida (inclusive por tempo de espera dos índices) é retomada na mesma coleção sombra.
+        """
+        db = client[self.db_name]
+        live_name = self._physical_collection_name()
+        previous = db[INGEST_CHECKPOINT_COLLECTION].find_one({"_id": self.collection_name})
+        if previous and previous.get("status") == "running" and previous.get("shadow"):
+            shadow_name = previous["shadow"]
+        else:
+            shadow_name = f"{self.collection_name}__{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        shadow_store = self._vector_store_for(db[shadow_name])
+        stats = self._ingest_documents(shadow_store, ingest_data, shadow=shadow_name)
+        ingest_status = self.status
+
+        # Replica os índices de busca da coleção atual (ex.: o índice lexical) e garante o índice vetorial
+        shadow = db[shadow_name]
+        live_indexes = list(db[live_name].list_search_indexes())
+        existing = {index["name"] for index in shadow.list_search_indexes()}
+        models = [
+            SearchIndexModel(definition=index["latestDefinition"], name=index["name"], type=index.get("type", "search"))
+            for index in live_indexes
+            if index["name"] not in existing and index["name"] != self.index_name
+        ]
+        if self.index_name not in existing:
+            models.append(self._vector_index_model(shadow_store._embedding_key))
+        for model in models:
+            shadow.create_search_index(model)
+
+        names = {index["name"] for index in live_indexes} | {self.index_name}
+        timeout = max(0, int(getattr(self, "swap_index_timeout_seconds", 600) or 0))
+        if not self._wait_search_indexes(shadow, names, timeout):
+            self.status = (
+                f"{ingest_status} Índices da coleção '{shadow_name}' ainda em construção; "
+                f"as leituras continuam em '{live_name}' e a próxima execução retoma a troca."
+            )
+            return self._vector_store_for(db[live_name])
+
+        now = time.time()
+        grace = max(COLLECTION_ALIAS_TTL_SECONDS, int(getattr(self, "swap_drop_grace_seconds", 15) or 0))
+        alias = db[COLLECTION_ALIASES].find_one({"_id": self.collection_name}) or {}
+        retired = [r for r in alias.get("retired", []) if r["name"] not in (live_name, shadow_name)]
+        if live_name != shadow_name:
+            retired.append({"name": live_name, "retired_at": now, "drop_after": now + grace})
+
+        # A troca do alias é uma escrita em um único documento, portanto atômica para os leitores
+        db[COLLECTION_ALIASES].update_one(
+            {"_id": self.collection_name},
+            {"$set": {"target": shadow_name, "previous": live_name, "swapped_at": now, "retired": retired}},
+            upsert=True,
+        )
+        bump_ingest_watermark(db, self.collection_name)
+        aliases = _mongo_client_registry().setdefault("aliases", {})
+        for key in [key for key in aliases if key.endswith(f"|{self.db_name}|{self.collection_name}")]:
+            aliases.pop(key, None)
+        _shared_registry("search_indexes")[
+            _search_index_key(self.mongodb_atlas_cluster_uri, self.db_name, shadow_name, self.index_name)
+        ] = {"status": "ready"}
+        db[INGEST_CHECKPOINT_COLLECTION].update_one(
+            {"_id": self.collection_name}, {"$set": {"status": "completed", "updated_at": time.time()}}
+        )
+
+        # Limpeza adiada: o drop roda em segundo plano depois da carência, sem segurar esta execução
+        _schedule_retired_drop(
+            self.mongodb_atlas_cluster_uri, self.db_name, self.collection_name, grace, **self._client_options()
+        )
+        self.status = f"{ingest_status} Coleção '{shadow_name}' publicada no lugar de '{live_name}'."
+        return shadow_store
+
+    def _wait_search_indexes(self, collection, names: set, timeout: float) -> bool:
+        """Espera (com backoff) todos os índices em 'names' ficarem consultáveis; retorna False se o tempo acabar."""
+        deadline = time.monotonic() + timeout
+        interval = INDEX_POLL_INITIAL_SECONDS
+        while True:
+            indexes = {index["name"]: index for index in collection.list_search_indexes()}
+            failed = [name for name in names if indexes.get(name, {}).get("status") == "FAILED"]
+            if failed:
+                raise ValueError(f"A construção do(s) índice(s) {failed} falhou no Atlas.")
+            if all(indexes.get(name, {}).get("queryable") or indexes.get(name, {}).get("status") == "READY" for name in names):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, INDEX_POLL_MAX_SECONDS)
+
+    def _ingest_documents(
+        self, vector_store: MongoDBAtlasVectorSearch, ingest_data: Iterable[Any], shadow: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Embeda e grava os documentos em lotes concorrentes, com checkpoint para retomar uma execução interrompida.
+
+        Cada documento recebe um _id derivado do conteúdo; ao retomar, os já gravados não são embedados de novo.
+        Com shadow (overwrite blue/green), o checkpoint só é concluído depois da troca do alias.
+        """
+        collection = vector_store._collection
+        checkpoints = collection.database[INGEST_CHECKPOINT_COLLECTION]
+        previous = checkpoints.find_one({"_id": self.collection_name})
+        resuming = bool(previous and previous.get("status") == "running" and previous.get("shadow") == shadow)
+        run_id = previous["run_id"] if resuming else uuid.uuid4().hex
+        checkpoints.replace_one(
+            {"_id": self.collection_name},
+            {
+                "_id": self.collection_name,
+                "run_id": run_id,
+                "status": "running",
+                "insert_mode": self.insert_mode,
+                "shadow": shadow,
+                "documents_written": previous.get("documents_written", 0) if resuming else 0,
+                "batches_completed": previous.get("batches_completed", 0) if resuming else 0,
+                "started_at": previous.get("started_at") if resuming else time.time(),
+                "updated_at": time.time(),
+            },
+            upsert=True,
+        )
+
+        storage = self._vector_storage()
+        limiter = RateLimiter(int(getattr(self, "ingest_rate_limit_per_minute", 0) or 0))
+        stats = {"written": 0, "skipped": 0, "batches": 0}
+        stats_lock = threading.Lock()
+        embedding_model = self._embedding_model()
+
+        def ingest_batch(batch: List[Any]) -> None:
+            docs = [item.to_lc_document() if isinstance(item, Data) else item for item in batch]
+            ids = [content_document_id(doc.page_content, doc.metadata) for doc in docs]
+            existing = {d["_id"] for d in collection.find({"_id": {"$in": ids}}, {"_id": 1})}
+            pending = [(doc_id, doc) for doc_id, doc in zip(ids, docs) if doc_id not in existing]
+            if pending:
+                limiter.acquire()
+                vectors = embedding_model.embed_documents([doc.page_content for _, doc in pending])
+                collection.bulk_write(
+                    [
+                        ReplaceOne(
+                            {"_id": doc_id},
+                            {
+                                **doc.metadata,
+                                "_id": doc_id,
+                                vector_store._text_key: doc.page_content,
+                                vector_store._embedding_key: self._stored_vector(vector, storage),
+                            },
+                            upsert=True,
+                        )
+                        for (doc_id, doc), vector in zip(pending, vectors)
+                    ],
+                    ordered=False,
+                )
+                if shadow is None:
+                    bump_ingest_watermark(collection.database, self.collection_name)
+            checkpoints.update_one(
+                {"_id": self.collection_name, "run_id": run_id},
+                {"$inc": {"documents_written": len(pending), "batches_completed": 1}, "$set": {"updated_at": time.time()}},
+            )
+            with stats_lock:
+                stats["written"] += len(pending)
+                stats["skipped"] += len(existing)
+                stats["batches"] += 1
+
+        batch_size = max(1, int(getattr(self, "ingest_batch_size", 64) or 1))
+        max_concurrency = max(1, int(getattr(self, "ingest_max_concurrency", 4) or 1))
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            in_flight = set()
+            # Mantém no máximo 2x max_concurrency lotes em memória ao percorrer os dados
+            for batch in _batched(ingest_data, batch_size):
+                if len(in_flight) >= 2 * max_concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                in_flight.add(executor.submit(ingest_batch, batch))
+            for future in in_flight:
+                future.result()
+
+        if shadow is None:
+            checkpoints.update_one(
+                {"_id": self.collection_name, "run_id": run_id},
+                {"$set": {"status": "completed", "updated_at": time.time()}},
+            )
+        self.status = (
+            f"Ingestão: {stats['written']} documento(s) gravado(s), {stats['skipped']} já existente(s), "
+            f"{stats['batches']} lote(s)" + (" (execução retomada)." if resuming else ".")
+        )
+        return stats
+
     def _parse_setores(self, raw: Optional[str]) -> Optional[List[str]]:
         if not raw or not raw.strip():
             return None
@@ -174,36 +1561,539 @@ class MongoVectorStoreComponent(LCVectorStoreComponent):
             return None
         return {"setores": {"$in": setores}}
 
-    def search_documents(self) -> List[Data]:
-        vs = self.build_vector_store()
-        self.verify_search_index(vs._collection)
+    def _embedding_model(self) -> Embeddings:
+        """Handle de embedding com a redução de dimensionalidade configurada (o mesmo objeto durante a execução)."""
+        method = getattr(self, "dimension_reduction", "nenhuma") or "nenhuma"
+        if method == "nenhuma":
+            return self.embedding
+        reduced = getattr(self, "_reduced_embeddings", None)
+        if reduced is None or reduced.embedding is not self.embedding:
+            if method == "pca":
+                path = (getattr(self, "projection_path", "") or "").strip()
+                if not path:
+                    raise ValueError("Redução 'pca' exige o arquivo de projeção (gere com scripts/fit_dimension_reduction.py).")
+                reduction = load_dimension_reduction(path)
+                if reduction.dimensions != self.number_dimensions:
+                    raise ValueError(
+                        f"A projeção '{path}' gera {reduction.dimensions} dimensões, mas o índice usa {self.number_dimensions}."
+                    )
+            else:
+                reduction = DimensionReduction("matryoshka", self.number_dimensions)
+            # euclidean compara distâncias absolutas; as demais similaridades esperam vetores unitários
+            reduced = ReducedEmbeddings(self.embedding, reduction, normalize=self.similarity != "euclidean")
+            self._reduced_embeddings = reduced
+        return reduced
+
+    def _query_embeddings(self) -> Embeddings:
+        """Handle de embedding com cache de consultas (o mesmo objeto durante a execução do componente)."""
+        max_entries = int(getattr(self, "embedding_cache_max_entries", 0) or 0)
+        model_embeddings = self._embedding_model()
+        if max_entries <= 0:
+            return model_embeddings
+        cached = getattr(self, "_cached_query_embeddings", None)
+        if cached is None or cached.embedding is not model_embeddings:
+            model = next(
+                (
+                    str(value)
+                    for attr in ("deployment", "azure_deployment", "model", "model_name")
+                    if (value := getattr(self.embedding, attr, None))
+                ),
+                "",
+            )
+            dimensions = getattr(self.embedding, "dimensions", None) or self.number_dimensions
+            db_path = (getattr(self, "embedding_cache_db_path", "") or "").strip() or None
+            model_key = f"{type(self.embedding).__name__}|{model}|{dimensions}"
+            if isinstance(model_embeddings, ReducedEmbeddings):
+                model_key += f"|{model_embeddings.reduction.signature}|norm={model_embeddings.normalize}"
+            cached = CachedQueryEmbeddings(model_embeddings, get_query_embedding_cache(max_entries, db_path), model_key)
+            self._cached_query_embeddings = cached
+        return cached
+
+    def _search_query_texts(self) -> List[str]:
+        """Consulta principal seguida das variações distintas (lista JSON ou uma por linha)."""
+        texts = [self.search_query]
+        raw = (getattr(self, "query_variants", "") or "").strip()
+        if raw:
+            try:
+                parsed = json.loads(raw)
+                variants = parsed if isinstance(parsed, list) else [raw]
+            except ValueError:
+                variants = raw.splitlines()
+            seen = {" ".join(self.search_query.split()).lower()}
+            for variant in variants:
+                normalized = " ".join(str(variant).split()).lower()
+                if normalized and normalized not in seen:
+                    seen.add(normalized)
+                    texts.append(str(variant).strip())
+        return texts[:MAX_QUERY_VARIANTS + 1]
+
+    def _embed_search_queries(self) -> List[List[float]]:
+        """Embeddings da consulta e das variações; as variações saem de uma única chamada em lote ao modelo."""
+        texts = self._search_query_texts()
+        embeddings = self._query_embeddings()
+        if len(texts) == 1:
+            return [embeddings.embed_query(texts[0])]
+        if isinstance(embeddings, CachedQueryEmbeddings):
+            return embeddings.embed_queries(texts)
+        return embeddings.embed_documents(texts)
+
+    async def _aembed_search_queries(self) -> List[List[float]]:
+        texts = self._search_query_texts()
+        embeddings = self._query_embeddings()
+        if len(texts) == 1:
+            return [await embeddings.aembed_query(texts[0])]
+        if isinstance(embeddings, CachedQueryEmbeddings):
+            return await embeddings.aembed_queries(texts)
+        return await embeddings.aembed_documents(texts)
+
+    def _client_options(self) -> Dict[str, Any]:
+        client_cert = None
+        if self.enable_mtls and self.mongodb_atlas_client_cert:
+            client_cert = self.mongodb_atlas_client_cert.strip().replace(" ", "\n")
+        return {"tls": bool(self.enable_mtls), "client_cert": client_cert}
+
+    def _local_index_for(self, setores_list: Optional[List[str]]) -> Optional[LocalVectorIndex]:
+        """Índice local que deve atender a consulta, ou None para usar o Atlas."""
+        engine = getattr(self, "search_engine", "atlas") or "atlas"
+        path = (getattr(self, "local_index_path", "") or "").strip()
+        if engine == "atlas":
+            return None
+        if not path:
+            raise ValueError(f"O motor '{engine}' requer o Diretório do Índice Local.")
+        if engine == "local":
+            return load_local_vector_index(path)
+
+        hot = self._parse_setores(getattr(self, "hot_sectors", "")) or []
+        if not setores_list or not hot or not set(setores_list) <= set(hot):
+            return None
+        max_age = int(getattr(self, "local_index_max_age_seconds", 0) or 0)
+        try:
+            index = load_local_vector_index(path)
+        except FileNotFoundError:
+            index = None
+        expired = index is None or (max_age > 0 and time.time() - index.manifest.get("exported_at", 0) > max_age)
+        if expired or not index.covers(setores_list):
+            # Read-through em segundo plano: exporta do Atlas apenas os setores quentes, sem bloquear a consulta
+            uri, client_options, db_name = self.mongodb_atlas_cluster_uri, self._client_options(), self.db_name
+            collection_name = self._physical_collection_name()
+            options = {
+                "similarity": self.similarity,
+                "quantization": "int8" if self.quantization == "scalar" else "float32",
+                "setores": sorted(hot),
+            }
+            _refresh_local_index(
+                path,
+                lambda: export_local_vector_index(get_mongo_client(uri, **client_options)[db_name][collection_name], path, **options),
+            )
+        # Enquanto a exportação roda, o índice atual (vencido) atende se cobrir os setores; senão a consulta vai ao Atlas
+        if index is None or not index.covers(setores_list):
+            return None
+        return index
+
+    def _search_local(
+        self, index: LocalVectorIndex, query_vectors: List[List[float]], k: int, setores_list: Optional[List[str]]
+    ) -> List[Data]:
+        started = time.perf_counter()
+        fetch_k = self._mmr_fetch_k(k)
+        best: Dict[int, float] = {}
+        for query_vector in query_vectors:
+            for row, score in zip(*index.search_rows(query_vector, fetch_k, setores_list)):
+                best[int(row)] = max(float(score), best.get(int(row), float("-inf")))
+        merged = sorted(best.items(), key=lambda item: item[1], reverse=True)[:fetch_k]
+        rows = np.asarray([row for row, _ in merged], dtype=np.int64)
+        scores = [score for _, score in merged]
+        self._search_profile = {
+            "engine": "local",
+            "local_index": index.path,
+            "local_search_ms": round((time.perf_counter() - started) * 1000, 2),
+            "results_returned": len(rows),
+        }
+        if len(query_vectors) > 1:
+            self._search_profile["query_variants"] = len(query_vectors)
+        order = range(len(rows))
+        if self._mmr_enabled():
+            order = self._select_mmr(query_vectors[0], index.row_vectors(rows), k)
+        hits = [(index.metadata(int(rows[i])), float(scores[i])) for i in order]
+        text_key = index.manifest.get("text_key", "text")
+        return self._docs_scores_to_data(
+            [(Document(page_content=meta.pop(text_key, ""), metadata=meta), score) for meta, score in hits]
+        )
+
+    def _mmr_enabled(self) -> bool:
+        return bool(getattr(self, "use_mmr", False))
+
+    def _mmr_fetch_k(self, k: int) -> int:
+        """Tamanho do conjunto de candidatos: k sem MMR, k x mmr_fetch_multiplier com MMR."""
+        if not self._mmr_enabled():
+            return k
+        multiplier = max(1, int(getattr(self, "mmr_fetch_multiplier", 4) or 1))
+        return min(MAX_NUM_CANDIDATES, k * multiplier)
+
+    def _select_mmr(self, query_vector: List[float], vectors: Any, k: int) -> List[int]:
+        """Seleção MMR sobre os embeddings dos candidatos; registra as contagens no perfil da busca."""
+        try:
+            lambda_mult = min(1.0, max(0.0, float(getattr(self, "mmr_lambda", "0.5") or 0.5)))
+        except ValueError:
+            lambda_mult = 0.5
+        started = time.perf_counter()
+        order = mmr_select(query_vector, vectors, k, lambda_mult)
+        self._search_profile["mmr"] = {
+            "candidates": len(vectors),
+            "selected": len(order),
+            "lambda": lambda_mult,
+            "mmr_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        return order
+
+    def _apply_mmr(self, query_vector: List[float], results: List[Dict[str, Any]], k: int, embedding_key: str) -> List[Dict[str, Any]]:
+        """Reordena os resultados do $vectorSearch por MMR e remove os embeddings trazidos para a seleção.
+
+        Resultados sem embedding (ausente ou não decodificável) não entram na seleção; vêm depois dela,
+        na ordem de relevância, até completar k.
+        """
+        if not self._mmr_enabled():
+            return results
+        dimensions = len(query_vector)
+        vectors = []
+        for res in results:
+            try:
+                vector = decode_vector(res.pop(embedding_key, None))
+            except (ValueError, TypeError):
+                vector = None
+            usable_vector = isinstance(vector, (list, tuple, np.ndarray)) and len(vector) == dimensions
+            vectors.append(vector if usable_vector else None)
+        usable = [i for i, vector in enumerate(vectors) if vector is not None]
+        order = self._select_mmr(query_vector, [vectors[i] for i in usable], k)
+        selected = [results[usable[i]] for i in order]
+        without_embedding = [res for res, vector in zip(results, vectors) if vector is None]
+        self._search_profile["mmr"]["without_embedding"] = len(without_embedding)
+        return selected + without_embedding[:max(0, k - len(selected))]
+
+    def _num_candidates(self, limit: int) -> int:
+        multiplier = max(1, int(getattr(self, "num_candidates_multiplier", 10) or 1))
+        return min(MAX_NUM_CANDIDATES, max(limit, limit * multiplier))
+
+    def _vector_search_pipeline(
+        self,
+        query_vector: List[float],
+        k: int,
+        mongo_filter: Optional[Dict[str, Any]],
+        embedding_key: str,
+        num_candidates: Optional[int] = None,
+        post_filter: bool = False,
+        final_limit: Optional[int] = None,
+        include_embedding: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Pipeline do $vectorSearch; com post_filter, o filtro vira um $match depois da busca.
+
+        include_embedding mantém o campo de embedding nos resultados (necessário para o MMR).
+        """
+        storage = self._vector_storage()
+        stage: Dict[str, Any] = {
+            "index": self.index_name,
+            "path": embedding_key,
+            # Índices sobre int8/packed bit exigem o vetor de consulta no mesmo formato
+            "queryVector": encode_vector(query_vector, storage) if storage in ("int8", "packed_bit") else list(query_vector),
+            "numCandidates": num_candidates or self._num_candidates(k),
+            "limit": k,
+        }
+        if mongo_filter and not post_filter:
+            stage["filter"] = mongo_filter
+        pipeline: List[Dict[str, Any]] = [
+            {"$vectorSearch": stage},
+            {"$set": {"score": {"$meta": "vectorSearchScore"}}},
+        ]
+        if mongo_filter and post_filter:
+            pipeline.append({"$match": mongo_filter})
+            pipeline.append({"$limit": final_limit or k})
+        if not include_embedding:
+            pipeline.append({"$project": {embedding_key: 0}})
+        return pipeline
+
+    def _vector_search_steps(
+        self,
+        query_vector: List[float],
+        k: int,
+        mongo_filter: Optional[Dict[str, Any]],
+        embedding_key: str,
+        include_embedding: bool = False,
+        plan: Optional[Dict[str, Any]] = None,
+        index_key: Optional[str] = None,
+    ) -> Generator[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Plano da busca, compartilhado pelos caminhos síncrono e assíncrono.
+
+        Gera pipelines e recebe os resultados de cada uma. Tenta o pré-filtro nativo do $vectorSearch; se o
+        índice não tiver o campo como filtro, repete com pós-filtro dobrando limit/numCandidates até achar k
+        resultados ou esgotar post_filter_budget_ms. O plano executado e a última pipeline ('pipeline') são
+        registrados em 'plan' (ou em um dict novo), sem estado no componente: variações rodam em paralelo.
+        index_key deve vir do nome físico da coleção: no caminho assíncrono o gerador roda no event loop.
+        """
+        index_key = index_key or self._index_key()
+        # Entrada do próprio registro (não uma cópia), para o aviso de pré-filtro valer nas próximas buscas
+        registry = _shared_registry("search_indexes")
+        with registry.setdefault("lock", threading.Lock()):
+            index_state = registry.setdefault(index_key, {})
+        plan = plan if plan is not None else {}
+        plan.update(prefilter=bool(mongo_filter), attempts=1, num_candidates=self._num_candidates(k))
+        if not mongo_filter or index_state.get("prefilter", True):
+            plan["pipeline"] = self._vector_search_pipeline(
+                query_vector, k, mongo_filter, embedding_key, include_embedding=include_embedding
+            )
+            try:
+                return (yield plan["pipeline"])
+            except OperationFailure as e:
+                if not mongo_filter or "needs to be indexed" not in str(e):
+                    raise
+                # Lembra que este índice não aceita o pré-filtro para não repetir a tentativa
+                index_state["prefilter"] = False
+
+        plan["prefilter"] = False
+        plan["attempts"] = 0
+        deadline = time.monotonic() + max(0, int(getattr(self, "post_filter_budget_ms", 1500) or 0)) / 1000
+        limit = k
+        while True:
+            limit = min(limit * 2, MAX_NUM_CANDIDATES)
+            plan["attempts"] += 1
+            plan["num_candidates"] = self._num_candidates(limit)
+            plan["pipeline"] = self._vector_search_pipeline(
+                query_vector, limit, mongo_filter, embedding_key,
+                num_candidates=plan["num_candidates"], post_filter=True, final_limit=k,
+                include_embedding=include_embedding,
+            )
+            results = yield plan["pipeline"]
+            if len(results) >= k or limit >= MAX_NUM_CANDIDATES or time.monotonic() >= deadline:
+                return results[:k]
+
+    def _run_vector_search_sync(self, collection, steps) -> List[Dict[str, Any]]:
+        pipeline = next(steps)
+        while True:
+            try:
+                results = list(collection.aggregate(pipeline))
+            except OperationFailure as e:
+                pipeline = steps.throw(e)
+                continue
+            try:
+                pipeline = steps.send(results)
+            except StopIteration as stop:
+                return stop.value
+
+    async def _run_vector_search_async(self, collection, steps) -> List[Dict[str, Any]]:
+        pipeline = next(steps)
+        while True:
+            try:
+                results = await collection.aggregate(pipeline).to_list(length=None)
+            except OperationFailure as e:
+                pipeline = steps.throw(e)
+                continue
+            try:
+                pipeline = steps.send(results)
+            except StopIteration as stop:
+                return stop.value
+
+    def _multi_query_sync(
+        self, collection, query_vectors: List[List[float]], k: int, mongo_filter: Optional[Dict[str, Any]], embedding_key: str
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Executa uma busca por vetor de consulta (em paralelo quando há variações) e une os resultados."""
+        plans: List[Dict[str, Any]] = [{} for _ in query_vectors]
+        index_key = self._index_key(collection.name)
+
+        def run(i: int) -> List[Dict[str, Any]]:
+            steps = self._vector_search_steps(
+                query_vectors[i], k, mongo_filter, embedding_key, include_embedding=self._mmr_enabled(), plan=plans[i],
+                index_key=index_key,
+            )
+            return self._run_vector_search_sync(collection, steps)
+
+        if len(query_vectors) == 1:
+            return run(0), plans
+        with ThreadPoolExecutor(max_workers=len(query_vectors)) as pool:
+            return merge_search_results(list(pool.map(run, range(len(query_vectors)))), k), plans
+
+    async def _multi_query_async(
+        self, collection, query_vectors: List[List[float]], k: int, mongo_filter: Optional[Dict[str, Any]], embedding_key: str
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        plans: List[Dict[str, Any]] = [{} for _ in query_vectors]
+        # A coleção já é a física: a chave sai do nome, sem resolver o alias no event loop
+        index_key = self._index_key(collection.name)
+        runs = [
+            self._run_vector_search_async(
+                collection,
+                self._vector_search_steps(
+                    query_vector, k, mongo_filter, embedding_key, include_embedding=self._mmr_enabled(), plan=plan,
+                    index_key=index_key,
+                ),
+            )
+            for query_vector, plan in zip(query_vectors, plans)
+        ]
+        if len(runs) == 1:
+            return await runs[0], plans
+        return merge_search_results(await asyncio.gather(*runs), k), plans
+
+    def _plans_profile(self, plans: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Plano executado por variação, cada um com a sua pipeline (vetor da consulta resumido)."""
+        profiled = [{**plan, "pipeline": self._summarize_pipeline(plan["pipeline"])} for plan in plans]
+        if len(plans) == 1:
+            return {"search_plan": profiled[0]}
+        return {"search_plan": profiled[0], "query_variants": len(plans), "search_plans": profiled}
+
+    def _results_to_docs_scores(self, results: List[Dict[str, Any]], text_key: str) -> List[Tuple[Document, Any]]:
+        docs_scores = []
+        for res in results:
+            text = res.pop(text_key, "")
+            score = res.pop("score", None)
+            docs_scores.append((Document(page_content=text, metadata=res), score))
+        return docs_scores
+
+    async def _search_documents_async(self) -> List[Data]:
+        vs = await asyncio.to_thread(self.build_vector_store)
+        if await asyncio.to_thread(self.verify_search_index, vs._collection, vs._embedding_key) != "ready":
+            return self._index_building_result()
 
         if not isinstance(self.search_query, str) or not self.search_query:
             return []
 
-        # Define número de resultados
         k = self.number_of_results
+        mongo_filter = self._create_setores_filter(self._parse_setores(self.setores))
+
+        started = time.perf_counter()
+        query_vectors = await self._aembed_search_queries()
+        embedding_ms = (time.perf_counter() - started) * 1000
+        collection = get_motor_client(self.mongodb_atlas_cluster_uri, **self._client_options())[self.db_name][vs._collection.name]
+        started = time.perf_counter()
+        results, plans = await self._multi_query_async(
+            collection, query_vectors, self._mmr_fetch_k(k), mongo_filter, vs._embedding_key
+        )
+        self._search_profile = {
+            "engine": "atlas",
+            "driver": "motor",
+            "embedding_ms": round(embedding_ms, 2),
+            "client_round_trip_ms": round((time.perf_counter() - started) * 1000, 2),
+            "results_returned": len(results),
+            **self._plans_profile(plans),
+        }
+        if getattr(self, "enable_profiling", False):
+            await asyncio.to_thread(self._explain_search, vs, plans[0]["pipeline"])
 
+        results = self._apply_mmr(query_vectors[0], results, k, vs._embedding_key)
+        return self._docs_scores_to_data(self._results_to_docs_scores(results, vs._text_key))
+
+    async def _search_documents_local(self) -> Optional[List[Data]]:
         setores_list = self._parse_setores(self.setores)
-        mongo_filter = self._create_setores_filter(setores_list)
+        index = await asyncio.to_thread(self._local_index_for, setores_list)
+        if index is None:
+            return None
+        if self.search_engine == "hibrido" and self.ingest_data:
+            # A ingestão continua indo para o Atlas; o índice local é só leitura
+            await asyncio.to_thread(self.build_vector_store)
+        if not isinstance(self.search_query, str) or not self.search_query:
+            return []
+        started = time.perf_counter()
+        query_vectors = await self._aembed_search_queries()
+        embedding_ms = (time.perf_counter() - started) * 1000
+        data = await asyncio.to_thread(self._search_local, index, query_vectors, self.number_of_results, setores_list)
+        self._search_profile["embedding_ms"] = round(embedding_ms, 2)
+        return data
+
+    async def _search_documents_dispatch(self) -> List[Data]:
+        if (getattr(self, "search_engine", "atlas") or "atlas") != "atlas":
+            data = await self._search_documents_local()
+            if data is not None:
+                return data
+        if getattr(self, "use_async_driver", True) and AsyncIOMotorClient is not None:
+            return await self._search_documents_async()
+        return await asyncio.to_thread(self._search_documents_sync)
 
+    async def search_documents(self) -> List[Data]:
+        timeout = int(getattr(self, "query_timeout_seconds", 0) or 0) or None
+        search = self._search_documents_dispatch()
         try:
-            if mongo_filter:
-                docs_scores = vs.similarity_search_with_score(
-                    query=self.search_query,
-                    k=k,
-                    filter=mongo_filter,
-                )
-            else:
-                docs_scores = vs.similarity_search_with_score(
-                    query=self.search_query,
-                    k=k,
-                )
-        except TypeError:
-            # Fallback manual
-            all_scores = vs.similarity_search_with_score(query=self.search_query, k=k*3)
-            docs_scores = [item for item in all_scores if self._matches_setores(item[0], setores_list)][:k]
+            return await asyncio.wait_for(search, timeout=timeout)
+        except asyncio.TimeoutError:
+            self.status = f"Busca vetorial excedeu o tempo limite de {timeout}s."
+            self._search_profile = {"error": self.status}
+            return []
+        except OperationFailure:
+            # O índice pode ter sido removido ou alterado; a próxima busca verifica de novo
+            forget_search_index(await asyncio.to_thread(self._index_key))
+            raise
+
+    async def as_dataframe(self) -> DataFrame:
+        # A implementação base chama search_documents() de forma síncrona
+        return DataFrame(await self.search_documents())
+
+    async def profile_search(self) -> Data:
+        """Saída de debug com os tempos e o explain da última busca (executa a busca se ainda não rodou)."""
+        if getattr(self, "_search_profile", None) is None:
+            await self.search_documents()
+        profile = dict(getattr(self, "_search_profile", None) or {})
+        cached = getattr(self, "_cached_query_embeddings", None)
+        if cached is not None:
+            profile["embedding_cache"] = dict(cached.stats)
+        if not getattr(self, "enable_profiling", False):
+            profile["note"] = "Ative 'Modo de Profiling' para incluir o explain do $vectorSearch."
+        return Data(data=profile)
+
+    @staticmethod
+    def _describe_query_vector(query_vector: Any) -> str:
+        if isinstance(query_vector, Binary):
+            return f"<binary vector {query_vector.as_vector().dtype.name}, {len(query_vector)} bytes>"
+        return f"<{len(query_vector)} floats>"
+
+    @classmethod
+    def _summarize_pipeline(cls, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # O vetor da consulta é substituído por um resumo para manter a saída legível
+        vector_stage = pipeline[0]["$vectorSearch"]
+        return [
+            {"$vectorSearch": {**vector_stage, "queryVector": cls._describe_query_vector(vector_stage["queryVector"])}},
+            *pipeline[1:],
+        ]
+
+    def _explain_search(self, vs: MongoDBAtlasVectorSearch, pipeline: List[Dict[str, Any]]) -> None:
+        """Adiciona o explain da pipeline ao perfil; falhas aqui não afetam o resultado da busca."""
+        self._search_profile["pipeline"] = self._summarize_pipeline(pipeline)
+        try:
+            started = time.perf_counter()
+            explain = explain_aggregate(vs._collection, pipeline)
+            self._search_profile["explain_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self._search_profile["explain_summary"] = summarize_explain(explain)
+            self._search_profile["explain"] = explain
+        except Exception as e:
+            self._search_profile["explain_error"] = str(e)
+
+    def _search_documents_sync(self) -> List[Data]:
+        vs = self.build_vector_store()
+        if self.verify_search_index(vs._collection, vs._embedding_key) != "ready":
+            return self._index_building_result()
+
+        if not isinstance(self.search_query, str) or not self.search_query:
+            return []
+
+        # Define número de resultados
+        k = self.number_of_results
+        mongo_filter = self._create_setores_filter(self._parse_setores(self.setores))
+
+        started = time.perf_counter()
+        query_vectors = self._embed_search_queries()
+        embedding_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        results, plans = self._multi_query_sync(
+            vs._collection, query_vectors, self._mmr_fetch_k(k), mongo_filter, vs._embedding_key
+        )
+        self._search_profile = {
+            "engine": "atlas",
+            "driver": "pymongo",
+            "embedding_ms": round(embedding_ms, 2),
+            "client_round_trip_ms": round((time.perf_counter() - started) * 1000, 2),
+            "results_returned": len(results),
+            **self._plans_profile(plans),
+        }
+        if getattr(self, "enable_profiling", False):
+            self._explain_search(vs, plans[0]["pipeline"])
+
+        results = self._apply_mmr(query_vectors[0], results, k, vs._embedding_key)
+        return self._docs_scores_to_data(self._results_to_docs_scores(results, vs._text_key))
 
+    def _docs_scores_to_data(self, docs_scores: List[Any]) -> List[Data]:
         # Filtra por score mínimo
         if self.min_similarity_score:
             try:
@@ -227,25 +2117,108 @@ class MongoVectorStoreComponent(LCVectorStoreComponent):
             processed.append(doc)
 
         data = docs_to_data(processed)
-        self.status = data
+        mmr = (getattr(self, "_search_profile", None) or {}).get("mmr")
+        self.status = f"MMR: {len(data)} resultado(s) selecionado(s) de {mmr['candidates']} candidato(s)." if mmr else data
         return data
 
-    def _matches_setores(self, doc: Data, setores_list: Optional[List[str]]) -> bool:
-        if not setores_list:
-            return True
-        val = doc.metadata.get('setores')
-        if isinstance(val, list):
-            return any(s in val for s in setores_list)
-        return isinstance(val, str) and val in setores_list
-
-    def verify_search_index(self, collection) -> None:
-        indexes = collection.list_search_indexes()
-        names = {idx['name']: idx['type'] for idx in indexes}
-        if self.index_name not in names or names[self.index_name] != 'vectorSearch':
-            fields = [
-                {"type": "vector", "path": self.index_field, "numDimensions": self.number_dimensions, "similarity": self.similarity, "quantization": self.quantization},
-                {"type": "filter", "path": "setores"},
-            ]
-            model = SearchIndexModel(definition={"fields": fields}, name=self.index_name, type="vectorSearch")
-            collection.create_search_index(model)
-            time.sleep(20)
+    def _index_key(self, collection_name: Optional[str] = None) -> str:
+        """Chave do índice no registro; sem collection_name resolve o alias (pode consultar o Atlas)."""
+        return _search_index_key(
+            self.mongodb_atlas_cluster_uri, self.db_name, collection_name or self._physical_collection_name(), self.index_name
+        )
+
+    def _vector_storage(self) -> str:
+        """Formato de gravação dos embeddings: 'array' ou o tipo do binary vector derivado de quantization."""
+        if not getattr(self, "store_binary_vectors", False):
+            return "array"
+        storage = VECTOR_STORAGE_BY_QUANTIZATION.get(self.quantization, "float32")
+        if storage == "int8" and self.similarity != "cosine":
+            raise ValueError("Binary vectors int8 exigem similaridade 'cosine'.")
+        if storage == "packed_bit" and self.similarity != "euclidean":
+            raise ValueError("Binary vectors packed bit exigem similaridade 'euclidean'.")
+        return storage
+
+    def _stored_vector(self, vector: List[float], storage: str) -> Any:
+        return list(vector) if storage == "array" else encode_vector(vector, storage)
+
+    def _vector_index_model(self, embedding_key: str) -> SearchIndexModel:
+        vector_field = {
+            "type": "vector",
+            "path": embedding_key,
+            "numDimensions": self.number_dimensions,
+            "similarity": self.similarity,
+        }
+        # Vetores int8/packed bit já chegam quantizados; a quantização automática só vale para float
+        if self.quantization and self._vector_storage() in ("array", "float32"):
+            vector_field["quantization"] = self.quantization
+        return SearchIndexModel(
+            definition={"fields": [vector_field, {"type": "filter", "path": "setores"}]},
+            name=self.index_name,
+            type="vectorSearch",
+        )
+
+    def _poll_search_index(self, collection, embedding_key: str) -> Dict[str, Any]:
+        """Atualiza o estado do índice no registro, consultando o Atlas apenas quando o próximo poll venceu.
+
+        O lock do registro só protege a leitura e a atualização da entrada; list_search_indexes e
+        create_search_index rodam fora dele, como o ping em get_mongo_client. O próximo poll é reservado
+        antes da chamada, para outras threads não repetirem o mesmo round trip.
+        """
+        registry = _shared_registry("search_indexes")
+        key = self._index_key(collection.name)
+        lock = registry.setdefault("lock", threading.Lock())
+        with lock:
+            # Atualiza a entrada no lugar: outros campos (ex.: 'prefilter') são mantidos
+            entry = registry.setdefault(key, {})
+            now = time.monotonic()
+            if entry.get("status") == "ready" or now < entry.get("next_poll", 0):
+                return dict(entry)
+            interval = min(entry["interval"] * 2, INDEX_POLL_MAX_SECONDS) if "interval" in entry else INDEX_POLL_INITIAL_SECONDS
+            create = not entry.get("create_requested")
+            entry.update(status=entry.get("status", "building"), interval=interval, next_poll=now + interval)
+
+        found = list(collection.list_search_indexes(self.index_name))
+        status = "building"
+        if not found:
+            if create:
+                try:
+                    collection.create_search_index(self._vector_index_model(embedding_key))
+                except OperationFailure as e:
+                    # Outro processo pode ter criado o índice entre a listagem e a criação
+                    if "already" not in str(e).lower():
+                        raise
+        else:
+            index = found[0]
+            if index.get("type", "vectorSearch") != "vectorSearch":
+                raise ValueError(f"O índice '{self.index_name}' existe mas não é do tipo vectorSearch.")
+            if index.get("status") == "FAILED":
+                raise ValueError(f"A construção do índice '{self.index_name}' falhou no Atlas.")
+            if index.get("queryable") or index.get("status") == "READY":
+                status = "ready"
+
+        with lock:
+            entry = registry.setdefault(key, {})
+            entry.update(status=status, create_requested=True)
+            return dict(entry)
+
+    def verify_search_index(self, collection, embedding_key: str = "embedding") -> str:
+        """Garante que o índice vetorial existe e retorna 'ready' ou 'building'.
+
+        Índices já verificados neste processo não geram round trip. Um índice em construção é
+        consultado com backoff exponencial por até index_ready_timeout_seconds.
+        """
+        wait = max(0, int(getattr(self, "index_ready_timeout_seconds", 20) or 0))
+        deadline = time.monotonic() + wait
+        while True:
+            entry = self._poll_search_index(collection, embedding_key)
+            if entry["status"] == "ready":
+                return "ready"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "building"
+            time.sleep(min(max(entry.get("next_poll", 0) - time.monotonic(), 0.05), remaining))
+
+    def _index_building_result(self) -> List[Data]:
+        self.status = f"Índice vetorial '{self.index_name}' em construção no Atlas; tente novamente em instantes."
+        self._search_profile = {"index_status": "building"}
+        return []
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline do LLMRerankComponent.
+
+Executa rerank_chunks com chunks sintéticos no formato de knowledge_context e um
+LLM falso e determinístico (latência e vazão de tokens configuráveis), sem acesso
+à rede. Para cada configuração informa latência p50/p95, tokens de prompt e pico
+de memória.
+
+Exemplo:
+    python scripts/benchmark_rerank.py --chunks 10 40 --chunk-words 150 600 --batch-sizes 0 8 --concurrency 4
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+RERANK_COMPONENT_PATH = Path(__file__).resolve().parent.parent / "flows" / "chat" / "LLM Rerank (Lexical + Semântico + Pesos).py"
+
+VOCABULARIO = (
+    "reunião risco crédito orçamento trimestre campanha cliente contrato auditoria compliance diretoria "
+    "projeto entrega prazo equipe setor operacional estratégico tático indicador meta receita custo "
+    "fornecedor processo sistema migração dados relatório aprovação pendência decisão próximo passo"
+).split()
+SETORES = ["Risco", "Operacional", "Comercial", "Financeiro", "Jurídico"]
+
+
+def load_rerank_module():
+    """Carrega o arquivo do componente (o nome contém espaços, então não é importável diretamente)."""
+    spec = importlib.util.spec_from_file_location("llm_rerank_component", RERANK_COMPONENT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeLanguageModel:
+    """
+    LLM falso e determinístico compatível com invoke()/stream().
+
+    A latência simula o tempo até o primeiro token (fixo + proporcional ao prompt)
+    e a geração da resposta a uma vazão fixa de tokens por segundo.
+    """
+
+    def __init__(self, count_tokens, first_token_latency=0.3, prompt_tokens_per_second=20000.0,
+                 output_tokens_per_second=80.0):
+        self.model_name = "fake-rerank-llm"
+        self._count_tokens = count_tokens
+        self.first_token_latency = first_token_latency
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.output_tokens_per_second = output_tokens_per_second
+        self._lock = threading.Lock()
+        self.prompt_tokens = 0
+        self.calls = 0
+
+    def _score(self, text: str) -> int:
+        return int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) % 11
+
+    def _pieces(self, prompt: str):
+        tokens = self._count_tokens(prompt)
+        with self._lock:
+            self.prompt_tokens += tokens
+            self.calls += 1
+        time.sleep(self.first_token_latency + tokens / self.prompt_tokens_per_second)
+        entries = re.findall(r"^\[(c\d+)\] (.*)$", prompt, flags=re.MULTILINE)
+        yield "{"
+        for idx, (label, text) in enumerate(entries):
+            piece = f'"{label}": {self._score(text)}' + (", " if idx < len(entries) - 1 else "")
+            # Aproximadamente 4 tokens por par "cN": nota
+            time.sleep(4 / self.output_tokens_per_second)
+            yield piece
+        yield "}"
+
+    def stream(self, prompt: str):
+        yield from self._pieces(prompt)
+
+    def invoke(self, prompt: str) -> str:
+        return "".join(self._pieces(prompt))
+
+
+def synthetic_chunks(n: int, words: int, source: str, seed: int):
+    """Gera chunks no formato de knowledge_context (lexicais com score, semânticos com similarity_score)."""
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(n):
+        text = " ".join(rng.choice(VOCABULARIO) for _ in range(words))
+        chunk = {
+            "_id": hashlib.md5(f"{source}-{seed}-{i}".encode()).hexdigest()[:24],
+            "text": text,
+            "resumo": " ".join(text.split()[:25]),
+            "setores": rng.sample(SETORES, 2),
+            "status": "ativo",
+            "classificacao": "reuniao",
+            "tipo": "transcricao",
+            "atualizado_em": f"2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+            "id_reuniao": f"reuniao-{i // 5}",
+        }
+        if source == "lexical":
+            chunk["score"] = round(rng.uniform(1.0, 12.0), 3)
+        else:
+            chunk["similarity_score"] = round(rng.uniform(0.6, 0.95), 4)
+        chunks.append(chunk)
+    return chunks
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_configuration(module, config, args):
+    """Executa uma configuração várias vezes e agrega latência, tokens e memória."""
+    latencies, peaks = [], []
+    llm = FakeLanguageModel(
+        module.count_tokens,
+        first_token_latency=args.first_token_latency,
+        prompt_tokens_per_second=args.prompt_tps,
+        output_tokens_per_second=args.output_tps,
+    )
+    for repeat in range(args.repeats):
+        half = config["chunks"] // 2
+        component = module.LLMRerankComponent(
+            question=args.question,
+            rerank_pesos={"lexical": 0.5, "semantic": 0.5},
+            lexical_chunks=synthetic_chunks(half, config["chunk_words"], "lexical", repeat),
+            semantic_chunks=synthetic_chunks(config["chunks"] - half, config["chunk_words"], "semantic", repeat),
+            llm=llm,
+            top_k=5,
+            score_final_min="0",
+            batch_size=config["batch_size"],
+            max_concurrency=config["concurrency"],
+            cache_ttl_seconds=0,
+            prerank_top_n=args.prerank_top_n,
+            snippet_max_tokens=args.snippet_max_tokens,
+        )
+        tracemalloc.start()
+        start = time.perf_counter()
+        component.rerank_chunks()
+        latencies.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        **config,
+        "p50_s": round(percentile(latencies, 50), 4),
+        "p95_s": round(percentile(latencies, 95), 4),
+        "prompt_tokens": llm.prompt_tokens // args.repeats,
+        "llm_calls": llm.calls // args.repeats,
+        "peak_mem_kb": round(max(peaks) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do LLMRerankComponent com LLM falso.")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10, 40], help="Total de chunks (lexicais + semânticos).")
+    parser.add_argument("--chunk-words", type=int, nargs="+", default=[150, 600], help="Palavras por chunk.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[0, 8], help="Valores de batch_size (0 = prompt único).")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4], help="Valores de max_concurrency.")
+    parser.add_argument("--repeats", type=int, default=5, help="Execuções por configuração.")
+    parser.add_argument("--prerank-top-n", type=int, default=0)
+    parser.add_argument("--snippet-max-tokens", type=int, default=0)
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="Segundos até o primeiro token.")
+    parser.add_argument("--prompt-tps", type=float, default=20000.0, help="Tokens de prompt processados por segundo.")
+    parser.add_argument("--output-tps", type=float, default=80.0, help="Tokens de saída gerados por segundo.")
+    parser.add_argument("--question", default="Quais riscos de crédito foram discutidos na última reunião de orçamento?")
+    parser.add_argument("--json", dest="json_path", help="Salva os resultados neste arquivo JSON.")
+    args = parser.parse_args()
+
+    module = load_rerank_module()
+    results = []
+    header = f"{'chunks':>6} {'palavras':>8} {'lote':>5} {'conc':>5} {'p50(s)':>8} {'p95(s)':>8} {'tokens':>8} {'chamadas':>8} {'mem(KB)':>9}"
+    print(header)
+    print("-" * len(header))
+    for chunks, words, batch_size, concurrency in itertools.product(
+        args.chunks, args.chunk_words, args.batch_sizes, args.concurrency
+    ):
+        config = {"chunks": chunks, "chunk_words": words, "batch_size": batch_size, "concurrency": concurrency}
+        result = run_configuration(module, config, args)
+        results.append(result)
+        print(
+            f"{chunks:>6} {words:>8} {batch_size:>5} {concurrency:>5} {result['p50_s']:>8} {result['p95_s']:>8} "
+            f"{result['prompt_tokens']:>8} {result['llm_calls']:>8} {result['peak_mem_kb']:>9}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados salvos em {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
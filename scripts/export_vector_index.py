@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exporta os embeddings de uma coleção (ex.: knowledge_context) para o índice vetorial local
+usado pelo MongoVectorStoreComponent nos motores 'local' e 'hibrido'.
+
+O índice é um diretório com a matriz de embeddings em memory-map (float32, ou int8 com escala
+por linha) e os metadados ao lado; cada exportação grava uma nova versão (v-*) e troca o arquivo
+CURRENT que aponta para ela. Permite desenvolver e fazer benchmark do ramo semântico sem um
+cluster Atlas.
+
+Exemplo:
+    python scripts/export_vector_index.py --uri "$MONGODB_URI" --db chat --collection knowledge_context \
+        --out ./data/knowledge_context_index --setores Risco Operacional --int8
+"""
+
+import argparse
+import importlib.util
+import time
+from pathlib import Path
+
+from pymongo import MongoClient
+
+VECTOR_STORE_COMPONENT_PATH = (
+    Path(__file__).resolve().parent.parent / "flows" / "chat" / "MongoDB Atlas Vector Store with search capabilities.py"
+)
+
+
+def load_vector_store_module():
+    """Carrega o arquivo do componente (o nome contém espaços, então não é importável diretamente)."""
+    spec = importlib.util.spec_from_file_location("mongo_vector_store_component", VECTOR_STORE_COMPONENT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta embeddings do MongoDB para o índice vetorial local.")
+    parser.add_argument("--uri", required=True, help="URI do cluster MongoDB.")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--collection", required=True, help="Nome lógico; segue o alias de _collection_aliases (overwrite blue/green).")
+    parser.add_argument("--out", required=True, help="Diretório do índice (cada exportação vira uma nova versão, publicada ao final).")
+    parser.add_argument("--setores", nargs="*", help="Exporta apenas estes setores (ex.: setores quentes).")
+    parser.add_argument("--similarity", choices=["cosine", "euclidean", "dotProduct"], default="cosine")
+    parser.add_argument("--int8", action="store_true", help="Quantiza os vetores em int8 com escala por linha.")
+    parser.add_argument("--embedding-key", default="embedding")
+    parser.add_argument("--text-key", default="text")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    module = load_vector_store_module()
+    collection = MongoClient(args.uri)[args.db][module.resolve_collection_name(args.uri, args.db, args.collection)]
+    start = time.perf_counter()
+    manifest = module.export_local_vector_index(
+        collection,
+        args.out,
+        embedding_key=args.embedding_key,
+        text_key=args.text_key,
+        similarity=args.similarity,
+        quantization="int8" if args.int8 else "float32",
+        setores=args.setores or None,
+        batch_size=args.batch_size,
+    )
+    vector_bytes = manifest["count"] * manifest["dimensions"] * (1 if args.int8 else 4)
+    print(
+        f"{manifest['count']} vetores de {manifest['dimensions']} dimensões exportados para {args.out} "
+        f"({vector_bytes / 1024 / 1024:.1f} MB de vetores) em {time.perf_counter() - start:.1f}s."
+    )
+
+
+if __name__ == "__main__":
+    main()
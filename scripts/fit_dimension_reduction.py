@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ajusta a redução de dimensionalidade do MongoVectorStoreComponent e mede o recall contra os vetores completos.
+
+Lê uma amostra de embeddings (da coleção via $sample, ou de um índice local exportado com
+scripts/export_vector_index.py), separa parte da amostra como consultas e compara o top-k exato com
+os vetores completos ao top-k com os vetores reduzidos (PCA e truncamento Matryoshka), para cada
+dimensão pedida. Com --output, grava a projeção PCA na dimensão escolhida para uso no componente
+(redução 'pca', 'Arquivo de Projeção PCA' e 'Number of Dimensions' iguais à dimensão gravada).
+
+Exemplo:
+    python scripts/fit_dimension_reduction.py --uri "$MONGODB_URI" --db chat --collection knowledge_context \
+        --sample 20000 --dims 256 384 512 768 1024 --k 10 --output ./data/pca_512.npz --output-dims 512
+"""
+
+import argparse
+import importlib.util
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from pymongo import MongoClient
+
+VECTOR_STORE_COMPONENT_PATH = (
+    Path(__file__).resolve().parent.parent / "flows" / "chat" / "MongoDB Atlas Vector Store with search capabilities.py"
+)
+QUERY_BLOCK_ROWS = 256
+
+
+def load_vector_store_module():
+    """Carrega o arquivo do componente (o nome contém espaços, então não é importável diretamente)."""
+    spec = importlib.util.spec_from_file_location("mongo_vector_store_component", VECTOR_STORE_COMPONENT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sample_from_collection(module, collection, embedding_key: str, size: int) -> np.ndarray:
+    pipeline = [
+        {"$match": {embedding_key: {"$exists": True}}},
+        {"$sample": {"size": size}},
+        {"$project": {"_id": 0, embedding_key: 1}},
+    ]
+    vectors = [module.decode_vector(doc[embedding_key]) for doc in collection.aggregate(pipeline, allowDiskUse=True)]
+    if len({len(v) for v in vectors}) > 1:
+        raise SystemExit("A amostra tem embeddings de dimensões diferentes; a coleção já foi parcialmente reduzida?")
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def sample_from_local_index(module, path: str, size: int, seed: int) -> np.ndarray:
+    with module.LocalVectorIndex(path) as index:
+        count = index.vectors.shape[0]
+        rows = np.sort(np.random.default_rng(seed).choice(count, size=min(size, count), replace=False))
+        return index.row_vectors(rows)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k(queries: np.ndarray, base: np.ndarray, k: int) -> np.ndarray:
+    """Top-k exato por produto interno (vetores já normalizados), em blocos de consultas."""
+    result = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), QUERY_BLOCK_ROWS):
+        scores = queries[start:start + QUERY_BLOCK_ROWS] @ base.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        result[start:start + QUERY_BLOCK_ROWS] = top
+    return result
+
+
+def recall_at_k(expected: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return hits / expected.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajusta PCA/Matryoshka e mede recall@k por dimensão.")
+    parser.add_argument("--uri", help="URI do cluster MongoDB (ou use --local-index).")
+    parser.add_argument("--db")
+    parser.add_argument("--collection", help="Nome lógico; segue o alias de _collection_aliases (overwrite blue/green).")
+    parser.add_argument("--local-index", help="Diretório de um índice local exportado, em vez do Atlas.")
+    parser.add_argument("--embedding-key", default="embedding")
+    parser.add_argument("--sample", type=int, default=20000, help="Embeddings amostrados.")
+    parser.add_argument("--queries", type=int, default=500, help="Embeddings da amostra usados como consultas (não entram no ajuste).")
+    parser.add_argument("--dims", type=int, nargs="+", default=[256, 384, 512, 768, 1024])
+    parser.add_argument("--methods", nargs="+", choices=["pca", "matryoshka"], default=["pca", "matryoshka"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Grava a projeção PCA (.npz) para o componente.")
+    parser.add_argument("--output-dims", type=int, help="Dimensão da projeção gravada em --output.")
+    parser.add_argument("--json", dest="json_path", help="Salva os resultados neste arquivo JSON.")
+    args = parser.parse_args()
+
+    module = load_vector_store_module()
+    if args.local_index:
+        sample = sample_from_local_index(module, args.local_index, args.sample, args.seed)
+    elif args.uri and args.db and args.collection:
+        collection = MongoClient(args.uri)[args.db][module.resolve_collection_name(args.uri, args.db, args.collection)]
+        sample = sample_from_collection(module, collection, args.embedding_key, args.sample)
+    else:
+        parser.error("Informe --uri/--db/--collection ou --local-index.")
+    if len(sample) <= args.queries + args.k:
+        raise SystemExit(f"Amostra pequena demais ({len(sample)}) para {args.queries} consultas e k={args.k}.")
+
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(len(sample))
+    queries, base = sample[order[:args.queries]], sample[order[args.queries:]]
+    full_dims = sample.shape[1]
+    expected = top_k(normalize(queries), normalize(base), args.k)
+    print(f"Amostra: {len(base)} vetores base + {len(queries)} consultas, {full_dims} dimensões, k={args.k}\n")
+
+    fit_dims = max([d for d in args.dims if d <= min(base.shape)] + [args.output_dims or 0])
+    pca, cumulative = module.fit_pca_reduction(base, fit_dims) if "pca" in args.methods else (None, None)
+
+    results = []
+    header = f"{'método':>10} {'dims':>6} {'recall@k':>9} {'var. expl.':>10} {'bytes/vetor':>11} {'redução':>8} {'consulta(ms)':>12}"
+    print(header)
+    print("-" * len(header))
+    for method in args.methods:
+        for dims in sorted(args.dims):
+            if dims >= full_dims or (method == "pca" and dims > fit_dims):
+                continue
+            if method == "pca":
+                reduction = module.DimensionReduction("pca", dims, pca.mean, pca.components[:dims])
+            else:
+                reduction = module.DimensionReduction("matryoshka", dims)
+            reduced_base, reduced_queries = reduction.apply(base), reduction.apply(queries)
+            started = time.perf_counter()
+            found = top_k(reduced_queries, reduced_base, args.k)
+            query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+            result = {
+                "method": method,
+                "dimensions": dims,
+                "recall_at_k": round(recall_at_k(expected, found), 4),
+                "explained_variance": round(float(cumulative[dims - 1]), 4) if method == "pca" else None,
+                "bytes_per_vector": dims * 4,
+                "size_reduction": round(1 - dims / full_dims, 4),
+                "query_ms": round(query_ms, 3),
+            }
+            results.append(result)
+            variance = f"{result['explained_variance']:.3f}" if method == "pca" else "-"
+            print(
+                f"{method:>10} {dims:>6} {result['recall_at_k']:>9.3f} {variance:>10} {dims * 4:>11} "
+                f"{result['size_reduction'] * 100:>7.0f}% {result['query_ms']:>12.3f}"
+            )
+
+    if args.output:
+        output_dims = args.output_dims or fit_dims
+        if pca is None or output_dims > fit_dims:
+            pca, cumulative = module.fit_pca_reduction(base, output_dims)
+        projection = module.DimensionReduction("pca", output_dims, pca.mean, pca.components[:output_dims])
+        projection.save(args.output, cumulative)
+        print(f"\nProjeção PCA {full_dims} -> {output_dims} salva em {args.output} (variância explicada {cumulative[output_dims - 1]:.3f}).")
+        print("Recrie o índice com numDimensions igual à dimensão reduzida e reingira a coleção (modo overwrite).")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"full_dimensions": full_dims, "k": args.k, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados salvos em {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Converte embeddings gravados como array BSON de doubles (ex.: knowledge_context.embedding)
+para BSON binary vector (float32, int8 ou packed bit), em lotes, e informa a redução de tamanho.
+
+Use o mesmo formato configurado no MongoVectorStoreComponent (store_binary_vectors + quantization):
+float32 sem quantização, int8 com 'scalar' (similaridade cosine) e packed_bit com 'binary'
+(similaridade euclidean). Para int8/packed_bit, o índice vetorial deve ser recriado sem a opção
+'quantization', pois os vetores já estarão quantizados.
+
+Exemplo:
+    python scripts/migrate_binary_vectors.py --uri "$MONGODB_URI" --db chat --collection knowledge_context \
+        --dtype float32 --batch-size 500 --dry-run
+"""
+
+import argparse
+import importlib.util
+import time
+from pathlib import Path
+
+import bson
+from pymongo import MongoClient, UpdateOne
+
+VECTOR_STORE_COMPONENT_PATH = (
+    Path(__file__).resolve().parent.parent / "flows" / "chat" / "MongoDB Atlas Vector Store with search capabilities.py"
+)
+
+
+def load_vector_store_module():
+    """Carrega o arquivo do componente (o nome contém espaços, então não é importável diretamente)."""
+    spec = importlib.util.spec_from_file_location("mongo_vector_store_component", VECTOR_STORE_COMPONENT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def field_size(value) -> int:
+    """Tamanho em BSON do valor como campo de um documento."""
+    return len(bson.encode({"v": value}))
+
+
+def migrate(module, collection, embedding_key: str, dtype: str, batch_size: int, limit: int = 0, dry_run: bool = False):
+    """Converte os documentos em lotes (apenas os que ainda têm o embedding como array) e retorna as estatísticas."""
+    stats = {"documents": 0, "bytes_before": 0, "bytes_after": 0, "batches": 0}
+    query = {embedding_key: {"$type": "array"}}
+    cursor = collection.find(query, {embedding_key: 1}, batch_size=batch_size)
+    if limit > 0:
+        cursor = cursor.limit(limit)
+    for batch in module._batched(cursor, batch_size):
+        operations = []
+        for doc in batch:
+            packed = module.encode_vector(doc[embedding_key], dtype)
+            stats["bytes_before"] += field_size(doc[embedding_key])
+            stats["bytes_after"] += field_size(packed)
+            # O filtro pelo tipo evita reconverter um documento atualizado por outra execução
+            operations.append(UpdateOne({"_id": doc["_id"], embedding_key: {"$type": "array"}}, {"$set": {embedding_key: packed}}))
+        if operations and not dry_run:
+            collection.bulk_write(operations, ordered=False)
+        stats["documents"] += len(operations)
+        stats["batches"] += 1
+        print(f"  lote {stats['batches']}: {stats['documents']} documento(s) convertido(s)", flush=True)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converte embeddings em array para BSON binary vector.")
+    parser.add_argument("--uri", required=True, help="URI do cluster MongoDB.")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--collection", required=True, help="Nome lógico; segue o alias de _collection_aliases (overwrite blue/green).")
+    parser.add_argument("--embedding-key", default="embedding")
+    parser.add_argument("--dtype", choices=["float32", "int8", "packed_bit"], default="float32")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=0, help="Converte no máximo este número de documentos (0 = todos).")
+    parser.add_argument("--dry-run", action="store_true", help="Calcula a redução sem gravar.")
+    args = parser.parse_args()
+
+    module = load_vector_store_module()
+    collection = MongoClient(args.uri)[args.db][module.resolve_collection_name(args.uri, args.db, args.collection)]
+    start = time.perf_counter()
+    stats = migrate(module, collection, args.embedding_key, args.dtype, args.batch_size, args.limit, args.dry_run)
+    before, after = stats["bytes_before"], stats["bytes_after"]
+    reduction = (1 - after / before) * 100 if before else 0.0
+    print(
+        f"\n{stats['documents']} documento(s) {'analisados' if args.dry_run else 'convertidos'} em {time.perf_counter() - start:.1f}s. "
+        f"Campo '{args.embedding_key}': {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB ({reduction:.1f}% menor)."
+    )
+
+
+if __name__ == "__main__":
+    main()
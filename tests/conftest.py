@@ -0,0 +1,183 @@
+"""Fixtures que carregam os componentes do diretório flows/ (os nomes dos arquivos contêm espaços)."""
+
+import copy
+import importlib.util
+from pathlib import Path
+
+import bson
+import pytest
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+FLOWS_CHAT = Path(__file__).resolve().parent.parent / "flows" / "chat"
+
+
+def load_component(filename: str, module_name: str):
+    spec = importlib.util.spec_from_file_location(module_name, FLOWS_CHAT / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def rerank_module():
+    return load_component("LLM Rerank (Lexical + Semântico + Pesos).py", "llm_rerank_component")
+
+
+@pytest.fixture(scope="session")
+def atlas_search_module():
+    return load_component("Mongo Atlas Search (com score e filtros via $match).py", "atlas_search_component")
+
+
+@pytest.fixture(scope="session")
+def vector_store_module():
+    return load_component("MongoDB Atlas Vector Store with search capabilities.py", "vector_store_component")
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    """Subconjunto dos operadores de consulta do MongoDB usado pelos componentes."""
+    for field, condition in (query or {}).items():
+        value = doc.get(field)
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            for op, expected in condition.items():
+                values = value if isinstance(value, list) else [value]
+                if op == "$in" and not any(v in expected for v in values):
+                    return False
+                if op == "$exists" and (field in doc) != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+    """Coleção em memória com a parte da API do PyMongo usada pelos componentes."""
+
+    def __init__(self, name: str = "docs", database=None):
+        self.name = name
+        self.database = database
+        self.docs = []
+        self.search_indexes = []
+        self.pipelines = []
+        self.aggregate_results = []
+        self.codec_options = CodecOptions()
+
+    def with_options(self, codec_options=None, **kwargs):
+        view = copy.copy(self)
+        view.codec_options = codec_options or self.codec_options
+        return view
+
+    def find(self, query=None, projection=None, **kwargs):
+        return [copy.deepcopy(doc) for doc in self.docs if _matches(doc, query)]
+
+    def find_one(self, query=None, projection=None, sort=None):
+        found = self.find(query)
+        for field, direction in reversed(sort or []):
+            found.sort(key=lambda doc: doc.get(field), reverse=direction < 0)
+        return found[0] if found else None
+
+    def count_documents(self, query):
+        return len(self.find(query))
+
+    def insert_many(self, docs, ordered=True):
+        self.docs.extend(copy.deepcopy(doc) for doc in docs)
+
+    def replace_one(self, query, doc, upsert=False):
+        kept = [d for d in self.docs if not _matches(d, query)]
+        if upsert or len(kept) < len(self.docs):
+            self.docs = kept + [copy.deepcopy(doc)]
+
+    def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            self.replace_one(operation._filter, operation._doc, upsert=operation._upsert)
+
+    def update_one(self, query, update, upsert=False):
+        doc = next((d for d in self.docs if _matches(d, query)), None)
+        if doc is None:
+            if not upsert:
+                return
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            self.docs.append(doc)
+        for field, value in update.get("$set", {}).items():
+            doc[field] = copy.deepcopy(value)
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+        for field, condition in update.get("$pull", {}).items():
+            doc[field] = [item for item in doc.get(field, []) if not _matches(item, condition)]
+
+    def delete_many(self, query):
+        self.docs = [d for d in self.docs if not _matches(d, query)]
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        results = copy.deepcopy(self.aggregate_results)
+        if self.codec_options.document_class is RawBSONDocument:
+            results = [RawBSONDocument(bson.encode(doc)) for doc in results]
+        return FakeCursor(results)
+
+    def list_search_indexes(self, name=None):
+        return [index for index in self.search_indexes if name is None or index["name"] == name]
+
+    def create_search_index(self, model):
+        document = model.document
+        self.search_indexes.append(
+            {**document, "latestDefinition": document["definition"], "status": "READY", "queryable": True}
+        )
+        return document["name"]
+
+
+class FakeDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self.collections = {}
+        self.commands = []
+        # Resposta de command() por nome do comando (ex.: "explain")
+        self.command_results = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, self)
+        return self.collections[name]
+
+    def command(self, command):
+        self.commands.append(command)
+        return copy.deepcopy(self.command_results.get(next(iter(command)), {"ok": 1.0}))
+
+    def drop_collection(self, name: str):
+        self.collections.pop(name, None)
+
+    def list_collection_names(self):
+        return list(self.collections)
+
+
+class FakeMongoClient:
+    def __init__(self):
+        self.databases = {}
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        return self.databases.setdefault(name, FakeDatabase(name))
+
+
+@pytest.fixture
+def mongo_client():
+    return FakeMongoClient()
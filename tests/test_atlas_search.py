@@ -0,0 +1,227 @@
+import pytest
+
+SEARCH_CLAUSE = {"text": {"query": "crédito", "path": "text"}}
+
+
+def make_component(atlas_search_module):
+    return atlas_search_module.MongoAtlasSearchWithFilters(index_name="idx", min_score_fallback="0", limit_fallback=20)
+
+
+def test_pipeline_moves_indexed_filters_into_search_compound(atlas_search_module):
+    component = make_component(atlas_search_module)
+    instruction = {"search_clause": SEARCH_CLAUSE, "filter_stages": [{"tipo": "ata", "nota": {"$gte": 3}}], "limit": 5}
+    pipeline = component._build_search_pipeline(instruction, ["Risco"], "ativo", {"setores": {"token"}, "tipo": {"token"}})
+
+    search = pipeline[0]["$search"]
+    assert search["index"] == "idx"
+    assert search["compound"]["must"] == [SEARCH_CLAUSE]
+    assert search["compound"]["filter"] == [
+        {"in": {"path": "setores", "value": ["Risco"]}},
+        {"equals": {"path": "tipo", "value": "ata"}},
+    ]
+    assert {"$match": {"status": "ativo"}} in pipeline
+    assert {"$match": {"nota": {"$gte": 3}}} in pipeline
+    assert {"$sort": {"search_score": -1}} in pipeline
+    assert {"$limit": 5} in pipeline
+
+
+def test_pipeline_without_index_mapping_filters_with_match(atlas_search_module):
+    component = make_component(atlas_search_module)
+    pipeline = component._build_search_pipeline({"search_clause": SEARCH_CLAUSE, "min_score": 1.5}, ["Risco"], "")
+
+    assert pipeline[0]["$search"] == {"index": "idx", **SEARCH_CLAUSE}
+    assert {"$match": {"search_score": {"$gte": 1.5}}} in pipeline
+    assert {"$match": {"setores": {"$in": ["Risco"]}}} in pipeline
+
+
+def test_pipeline_requires_search_clause(atlas_search_module):
+    with pytest.raises(ValueError):
+        make_component(atlas_search_module)._build_search_pipeline({}, [], "")
+
+
+def test_paginated_pipeline_sorts_inside_search_and_fetches_one_extra(atlas_search_module):
+    component = make_component(atlas_search_module)
+    page_request = {"cursor": "tok", "direction": "previous", "page_size": 0}
+    instruction = {"search_clause": SEARCH_CLAUSE, "sort_stage": {"atualizado_em": -1}, "limit": 3}
+    pipeline = component._build_search_pipeline(instruction, [], "", page_request=page_request)
+
+    search = pipeline[0]["$search"]
+    assert search["sort"] == {"atualizado_em": -1}
+    assert search["searchBefore"] == "tok"
+    assert not any("$sort" in stage for stage in pipeline)
+    assert {"$limit": 4} in pipeline
+    assert page_request["page_size"] == 3
+    assert pipeline[-1]["$project"][atlas_search_module.PAGINATION_TOKEN_FIELD] == 1
+
+
+def page_docs(atlas_search_module, count):
+    return [{"_id": i, atlas_search_module.PAGINATION_TOKEN_FIELD: f"t{i}"} for i in range(count)]
+
+
+def test_paginate_forward_trims_lookahead_and_returns_cursors(atlas_search_module):
+    component = make_component(atlas_search_module)
+    page, info = component._paginate(
+        page_docs(atlas_search_module, 4), {"cursor": "t0", "direction": "next", "page_size": 3}
+    )
+    assert [doc["_id"] for doc in page] == [0, 1, 2]
+    assert all(atlas_search_module.PAGINATION_TOKEN_FIELD not in doc for doc in page)
+    assert info["has_more"] is True
+    assert info["next_cursor"] == "t2"
+    assert info["previous_cursor"] == "t0"
+
+
+def test_paginate_last_page_has_no_next_cursor(atlas_search_module):
+    component = make_component(atlas_search_module)
+    page, info = component._paginate(
+        page_docs(atlas_search_module, 2), {"cursor": "", "direction": "next", "page_size": 3}
+    )
+    assert len(page) == 2
+    assert info["has_more"] is False
+    assert info["next_cursor"] is None
+    assert info["previous_cursor"] is None
+
+
+def test_paginate_backward_restores_display_order(atlas_search_module):
+    component = make_component(atlas_search_module)
+    page, info = component._paginate(
+        page_docs(atlas_search_module, 4), {"cursor": "t9", "direction": "previous", "page_size": 3}
+    )
+    assert [doc["_id"] for doc in page] == [2, 1, 0]
+    assert info["next_cursor"] == "t0"
+    assert info["previous_cursor"] == "t2"
+
+
+def test_result_cache_hits_until_the_watermark_changes(atlas_search_module):
+    cache = atlas_search_module.SearchResultCache(max_entries=10)
+    key = cache.make_key("coll", "idx", [{"$search": {}}])
+    cache.set(key, "coll", [{"_id": 1}], watermark=[1, None])
+
+    assert cache.get(key, "coll", ttl_seconds=60, watermark=[1, None]) == [{"_id": 1}]
+    assert cache.get(key, "coll", ttl_seconds=60, watermark=[2, None]) is None
+    # A entrada vencida foi descartada
+    assert cache.get(key, "coll", ttl_seconds=60, watermark=[1, None]) is None
+
+
+def test_result_cache_expires_evicts_and_invalidates(atlas_search_module):
+    cache = atlas_search_module.SearchResultCache(max_entries=2)
+    keys = [cache.make_key("coll", "idx", [{"$limit": n}]) for n in range(3)]
+    for n, key in enumerate(keys):
+        cache.set(key, "coll", [{"_id": n}])
+
+    assert cache.get(keys[0], "coll", ttl_seconds=60) is None
+    assert cache.get(keys[1], "coll", ttl_seconds=-1) is None
+    cache.invalidate("coll")
+    assert cache.get(keys[2], "coll", ttl_seconds=60) is None
+
+
+def test_result_cache_key_keeps_stage_key_order(atlas_search_module):
+    make_key = atlas_search_module.SearchResultCache.make_key
+    assert make_key("c", "i", [{"$sort": {"a": 1, "b": 1}}]) != make_key("c", "i", [{"$sort": {"b": 1, "a": 1}}])
+    assert make_key("c", "i", [], variant="bytes=10") != make_key("c", "i", [])
+
+
+def test_watermark_is_reused_until_an_ingestion_in_this_process(
+    atlas_search_module, vector_store_module, mongo_client
+):
+    db = mongo_client["watermarks"]
+    collection = db["knowledge"]
+    collection.insert_many([{"_id": 1, "atualizado_em": 5}, {"_id": 2, "atualizado_em": 9}])
+    reads = []
+    markers = db[atlas_search_module.INGEST_WATERMARK_COLLECTION]
+    find_marker = markers.find_one
+    markers.find_one = lambda *args, **kwargs: reads.append(args) or find_marker(*args, **kwargs)
+    cache = atlas_search_module.SearchResultCache()
+
+    assert cache.current_watermark("coll", collection, "knowledge") == [0, 9]
+    assert cache.current_watermark("coll", collection, "knowledge") == [0, 9]
+    assert len(reads) == 1
+
+    vector_store_module.bump_ingest_watermark(db, "knowledge")
+    assert cache.current_watermark("coll", collection, "knowledge") == [1, 9]
+    assert len(reads) == 2
+
+
+def streamed_collection(mongo_client, docs):
+    collection = mongo_client["chat"]["knowledge"]
+    collection.aggregate_results = docs
+    return collection
+
+
+def test_stream_stops_at_the_byte_budget(atlas_search_module, mongo_client):
+    docs = [{"_id": n, "text": "x" * 100, "score": 1.0 - n / 10} for n in range(3)]
+    doc_bytes = len(atlas_search_module.bson.encode(docs[0]))
+    component = atlas_search_module.MongoAtlasSearchWithFilters(max_result_bytes=2 * doc_bytes + 10, max_result_tokens=0)
+
+    state = component._stream_sync(streamed_collection(mongo_client, docs), [{"$search": {}}])
+
+    assert [doc["_id"] for doc in state["results"]] == ["0", "1"]
+    assert state["bytes"] == 2 * doc_bytes
+    assert state["truncated"]
+
+
+def test_stream_stops_at_the_token_budget(atlas_search_module, mongo_client):
+    docs = [{"_id": n, "text": "x" * 40} for n in range(3)]
+    component = atlas_search_module.MongoAtlasSearchWithFilters(max_result_bytes=0, max_result_tokens=25)
+
+    state = component._stream_sync(streamed_collection(mongo_client, docs), [{"$search": {}}])
+
+    assert len(state["results"]) == 2
+    assert state["tokens"] == 20
+    assert state["truncated"]
+
+
+def test_stream_without_budget_returns_every_result(atlas_search_module, mongo_client):
+    docs = [{"_id": n, "text": "x"} for n in range(5)]
+    component = atlas_search_module.MongoAtlasSearchWithFilters(max_result_bytes=0, max_result_tokens=0, cursor_batch_size=2)
+
+    state = component._stream_sync(streamed_collection(mongo_client, docs), [{"$search": {}}])
+
+    assert len(state["results"]) == 5
+    assert not state["truncated"]
+
+
+def test_explain_aggregate_runs_execution_stats_and_returns_json(atlas_search_module, mongo_client):
+    collection = mongo_client["chat"]["knowledge"]
+    collection.database.command_results["explain"] = {"stages": [{"$search": {}, "nReturned": 2}], "ok": 1.0}
+    pipeline = [{"$search": {"text": {"query": "crédito", "path": "text"}}}]
+
+    explain = atlas_search_module.explain_aggregate(collection, pipeline)
+
+    assert explain["stages"][0]["nReturned"] == 2
+    assert collection.database.commands == [
+        {"explain": {"aggregate": "knowledge", "pipeline": pipeline, "cursor": {}}, "verbosity": "executionStats"}
+    ]
+
+
+def test_summarize_explain_reports_stage_times_and_mongot_documents(atlas_search_module):
+    explain = {
+        "stages": [
+            {"$_internalSearchMongotRemote": {}, "nReturned": 40, "executionTimeMillisEstimate": 12},
+            {"$_internalSearchIdLookup": {}, "nReturned": 40, "executionTimeMillisEstimate": 15},
+            {"$match": {}, "nReturned": 10, "executionTimeMillisEstimate": 16},
+        ]
+    }
+    summary = atlas_search_module.summarize_explain(explain)
+
+    assert [stage["stage"] for stage in summary["stages"]] == [
+        "$_internalSearchMongotRemote",
+        "$_internalSearchIdLookup",
+        "$match",
+    ]
+    assert summary["docs_examined"] == 40
+    assert summary["n_returned"] == 10
+    assert summary["server_time_ms"] == 16
+
+
+def test_summarize_explain_flattens_shards_and_sums_examined_documents(atlas_search_module):
+    explain = {
+        "shards": {
+            "s0": {"stages": [{"$cursor": {"executionStats": {"totalDocsExamined": 7, "totalKeysExamined": 3}}, "nReturned": 5}]},
+            "s1": {"stages": [{"$cursor": {"executionStats": {"totalDocsExamined": 4, "totalKeysExamined": 2}}, "nReturned": 1}]},
+        }
+    }
+    summary = atlas_search_module.summarize_explain(explain)
+
+    assert len(summary["stages"]) == 2
+    assert (summary["docs_examined"], summary["keys_examined"]) == (11, 5)
+    assert summary["server_time_ms"] is None
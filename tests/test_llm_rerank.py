@@ -0,0 +1,260 @@
+import re
+import threading
+
+
+def feed_by_char(parser, text):
+    scores = {}
+    for char in text:
+        scores.update(parser.feed(char))
+    scores.update(parser.close())
+    return scores
+
+
+def test_parser_keeps_decimals_split_across_pieces(rerank_module):
+    parser = rerank_module.IncrementalScoreParser(["c1", "c2"])
+    assert feed_by_char(parser, '{"c1": 7.5, "c2": 10}') == {"c1": 7.5, "c2": 10.0}
+
+
+def test_parser_accepts_quoted_and_comma_decimals(rerank_module):
+    parser = rerank_module.IncrementalScoreParser(["c1", "c2"])
+    assert feed_by_char(parser, '{"c1": "7,5", "c2":3}') == {"c1": 7.5, "c2": 3.0}
+
+
+def test_parser_holds_incomplete_number_until_close(rerank_module):
+    parser = rerank_module.IncrementalScoreParser(["c1"])
+    assert parser.feed('{"c1": 7.') == {}
+    assert parser.feed("5") == {}
+    assert parser.feed("}") == {"c1": 7.5}
+
+
+def test_parser_ignores_unknown_ids_and_clamps(rerank_module):
+    parser = rerank_module.IncrementalScoreParser(["c1"])
+    assert feed_by_char(parser, '{"c1": 12, "c9": 4}') == {"c1": 10.0}
+
+
+class NoStreamLLM:
+    def stream(self, prompt):
+        raise NotImplementedError("stream indisponível")
+        yield
+
+    def invoke(self, prompt):
+        return '{"c1": 8, "c2": 2.5}'
+
+
+class BrokenStreamLLM(NoStreamLLM):
+    def stream(self, prompt):
+        yield '{"c1": 6, '
+        raise ConnectionError("conexão perdida")
+
+
+def make_component(rerank_module):
+    return rerank_module.LLMRerankComponent(question="pergunta", snippet_max_tokens=0, prompt_max_tokens=0)
+
+
+def test_score_batch_falls_back_to_invoke_when_stream_fails_immediately(rerank_module):
+    batch = [("a", {"text": "primeiro"}), ("b", {"text": "segundo"})]
+    scores = make_component(rerank_module)._score_batch(NoStreamLLM(), "pergunta", batch)
+    assert scores == {"a": 8.0, "b": 2.5}
+
+
+def test_score_batch_keeps_partial_scores_when_stream_breaks_midway(rerank_module):
+    batch = [("a", {"text": "primeiro"}), ("b", {"text": "segundo"})]
+    scores = make_component(rerank_module)._score_batch(BrokenStreamLLM(), "pergunta", batch)
+    assert scores == {"a": 6.0}
+
+
+def test_bm25_ranks_documents_with_more_query_terms_first(rerank_module):
+    tokenize = rerank_module.tokenize_for_bm25
+    docs = [tokenize("política de crédito"), tokenize("crédito rural e política agrícola"), tokenize("reunião de equipe")]
+    scores = rerank_module.bm25_scores(tokenize("política crédito"), docs)
+    assert scores[0] > scores[1] > scores[2] == 0.0
+
+
+def test_bm25_without_query_terms_scores_zero(rerank_module):
+    assert rerank_module.bm25_scores([], [["a"], ["b"]]) == [0.0, 0.0]
+
+
+def test_fuse_scores_weighted_normalizes_each_source(rerank_module):
+    np = rerank_module.np
+    present = np.array([True, True, True])
+    fused = rerank_module.fuse_scores(
+        np.array([10.0, 5.0, 0.0]), np.array([0.2, 0.9, 0.5]), present, present, 0.5, 0.5
+    )
+    assert np.allclose(fused, [(1.0 + 0.0) / 2, (0.5 + 1.0) / 2, (0.0 + 3 / 7) / 2])
+
+
+def test_fuse_scores_rrf_gives_one_to_the_top_of_both_lists(rerank_module):
+    np = rerank_module.np
+    fused = rerank_module.fuse_scores(
+        np.array([3.0, 1.0, 0.0]),
+        np.array([0.9, 0.1, 0.0]),
+        np.array([True, True, False]),
+        np.array([True, True, False]),
+        1.0,
+        1.0,
+        mode="rrf",
+    )
+    assert fused[0] == 1.0
+    assert 0 < fused[1] < 1.0
+    assert fused[2] == 0.0
+
+
+def test_fuse_scores_without_weights_is_zero(rerank_module):
+    np = rerank_module.np
+    values, present = np.array([1.0, 2.0]), np.array([True, True])
+    assert not rerank_module.fuse_scores(values, values, present, present, 0.0, 0.0).any()
+
+
+def test_near_duplicate_groups_points_copies_to_the_first_member(rerank_module):
+    base = "O comitê aprovou a nova política de crédito para clientes do segmento varejo em março"
+    texts = [base, "Pauta da reunião de equipe sobre férias e escala de plantão", base + ".", "Relatório trimestral de risco"]
+    assert rerank_module.near_duplicate_groups(texts) == [0, 1, 0, 3]
+
+
+def test_near_duplicate_groups_ignores_texts_without_terms(rerank_module):
+    assert rerank_module.near_duplicate_groups(["", "", "de"]) == [0, 1, 2]
+
+
+class ScoreByTextLLM:
+    """Sem stream(): responde pela chamada completa com a nota escrita em cada texto ("nota 7")."""
+
+    def __init__(self, parties=1):
+        self.prompts = []
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        # Só passa quando todos os lotes estão em andamento ao mesmo tempo
+        self.barrier.wait()
+        labels = re.findall(r"\[(c\d+)\] nota (\d+)", prompt)
+        return "{" + ", ".join(f'"{label}": {score}' for label, score in labels) + "}"
+
+
+def test_score_with_llm_runs_batches_concurrently_and_merges_by_chunk_id(rerank_module):
+    component = rerank_module.LLMRerankComponent(batch_size=2, max_concurrency=3, snippet_max_tokens=0, prompt_max_tokens=0)
+    items = [(f"id{i}", {"text": f"nota {i}"}) for i in range(6)]
+    llm = ScoreByTextLLM(parties=3)
+
+    scores = component._score_with_llm(llm, "pergunta", items)
+
+    assert scores == {f"id{i}": float(i) for i in range(6)}
+    assert len(llm.prompts) == 3
+
+
+def test_score_with_llm_keeps_other_batches_when_one_call_fails(rerank_module):
+    component = rerank_module.LLMRerankComponent(batch_size=1, max_concurrency=2, snippet_max_tokens=0, prompt_max_tokens=0)
+    items = [("a", {"text": "nota 4"}), ("b", {"text": "nota 9 quebra"})]
+
+    class FailingLLM(ScoreByTextLLM):
+        def invoke(self, prompt):
+            if "quebra" in prompt:
+                raise RuntimeError("lote com falha")
+            return super().invoke(prompt)
+
+    scores = component._score_with_llm(FailingLLM(), "pergunta", items)
+    assert scores == {"a": 4.0}
+
+
+def test_score_cache_evicts_least_recently_used_entries(rerank_module):
+    cache = rerank_module.RerankScoreCache(max_entries=2, ttl_seconds=0)
+    cache.set_many({"a": 1.0, "b": 2.0})
+    assert cache.get("a") == 1.0
+    cache.set_many({"c": 3.0})
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1.0, 3.0)
+
+
+def test_score_cache_expires_entries_after_ttl(rerank_module, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rerank_module.time, "time", lambda: now[0])
+    cache = rerank_module.RerankScoreCache(max_entries=10, ttl_seconds=60)
+    cache.set_many({"a": 5.0})
+    now[0] += 59
+    assert cache.get("a") == 5.0
+    now[0] += 2
+    assert cache.get("a") is None
+
+
+def test_score_cache_reads_back_scores_from_sqlite(rerank_module, tmp_path):
+    db_path = str(tmp_path / "scores.sqlite")
+    rerank_module.RerankScoreCache(max_entries=10, ttl_seconds=3600, db_path=db_path).set_many({"a": 7.5})
+    assert rerank_module.RerankScoreCache(max_entries=10, ttl_seconds=3600, db_path=db_path).get("a") == 7.5
+
+
+def test_score_cache_key_depends_on_prompt_settings_and_question(rerank_module):
+    make_key = rerank_module.RerankScoreCache.make_key
+    key = make_key("gpt", "Qual a  política?", "id1", "texto", "snippet=0")
+    assert key == make_key("gpt", "qual a política?", "id1", "texto", "snippet=0")
+    assert key != make_key("gpt", "qual a política?", "id1", "texto", "snippet=50")
+    assert key != make_key("gpt", "qual a política?", "id1", "outro texto", "snippet=0")
+    assert key != make_key("outro", "qual a política?", "id1", "texto", "snippet=0")
+
+
+def test_score_chunks_only_sends_cache_misses_to_the_llm(rerank_module, tmp_path):
+    component = rerank_module.LLMRerankComponent(
+        batch_size=0,
+        snippet_max_tokens=0,
+        prompt_max_tokens=0,
+        cache_ttl_seconds=3600,
+        cache_max_entries=100,
+        cache_db_path=str(tmp_path / "scores.sqlite"),
+    )
+    llm = ScoreByTextLLM()
+    first = component._score_chunks(llm, "pergunta", [("a", {"text": "nota 3"})])
+    second = component._score_chunks(llm, "pergunta", [("a", {"text": "nota 3"}), ("b", {"text": "nota 8"})])
+
+    assert first == {"a": 3.0}
+    assert second == {"a": 3.0, "b": 8.0}
+    assert (component._cache_hits, component._cache_misses) == (1, 1)
+    assert "[c1] nota 8" in llm.prompts[-1] and "nota 3" not in llm.prompts[-1]
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_count_tokens_estimates_without_tiktoken(rerank_module, monkeypatch):
+    monkeypatch.setattr(rerank_module, "_get_token_encoder", lambda *args: None)
+    assert rerank_module.count_tokens("") == 0
+    assert rerank_module.count_tokens("abc") == 1
+    assert rerank_module.count_tokens("a" * 40) == 10
+
+
+def test_extract_snippet_keeps_short_texts(rerank_module, monkeypatch):
+    monkeypatch.setattr(rerank_module, "count_tokens", count_words)
+    assert rerank_module.extract_snippet("política de crédito", {"crédito"}, 10) == "política de crédito"
+
+
+def test_extract_snippet_centers_the_window_on_query_terms(rerank_module, monkeypatch):
+    monkeypatch.setattr(rerank_module, "count_tokens", count_words)
+    words = [f"w{i}" for i in range(100)]
+    words[50:52] = ["crédito", "rural"]
+    query_terms = set(rerank_module.tokenize_for_bm25("crédito rural"))
+    snippet = rerank_module.extract_snippet(" ".join(words), query_terms, 10)
+
+    assert count_words(snippet) <= 10
+    assert "crédito rural" in snippet
+    assert "w0" not in snippet
+
+
+def test_extract_snippet_joins_separate_windows(rerank_module, monkeypatch):
+    monkeypatch.setattr(rerank_module, "count_tokens", count_words)
+    words = [f"w{i}" for i in range(200)]
+    words[20], words[150] = "crédito", "rural"
+    query_terms = set(rerank_module.tokenize_for_bm25("crédito rural"))
+    snippet = rerank_module.extract_snippet(" ".join(words), query_terms, 20)
+
+    first, second = snippet.split(" ... ")
+    assert "crédito" in first and "rural" in second
+    assert count_words(snippet) <= 20
+
+
+def test_build_prompt_splits_the_prompt_budget_between_chunks(rerank_module, monkeypatch):
+    monkeypatch.setattr(rerank_module, "count_tokens", count_words)
+    component = rerank_module.LLMRerankComponent(snippet_max_tokens=0, prompt_max_tokens=20)
+    text = " ".join(f"w{i}" for i in range(50))
+    prompt = component._build_prompt("pergunta", [("a", {"text": text}), ("b", {"text": text})])
+
+    chunks = prompt.split("\n[c")[1:]
+    assert len(chunks) == 2
+    assert all(count_words(chunk) - 1 <= 10 for chunk in chunks)
@@ -0,0 +1,48 @@
+"""Os componentes são colados um a um no Langflow, então os trechos compartilhados ficam copiados em cada arquivo.
+
+Estes testes garantem que as cópias marcadas com "manter idêntico entre os arquivos" não divergiram.
+"""
+
+import ast
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+VECTOR_STORE = REPO_ROOT / "flows" / "chat" / "MongoDB Atlas Vector Store with search capabilities.py"
+ATLAS_SEARCH = REPO_ROOT / "flows" / "chat" / "Mongo Atlas Search (com score e filtros via $match).py"
+LLM_RERANK = REPO_ROOT / "flows" / "chat" / "LLM Rerank (Lexical + Semântico + Pesos).py"
+COLLECTION_COUNTER = REPO_ROOT / "custom_components" / "MongoDBCollectionCounter.py"
+
+
+def extract_block(path: Path, start_marker: str, end_marker: str) -> str:
+    source = path.read_text(encoding="utf-8")
+    start = source.index(start_marker)
+    end = source.index(end_marker, start)
+    return source[start:end]
+
+
+def extract_function(path: Path, name: str) -> str:
+    source = path.read_text(encoding="utf-8")
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            return ast.get_source_segment(source, node)
+    raise AssertionError(f"{name} não encontrado em {path.name}")
+
+
+@pytest.mark.parametrize("path", [ATLAS_SEARCH, COLLECTION_COUNTER], ids=lambda p: p.name)
+def test_mongo_client_registry_block_is_identical(path):
+    start = "# --- Registro de MongoClient compartilhado pelos componentes Mongo"
+    end = "# --- fim do registro de MongoClient ---"
+    assert extract_block(path, start, end) == extract_block(VECTOR_STORE, start, end)
+
+
+@pytest.mark.parametrize("path", [ATLAS_SEARCH, LLM_RERANK], ids=lambda p: p.name)
+def test_shared_registry_helper_is_identical(path):
+    assert extract_function(path, "_shared_registry") == extract_function(VECTOR_STORE, "_shared_registry")
+
+
+def test_aggregation_profiling_block_is_identical():
+    start = "# --- Profiling de agregações (manter idêntico entre os arquivos) ---"
+    end = "# --- fim do profiling de agregações ---"
+    assert extract_block(ATLAS_SEARCH, start, end) == extract_block(VECTOR_STORE, start, end)
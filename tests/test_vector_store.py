@@ -0,0 +1,566 @@
+import asyncio
+import os
+import threading
+
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("storage", ["float32", "int8", "packed_bit"])
+def test_binary_vectors_round_trip(vector_store_module, storage):
+    vector = [0.5, -0.25, 0.0, 1.0, -1.0, 0.125, 0.75, -0.5, 0.3, -0.9, 0.2]
+    decoded = np.asarray(vector_store_module.decode_vector(vector_store_module.encode_vector(vector, storage)))
+
+    assert decoded.shape == (len(vector),)
+    if storage == "float32":
+        assert np.allclose(decoded, vector)
+    elif storage == "int8":
+        # Escala por vetor: o cosseno é preservado
+        cosine = decoded @ vector / (np.linalg.norm(decoded) * np.linalg.norm(vector))
+        assert cosine > 0.999
+    else:
+        assert decoded.tolist() == [1.0 if v > 0 else -1.0 for v in vector]
+
+
+def test_decode_vector_passes_other_values_through(vector_store_module):
+    assert vector_store_module.decode_vector([1.0, 2.0]) == [1.0, 2.0]
+    assert vector_store_module.decode_vector(None) is None
+
+
+def test_mmr_select_prefers_diverse_candidates(vector_store_module):
+    candidates = [[1.0, 0.0], [0.99, 0.01], [0.6, 0.8]]
+    assert vector_store_module.mmr_select([1.0, 0.0], candidates, 2, lambda_mult=0.3) == [0, 2]
+
+
+def test_mmr_select_with_lambda_one_is_relevance_order(vector_store_module):
+    candidates = [[0.6, 0.8], [1.0, 0.0], [0.99, 0.01]]
+    assert vector_store_module.mmr_select([1.0, 0.0], candidates, 3, lambda_mult=1.0) == [1, 2, 0]
+
+
+def test_mmr_select_handles_empty_input_and_small_pools(vector_store_module):
+    assert vector_store_module.mmr_select([1.0, 0.0], [], 3) == []
+    assert vector_store_module.mmr_select([1.0, 0.0], [[1.0, 0.0]], 0) == []
+    assert vector_store_module.mmr_select([1.0, 0.0], [[1.0, 0.0], [0.0, 1.0]], 5) == [0, 1]
+
+
+def test_merge_search_results_keeps_best_score_per_id(vector_store_module):
+    merged = vector_store_module.merge_search_results(
+        [
+            [{"_id": 1, "score": 0.5}, {"_id": 2, "score": 0.9}],
+            [{"_id": 1, "score": 0.95}, {"_id": 3, "score": 0.1}],
+        ],
+        limit=2,
+    )
+    assert merged == [{"_id": 1, "score": 0.95}, {"_id": 2, "score": 0.9}]
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+class FakeAtlasVectorSearch:
+    def __init__(self, embedding, collection, index_name, text_key="text", embedding_key="embedding"):
+        self._embedding = embedding
+        self._collection = collection
+        self._index_name = index_name
+        self._text_key = text_key
+        self._embedding_key = embedding_key
+
+
+@pytest.fixture
+def make_vector_store(vector_store_module, mongo_client, monkeypatch, request):
+    monkeypatch.setattr(vector_store_module, "MongoDBAtlasVectorSearch", FakeAtlasVectorSearch)
+    monkeypatch.setattr(vector_store_module, "get_mongo_client", lambda *args, **kwargs: mongo_client)
+
+    def make(**overrides):
+        attributes = {
+            # URI única por teste: os registros por processo (aliases, índices) são chaveados por ela
+            "mongodb_atlas_cluster_uri": f"mongodb://{request.node.name}",
+            "enable_mtls": False,
+            "mongodb_atlas_client_cert": None,
+            "db_name": "chat",
+            "collection_name": "knowledge",
+            "index_name": "vector_index",
+            "insert_mode": "append",
+            "embedding": FakeEmbeddings(),
+            "number_dimensions": 2,
+            "similarity": "cosine",
+            "quantization": None,
+            "embedding_cache_max_entries": 0,
+            "ingest_data": None,
+        }
+        attributes.update(overrides)
+        return vector_store_module.MongoVectorStoreComponent(**attributes)
+
+    return make
+
+
+def documents(vector_store_module, *texts):
+    return [vector_store_module.Document(page_content=text, metadata={}) for text in texts]
+
+
+def test_blue_green_overwrite_swaps_alias_and_drops_replaced_collections(
+    vector_store_module, make_vector_store, mongo_client, monkeypatch
+):
+    timers = []
+
+    class RecordingTimer:
+        def __init__(self, delay, function):
+            self.delay, self.function = delay, function
+
+        def start(self):
+            timers.append(self)
+
+    monkeypatch.setattr(vector_store_module.threading, "Timer", RecordingTimer)
+    monkeypatch.setattr(vector_store_module, "COLLECTION_ALIAS_TTL_SECONDS", 0)
+    db = mongo_client["chat"]
+    db["knowledge"].insert_many([{"_id": "old", "text": "antigo"}])
+    db["knowledge"].create_search_index(vector_store_module.SearchIndexModel(definition={}, name="lexical"))
+
+    component = make_vector_store(
+        insert_mode="overwrite", swap_drop_grace_seconds=0, ingest_data=documents(vector_store_module, "novo")
+    )
+    store = component.build_vector_store()
+
+    shadow = store._collection.name
+    assert shadow.startswith("knowledge__")
+    assert [doc["text"] for doc in db[shadow].docs] == ["novo"]
+    assert {index["name"] for index in db[shadow].search_indexes} == {"lexical", "vector_index"}
+    alias = db["_collection_aliases"].find_one({"_id": "knowledge"})
+    assert alias["target"] == shadow
+    assert [entry["name"] for entry in alias["retired"]] == ["knowledge"]
+    # A coleção com o nome original continua lá até o drop em segundo plano
+    assert "knowledge" in db.collections
+
+    for timer in timers:
+        timer.function()
+    assert "knowledge" not in db.collections
+    assert db["_collection_aliases"].find_one({"_id": "knowledge"})["retired"] == []
+    assert vector_store_module.resolve_collection_name(component.mongodb_atlas_cluster_uri, "chat", "knowledge") == shadow
+
+    timers.clear()
+    second = make_vector_store(
+        insert_mode="overwrite", swap_drop_grace_seconds=0, ingest_data=documents(vector_store_module, "mais novo")
+    ).build_vector_store()
+    for timer in timers:
+        timer.function()
+    assert shadow not in db.collections
+    assert second._collection.name in db.collections
+
+
+def test_local_index_export_publishes_versions_and_retires_the_previous_one(
+    vector_store_module, mongo_client, tmp_path, monkeypatch
+):
+    collection = mongo_client["chat"]["knowledge"]
+    collection.insert_many(
+        [
+            {"_id": 1, "text": "risco", "embedding": [1.0, 0.0], "setores": ["Risco"]},
+            {"_id": 2, "text": "comercial", "embedding": [0.0, 1.0], "setores": ["Comercial"]},
+        ]
+    )
+    path = str(tmp_path / "index")
+    vector_store_module.export_local_vector_index(collection, path)
+    first = vector_store_module.load_local_vector_index(path)
+    assert first.search([1.0, 0.1], 1)[0][0]["text"] == "risco"
+    assert vector_store_module.load_local_vector_index(path) is first
+
+    collection.insert_many([{"_id": 3, "text": "operacional", "embedding": [0.6, 0.8], "setores": ["Operacional"]}])
+    manifest = vector_store_module.export_local_vector_index(collection, path)
+    second = vector_store_module.load_local_vector_index(path)
+    assert manifest["count"] == 3
+    assert second is not first and second.manifest["count"] == 3
+    # A versão anterior continua aberta e no disco durante a carência
+    assert first.metadata(0)["text"] == "risco"
+    assert os.path.isdir(first.path)
+    current = (tmp_path / "index" / "CURRENT").read_text(encoding="utf-8")
+    assert second.path == os.path.join(path, current)
+
+    monkeypatch.setattr(vector_store_module, "LOCAL_INDEX_CLOSE_GRACE_SECONDS", -1)
+    assert vector_store_module.load_local_vector_index(path) is second
+    assert first._metadata_file.closed
+    assert not os.path.exists(first.path)
+    assert sorted(os.listdir(path)) == ["CURRENT", current]
+
+
+def test_local_index_reads_the_unversioned_layout(vector_store_module, mongo_client, tmp_path):
+    collection = mongo_client["chat"]["knowledge"]
+    collection.insert_many([{"_id": 1, "text": "risco", "embedding": [1.0, 0.0], "setores": ["Risco"]}])
+    vector_store_module.export_local_vector_index(collection, str(tmp_path / "index"))
+    version_dir = vector_store_module.local_index_version_dir(str(tmp_path / "index"))
+    legacy = tmp_path / "legacy"
+    os.rename(version_dir, legacy)
+
+    with vector_store_module.LocalVectorIndex(str(legacy)) as index:
+        assert index.path == str(legacy)
+        assert index.search([1.0, 0.0], 1, ["Risco"])[0][0]["_id"] == 1
+
+
+class FakePyMongoClient:
+    def __init__(self, uri, **options):
+        self.uri, self.options = uri, options
+        self.closed = False
+        self.healthy = True
+        self.admin = self
+
+    def command(self, name):
+        if not self.healthy:
+            raise ConnectionError("sem resposta")
+        return {"ok": 1}
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_pymongo(vector_store_module, atlas_search_module, monkeypatch):
+    for module in (vector_store_module, atlas_search_module):
+        monkeypatch.setattr(module, "MongoClient", FakePyMongoClient)
+
+
+def test_mongo_client_is_shared_between_components(vector_store_module, atlas_search_module, fake_pymongo):
+    before = vector_store_module.mongo_client_metrics()
+    client = vector_store_module.get_mongo_client("mongodb://shared")
+    assert atlas_search_module.get_mongo_client("mongodb://shared") is client
+    assert vector_store_module.get_mongo_client("mongodb://shared", tls=True) is not client
+    assert client.options["maxPoolSize"] == vector_store_module.MONGO_MAX_POOL_SIZE
+
+    after = vector_store_module.mongo_client_metrics()
+    assert after["misses"] - before["misses"] == 2
+    assert after["hits"] - before["hits"] == 1
+
+
+def test_unhealthy_client_is_replaced_and_closed_only_after_the_ttl(vector_store_module, fake_pymongo, monkeypatch):
+    client = vector_store_module.get_mongo_client("mongodb://unhealthy")
+    client.healthy = False
+    monkeypatch.setattr(vector_store_module, "MONGO_HEALTH_CHECK_INTERVAL_SECONDS", -1)
+
+    replacement = vector_store_module.get_mongo_client("mongodb://unhealthy")
+    assert replacement is not client
+    # Outras threads podem estar usando o cliente aposentado
+    assert not client.closed
+
+    monkeypatch.setattr(vector_store_module, "MONGO_CLIENT_IDLE_TTL_SECONDS", -1)
+    vector_store_module.get_mongo_client("mongodb://other")
+    assert client.closed
+
+
+def test_idle_clients_are_evicted(vector_store_module, fake_pymongo, monkeypatch):
+    idle = vector_store_module.get_mongo_client("mongodb://idle")
+    monkeypatch.setattr(vector_store_module, "MONGO_CLIENT_IDLE_TTL_SECONDS", -1)
+    active = vector_store_module.get_mongo_client("mongodb://active")
+
+    assert idle.closed and not active.closed
+    assert vector_store_module.get_mongo_client("mongodb://idle") is not idle
+
+
+def test_index_poll_creates_missing_index_and_caches_readiness(vector_store_module, make_vector_store, mongo_client):
+    component = make_vector_store()
+    collection = mongo_client["chat"]["knowledge"]
+    listed = []
+    list_indexes = collection.list_search_indexes
+    collection.list_search_indexes = lambda *args: listed.append(args) or list_indexes(*args)
+
+    assert component._poll_search_index(collection, "embedding")["status"] == "building"
+    assert [index["name"] for index in collection.search_indexes] == ["vector_index"]
+    # O próximo poll ainda não venceu: nenhum round trip
+    assert component._poll_search_index(collection, "embedding")["status"] == "building"
+    assert len(listed) == 1
+
+    registry = vector_store_module._shared_registry("search_indexes")
+    registry[component._index_key("knowledge")]["next_poll"] = 0
+    assert component.verify_search_index(collection) == "ready"
+    assert component.verify_search_index(collection) == "ready"
+    assert len(listed) == 2
+
+
+def test_index_poll_backs_off_while_building(vector_store_module, make_vector_store, mongo_client, monkeypatch):
+    component = make_vector_store(index_ready_timeout_seconds=0)
+    collection = mongo_client["chat"]["knowledge"]
+    collection.search_indexes.append({"name": "vector_index", "type": "vectorSearch", "status": "BUILDING", "queryable": False})
+    monkeypatch.setattr(vector_store_module, "INDEX_POLL_MAX_SECONDS", 3.0)
+    entry = vector_store_module._shared_registry("search_indexes").setdefault(component._index_key("knowledge"), {})
+
+    intervals = []
+    for _ in range(4):
+        entry["next_poll"] = 0
+        assert component.verify_search_index(collection) == "building"
+        intervals.append(entry["interval"])
+    assert intervals == [1.0, 2.0, 3.0, 3.0]
+
+
+def test_index_poll_rejects_failed_index(make_vector_store, mongo_client):
+    component = make_vector_store()
+    collection = mongo_client["chat"]["knowledge"]
+    collection.search_indexes.append({"name": "vector_index", "type": "vectorSearch", "status": "FAILED"})
+    with pytest.raises(ValueError, match="falhou"):
+        component._poll_search_index(collection, "embedding")
+
+
+def test_query_embedding_key_normalizes_spaces_but_keeps_case(vector_store_module):
+    make_key = vector_store_module.QueryEmbeddingCache.make_key
+    assert make_key("m", "política  de\ncrédito ") == make_key("m", "política de crédito")
+    assert make_key("m", "Crédito") != make_key("m", "crédito")
+    assert make_key("m", "crédito") != make_key("outro", "crédito")
+
+
+def test_query_embedding_cache_evicts_and_persists_in_sqlite(vector_store_module, tmp_path):
+    db_path = str(tmp_path / "embeddings.sqlite")
+    cache = vector_store_module.QueryEmbeddingCache(max_entries=1, db_path=db_path)
+    cache.set("a", [0.5, -1.25])
+    cache.set("b", [1.0, 2.0])
+    assert list(cache._memory) == ["b"]
+    # Fora da memória, a entrada volta do SQLite
+    assert cache.get("a") == [0.5, -1.25]
+    assert vector_store_module.QueryEmbeddingCache(max_entries=10, db_path=db_path).get("b") == [1.0, 2.0]
+
+
+def test_concurrent_requests_share_one_embedding_call(vector_store_module):
+    cache = vector_store_module.QueryEmbeddingCache()
+    started, release, waiting = threading.Event(), threading.Event(), threading.Event()
+    calls = []
+
+    class InflightRequests(dict):
+        def get(self, key, default=None):
+            # Chamado pelo segundo pedido ao encontrar o cálculo em andamento
+            if key in self:
+                waiting.set()
+            return super().get(key, default)
+
+    cache._inflight = InflightRequests()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [1.0, 0.0]
+
+    results = {}
+    owner = threading.Thread(target=lambda: results.update(owner=cache.get_or_compute("k", compute)))
+    owner.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: results.update(waiter=cache.get_or_compute("k", compute)))
+    waiter.start()
+    waiting.wait(5)
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+
+    assert len(calls) == 1
+    assert results == {"owner": ([1.0, 0.0], "miss"), "waiter": ([1.0, 0.0], "shared")}
+    assert cache.get_or_compute("k", compute) == ([1.0, 0.0], "hit")
+
+
+def test_concurrent_async_requests_share_one_embedding_call(vector_store_module):
+    cache = vector_store_module.QueryEmbeddingCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [0.0, 1.0]
+
+    async def run():
+        return await asyncio.gather(cache.aget_or_compute("k", compute), cache.aget_or_compute("k", compute))
+
+    assert sorted(origin for _, origin in asyncio.run(run())) == ["miss", "shared"]
+    assert len(calls) == 1
+
+
+def test_cached_query_embeddings_batches_only_missing_queries(vector_store_module):
+    class CountingEmbeddings(FakeEmbeddings):
+        def __init__(self):
+            self.batches = []
+
+        def embed_documents(self, texts):
+            self.batches.append(list(texts))
+            return super().embed_documents(texts)
+
+    model = CountingEmbeddings()
+    cached = vector_store_module.CachedQueryEmbeddings(model, vector_store_module.QueryEmbeddingCache(), "fake|2")
+    first = cached.embed_query("crédito")
+    vectors = cached.embed_queries(["crédito", "risco", "varejo"])
+
+    assert vectors[0] == first
+    assert model.batches == [["risco", "varejo"]]
+    assert cached.stats == {"hit": 1, "shared": 0, "miss": 3}
+
+
+class RecordingEmbeddings(FakeEmbeddings):
+    def __init__(self, fail_on=None):
+        self.embedded = []
+        self.fail_on = fail_on
+
+    def embed_documents(self, texts):
+        if self.fail_on in texts:
+            raise ConnectionError("limite de requisições")
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def test_ingestion_writes_in_batches_and_completes_the_checkpoint(vector_store_module, make_vector_store, mongo_client):
+    embedding = RecordingEmbeddings()
+    component = make_vector_store(
+        embedding=embedding,
+        ingest_batch_size=2,
+        ingest_max_concurrency=2,
+        ingest_data=documents(vector_store_module, *[f"doc {n}" for n in range(5)]),
+    )
+    component.build_vector_store()
+
+    collection = mongo_client["chat"]["knowledge"]
+    assert sorted(doc["text"] for doc in collection.docs) == [f"doc {n}" for n in range(5)]
+    assert all(doc["embedding"] == [5.0, 1.0] for doc in collection.docs)
+    checkpoint = mongo_client["chat"]["_ingest_checkpoints"].find_one({"_id": "knowledge"})
+    assert (checkpoint["status"], checkpoint["documents_written"], checkpoint["batches_completed"]) == ("completed", 5, 3)
+    assert "3 lote(s)" in component.status
+
+
+def test_interrupted_ingestion_resumes_without_embedding_written_documents(
+    vector_store_module, make_vector_store, mongo_client
+):
+    texts = [f"doc {n}" for n in range(5)]
+    failing = make_vector_store(
+        embedding=RecordingEmbeddings(fail_on="doc 4"),
+        ingest_batch_size=2,
+        ingest_max_concurrency=1,
+        ingest_data=documents(vector_store_module, *texts),
+    )
+    with pytest.raises(ConnectionError):
+        failing.build_vector_store()
+    checkpoints = mongo_client["chat"]["_ingest_checkpoints"]
+    assert checkpoints.find_one({"_id": "knowledge"})["status"] == "running"
+
+    embedding = RecordingEmbeddings()
+    resumed = make_vector_store(
+        embedding=embedding, ingest_batch_size=2, ingest_max_concurrency=1, ingest_data=documents(vector_store_module, *texts)
+    )
+    resumed.build_vector_store()
+
+    assert embedding.embedded == ["doc 4"]
+    assert len(mongo_client["chat"]["knowledge"].docs) == 5
+    assert checkpoints.find_one({"_id": "knowledge"})["status"] == "completed"
+    assert resumed.status.endswith("(execução retomada).")
+    assert "4 já existente(s)" in resumed.status
+
+
+def vector_search_collection(vector_store_module, mongo_client, prefilter_indexed):
+    """Coleção em que só 1 de cada 4 candidatos passa no pós-filtro de setor."""
+    collection = mongo_client["chat"]["knowledge"]
+
+    def aggregate(pipeline, **kwargs):
+        collection.pipelines.append(pipeline)
+        stage = pipeline[0]["$vectorSearch"]
+        if "filter" in stage:
+            if not prefilter_indexed:
+                raise vector_store_module.OperationFailure("Path 'setores' needs to be indexed as filter")
+            return iter([{"_id": n, "score": 0.9} for n in range(stage["limit"])])
+        matched = [{"_id": n, "score": 0.9} for n in range(stage["limit"] // 4)]
+        return iter(matched[:pipeline[3]["$limit"]])
+
+    collection.aggregate = aggregate
+    return collection
+
+
+def run_vector_search(component, collection, k, plan):
+    steps = component._vector_search_steps(
+        [1.0, 0.0], k, {"setores": {"$in": ["Risco"]}}, "embedding", plan=plan, index_key=component._index_key("knowledge")
+    )
+    return component._run_vector_search_sync(collection, steps)
+
+
+def test_vector_search_uses_the_native_prefilter(vector_store_module, make_vector_store, mongo_client):
+    component = make_vector_store(num_candidates_multiplier=10)
+    collection = vector_search_collection(vector_store_module, mongo_client, prefilter_indexed=True)
+    plan = {}
+
+    assert len(run_vector_search(component, collection, 5, plan)) == 5
+    assert (plan["prefilter"], plan["attempts"], plan["num_candidates"]) == (True, 1, 50)
+    assert collection.pipelines[0][0]["$vectorSearch"]["filter"] == {"setores": {"$in": ["Risco"]}}
+
+
+def test_vector_search_escalates_the_post_filter_and_remembers_the_index(
+    vector_store_module, make_vector_store, mongo_client
+):
+    component = make_vector_store(num_candidates_multiplier=10, post_filter_budget_ms=60_000)
+    collection = vector_search_collection(vector_store_module, mongo_client, prefilter_indexed=False)
+    plan = {}
+
+    results = run_vector_search(component, collection, 5, plan)
+
+    assert len(results) == 5
+    # Pré-filtro recusado, depois limit 10 -> 20 até o pós-filtro devolver k resultados
+    assert [p[0]["$vectorSearch"]["limit"] for p in collection.pipelines] == [5, 10, 20]
+    assert (plan["prefilter"], plan["attempts"]) == (False, 2)
+    assert collection.pipelines[-1][2] == {"$match": {"setores": {"$in": ["Risco"]}}}
+
+    collection.pipelines.clear()
+    run_vector_search(component, collection, 5, {})
+    assert "filter" not in collection.pipelines[0][0]["$vectorSearch"]
+
+
+def test_vector_search_post_filter_stops_at_the_time_budget(vector_store_module, make_vector_store, mongo_client):
+    component = make_vector_store(num_candidates_multiplier=10, post_filter_budget_ms=0)
+    collection = vector_search_collection(vector_store_module, mongo_client, prefilter_indexed=False)
+    plan = {}
+
+    assert len(run_vector_search(component, collection, 5, plan)) == 2
+    assert plan["attempts"] == 1
+
+
+def test_pca_reduction_round_trips_through_the_projection_file(vector_store_module, tmp_path):
+    rng = np.random.default_rng(0)
+    # Amostra de posto 3 em 8 dimensões: 3 componentes explicam toda a variância
+    sample = rng.normal(size=(200, 3)) @ rng.normal(size=(3, 8)) + 0.5
+    reduction, cumulative = vector_store_module.fit_pca_reduction(sample, 3)
+    assert cumulative[2] == pytest.approx(1.0, abs=1e-4)
+
+    path = str(tmp_path / "pca_3.npz")
+    reduction.save(path, cumulative)
+    loaded = vector_store_module.load_dimension_reduction(path)
+
+    assert (loaded.method, loaded.dimensions, loaded.signature) == ("pca", 3, reduction.signature)
+    assert np.allclose(loaded.apply(sample[:5]), reduction.apply(sample[:5]), atol=1e-5)
+    assert np.allclose(np.linalg.norm(loaded.apply(sample[:5]), axis=1), 1.0, atol=1e-5)
+    # A PCA preserva os produtos internos entre vetores centrados quando explica toda a variância
+    centered = sample[:5] - reduction.mean
+    projected = loaded.apply(sample[:5], normalize=False)
+    assert np.allclose(projected @ projected.T, centered @ centered.T, rtol=1e-3, atol=1e-3)
+
+    with pytest.raises(ValueError, match="8 dimensões"):
+        loaded.apply(np.ones((1, 4)))
+
+
+def test_matryoshka_truncates_and_renormalizes(vector_store_module):
+    reduction = vector_store_module.DimensionReduction("matryoshka", 2)
+    assert np.allclose(reduction.apply([[3.0, 4.0, 12.0]]), [[0.6, 0.8]])
+    assert np.allclose(reduction.apply([[3.0, 4.0, 12.0]], normalize=False), [[3.0, 4.0]])
+    with pytest.raises(ValueError, match="truncados"):
+        reduction.apply([[1.0]])
+
+
+def test_component_reduces_documents_and_queries_the_same_way(vector_store_module, make_vector_store, tmp_path):
+    class WideEmbeddings:
+        def embed_documents(self, texts):
+            return [[3.0, 4.0, float(len(text))] for text in texts]
+
+        def embed_query(self, text):
+            return [3.0, 4.0, float(len(text))]
+
+    component = make_vector_store(embedding=WideEmbeddings(), dimension_reduction="matryoshka", number_dimensions=2)
+    model = component._embedding_model()
+    assert model is component._embedding_model()
+    assert np.allclose(model.embed_documents(["abc"]), [model.embed_query("abc")])
+    assert np.allclose(model.embed_query("abc"), [0.6, 0.8])
+
+    with pytest.raises(ValueError, match="arquivo de projeção"):
+        make_vector_store(dimension_reduction="pca", projection_path="")._embedding_model()
+
+    reduction, _ = vector_store_module.fit_pca_reduction(np.random.default_rng(1).normal(size=(20, 3)), 2)
+    path = str(tmp_path / "pca_2.npz")
+    reduction.save(path)
+    with pytest.raises(ValueError, match="2 dimensões"):
+        make_vector_store(dimension_reduction="pca", projection_path=path, number_dimensions=4)._embedding_model()